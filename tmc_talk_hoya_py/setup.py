@@ -49,6 +49,8 @@ setup(
     entry_points={
         'console_scripts': [
             'text_to_speech = tmc_talk_hoya_py.node:main',
+            'batch_render = tmc_talk_hoya_py.batch:main',
+            'audio_player = tmc_talk_hoya_py.player_node:main',
         ],
     },
 )
@@ -0,0 +1,95 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+u"""Frames/sec of VoiceText.to_buffer with copy.deepcopy and with a FramePool
+
+Run with: python3 test/benchmark_frame_pool.py [frames] [repeat]
+"""
+import copy
+import os
+import sys
+import time
+
+from unittest.mock import patch
+
+from tmc_talk_hoya_py import (
+    FramePool,
+    VoiceText
+)
+
+sys.path.insert(0, os.path.dirname(__file__))
+from test_voicetext import TextToBuffer  # noqa: E402
+
+
+def deepcopy_frames(vt, text):
+    for buf, _ in vt.to_buffer(text):
+        copy.deepcopy(buf)
+
+
+def pooled_frames(vt, text, pool):
+    for buf, _ in vt.to_buffer(text, pool=pool):
+        # The writer thread gives the buffer back after pa_simple_write
+        pool.release(buf)
+
+
+def measure(vt, run, frames, repeat):
+    best = None
+    for _ in range(repeat):
+        vt._libvt.VT_TextToBuffer = TextToBuffer()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return frames / best
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    text = u'a' * frames
+    license_path = os.path.join(os.path.dirname(__file__), 'license')
+    with patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary') as vtlib:
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer = TextToBuffer()
+        instance.language = 'eng'
+        vt = VoiceText(path=license_path, voice='bridget')
+    pool = FramePool(vt.frame_size)
+
+    deepcopy_rate = measure(vt, lambda: deepcopy_frames(vt, text), frames, repeat)
+    pooled_rate = measure(vt, lambda: pooled_frames(vt, text, pool), frames, repeat)
+    print('frame size: {0} bytes, frames: {1}'.format(vt.frame_size, frames))
+    print('deepcopy : {0:12.0f} frames/sec'.format(deepcopy_rate))
+    print('FramePool: {0:12.0f} frames/sec ({1:.1f}x)'.format(
+        pooled_rate, pooled_rate / deepcopy_rate))
+    print('pool size: {0}'.format(pool.size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,483 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+u"""Latency and throughput of the synthesis-to-playback pipeline
+
+By default VoiceText is replaced with a fake engine which synthesizes a frame
+of 0.1 seconds per character, so that no license is needed.  With --root-path
+a real libvt_*.so is loaded instead.  PulseAudio is always replaced with
+TimingSink, which plays at --speed times the real time.  The results are
+printed as JSON.
+
+Run with: python3 test/benchmark_pipeline.py [--output results.json]
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+from unittest.mock import patch
+
+from tmc_talk_hoya_py import (
+    find_voice,
+    VoiceTextSpeaker
+)
+from tmc_talk_hoya_py.scheduler import (
+    Utterance,
+    UtteranceScheduler
+)
+
+LICENSE_PATH = os.path.join(os.path.dirname(__file__), 'license')
+SENTENCE = u'The quick brown fox jumps over the lazy dog.'
+
+
+class FakeTextToBuffer(object):
+    u"""VoiceText Mock of TextToBuffer which takes synthesis_time per frame"""
+
+    def __init__(self, synthesis_time=0.0):
+        self._synthesis_time = synthesis_time
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def __call__(self, fmt, tts_text, output_buff, output_len, flag, nThreadID, *args):
+        # Always set 0.1 seconds
+        output_len._obj.value = 3200
+        if tts_text is None:
+            return 0
+        if len(tts_text) == 0:
+            return -4
+        if self._synthesis_time > 0.0:
+            time.sleep(self._synthesis_time)
+        with self._lock:
+            if flag == 0:
+                self._counts[nThreadID] = 0
+            self._counts[nThreadID] += 1
+            return 1 if self._counts[nThreadID] >= len(tts_text) else 0
+
+
+class TimingSink(object):
+    u"""Substitute of AudioOut which records when the audio is played
+
+    The sink buffers up to tlength bytes like PulseAudio and plays them at
+    speed times the real time.  A write blocks while the buffer is full.
+    """
+
+    realtime = True
+    # Written in blocks of the player, as PulseAudio
+    write_size = None
+
+    def __init__(self, latency=-1.0, tlength=-1, prebuf=-1, minreq=-1, speed=1.0):
+        if tlength < 0:
+            tlength = int(max(latency, 0.05) * 32000)
+        self._speed = speed
+        self._rate = 32000.0 * speed
+        self._capacity = tlength / self._rate
+        self._lock = threading.Lock()
+        # Wall clock time at which the buffered audio is played out
+        self._end = 0.0
+        self._written = 0
+        self.first_write = None
+        self.flushes = []
+
+    @property
+    def buffer_time(self):
+        return self._capacity * self._speed
+
+    @property
+    def written(self):
+        return self._written / 32000.0
+
+    @property
+    def silent_time(self):
+        u"""Wall clock time at which the sink becomes silent"""
+        with self._lock:
+            return self._end
+
+    def position(self):
+        return self.written - (self.latency() or 0.0)
+
+    def latency(self):
+        with self._lock:
+            return max(self._end - time.perf_counter(), 0.0) * self._speed
+
+    def drain(self):
+        time.sleep(max(self.silent_time - time.perf_counter(), 0.0))
+
+    def flush(self):
+        with self._lock:
+            now = time.perf_counter()
+            self._end = min(self._end, now)
+            self.flushes.append(now)
+
+    def write(self, buf):
+        with self._lock:
+            now = time.perf_counter()
+            self._end = max(self._end, now)
+            wait = self._end - now - self._capacity
+        if wait > 0.0:
+            time.sleep(wait)
+        with self._lock:
+            now = time.perf_counter()
+            if self.first_write is None:
+                self.first_write = now
+            self._end = max(self._end, now) + len(buf) / self._rate
+            self._written += len(buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return True
+
+
+class Sinks(object):
+    u"""Creates a TimingSink in place of every AudioOut"""
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.sinks = []
+
+    def __call__(self, **options):
+        sink = TimingSink(speed=self.speed, **options)
+        self.sinks.append(sink)
+        return sink
+
+    @property
+    def last(self):
+        return self.sinks[-1]
+
+
+class Voice(object):
+    u"""Minimum substitute of tmc_voice_msgs.msg.Voice"""
+
+    def __init__(self, sentence):
+        self.sentence = sentence
+        self.interrupting = False
+        self.queueing = False
+
+
+@contextlib.contextmanager
+def engine(args, sinks):
+    u"""Patch VoiceText with the fake engine unless --root-path is given"""
+    with patch('tmc_talk_hoya_py.voicetext.AudioOut', new=sinks):
+        if args.root_path is not None:
+            yield args.root_path, args.voice
+            return
+        with patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary') as vtlib:
+            instance = vtlib.return_value
+            instance.VT_LOADTTS.return_value = 0
+            instance.VT_TextToBuffer = FakeTextToBuffer(args.synthesis_time)
+            instance.language = 'eng'
+            yield LICENSE_PATH, 'bridget'
+
+
+@contextlib.contextmanager
+def speaker(args, speed=None):
+    sinks = Sinks(args.speed if speed is None else speed)
+    with engine(args, sinks) as (path, voice):
+        vt = VoiceTextSpeaker(path=path, voice=voice,
+                              audio_options={'latency': args.latency})
+        vt.__enter__()
+        try:
+            yield vt, sinks.last
+        finally:
+            vt.__exit__(None, None, None)
+
+
+def make_text(sentences):
+    return u' '.join([SENTENCE] * sentences)
+
+
+def frame_count(vt, playback):
+    return int(round(playback.duration * 32000 / vt.voice_text.frame_size))
+
+
+def summary(values):
+    return {'median': statistics.median(values), 'max': max(values)}
+
+
+def time_to_first_frame(args):
+    u"""Seconds from speak_stream to the first frame queued and written"""
+    results = []
+    for sentences in (1, args.sentences):
+        first_frame = []
+        first_write = []
+        for _ in range(args.repeat):
+            with speaker(args) as (vt, sink):
+                start = time.perf_counter()
+                playback = vt.speak_stream(make_text(sentences))
+                playback.first_frame.wait()
+                first_frame.append(time.perf_counter() - start)
+                while sink.first_write is None and not playback.synthesized.is_set():
+                    time.sleep(0.0005)
+                if sink.first_write is not None:
+                    first_write.append(sink.first_write - start)
+                vt.cancel()
+        results.append({'sentences': sentences,
+                        'first_frame': summary(first_frame),
+                        'first_write': summary(first_write) if first_write else None})
+    return results
+
+
+def throughput(args):
+    u"""Frames per second of synthesize and of the streaming synthesis"""
+    text = make_text(args.sentences)
+    synthesize = []
+    stream = []
+    for _ in range(args.repeat):
+        with speaker(args) as (vt, sink):
+            start = time.perf_counter()
+            frames = vt.synthesize(text)
+            synthesize.append(len(frames) / (time.perf_counter() - start))
+            start = time.perf_counter()
+            playback = vt.speak_stream(text)
+            playback.synthesized.wait()
+            elapsed = time.perf_counter() - start
+            stream.append(frame_count(vt, playback) / elapsed)
+            vt.cancel()
+    return {'frames': len(frames),
+            'audio_seconds': playback.duration,
+            'synthesize_frames_per_sec': summary(synthesize),
+            'stream_frames_per_sec': summary(stream)}
+
+
+def allocation(args):
+    u"""Bytes of Python heap per frame while a text is streamed"""
+    text = make_text(args.sentences)
+    with speaker(args) as (vt, sink):
+        # Warm up the frame pool and the caches of the interpreter
+        vt.speak_stream(make_text(1)).synthesized.wait()
+        vt.cancel()
+        tracemalloc.start()
+        try:
+            base, _ = tracemalloc.get_traced_memory()
+            playback = vt.speak_stream(text)
+            playback.synthesized.wait()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        frames = frame_count(vt, playback)
+        vt.cancel()
+        return {'frames': frames,
+                'frame_size': vt.voice_text.frame_size,
+                'peak_bytes_per_frame': (peak - base) / frames,
+                'retained_bytes_per_frame': (current - base) / frames,
+                'pooled_buffers': vt._pool.size}
+
+
+def queue_depth(args):
+    u"""Frames waiting for the writer thread while a text is played"""
+    text = make_text(args.sentences)
+    with speaker(args) as (vt, sink):
+        depths = []
+        playback = vt.speak_stream(text)
+        while not playback.drained.is_set():
+            depths.append(vt._player.queued)
+            time.sleep(0.001)
+    return {'samples': len(depths),
+            'mean': statistics.mean(depths) if depths else 0.0,
+            'peak': max(depths) if depths else 0}
+
+
+def cancel_to_silence(args):
+    u"""Seconds from cancel to the end of the audio, played in real time"""
+    text = make_text(args.sentences)
+    results = []
+    for _ in range(args.repeat):
+        with speaker(args, speed=1.0) as (vt, sink):
+            playback = vt.speak_stream(text)
+            playback.started.wait()
+            time.sleep(0.1)
+            start = time.perf_counter()
+            vt.cancel()
+            canceled = time.perf_counter() - start
+            # Let a frame being written reach the sink
+            time.sleep(0.05)
+            results.append((max(sink.silent_time - start, 0.0), canceled))
+    return {'silence': summary([r[0] for r in results]),
+            'cancel_call': summary([r[1] for r in results])}
+
+
+def request_to_feedback(args):
+    u"""Seconds from the submission of a request to its start and first progress"""
+    with speaker(args) as (vt, sink):
+        started = {}
+        progressed = {}
+
+        def play(utterance, on_event):
+            if utterance.frames is not None:
+                return vt.play(utterance.frames, on_event=on_event)
+            return vt.speak_stream(utterance.data.sentence, on_event=on_event)
+
+        scheduler = UtteranceScheduler(
+            lambda utterance: vt.synthesize(utterance.data.sentence),
+            play,
+            lambda utterance: vt.cancel(),
+            on_start=lambda utterance: started.setdefault(utterance, time.perf_counter()),
+            on_progress=lambda utterance: progressed.setdefault(utterance, time.perf_counter()))
+        start_latency = []
+        feedback_latency = []
+        for _ in range(args.repeat):
+            utterance = Utterance(Voice(make_text(args.sentences)))
+            start = time.perf_counter()
+            scheduler.submit(utterance)
+            while utterance not in progressed and not utterance.done.is_set():
+                time.sleep(0.0005)
+            if utterance in started:
+                start_latency.append(started[utterance] - start)
+            if utterance in progressed:
+                feedback_latency.append(progressed[utterance] - start)
+            scheduler.cancel(utterance)
+            utterance.done.wait()
+        scheduler.close()
+    return {'start': summary(start_latency) if start_latency else None,
+            'feedback': summary(feedback_latency) if feedback_latency else None,
+            'node': node_feedback_latency(args)}
+
+
+def node_feedback_latency(args):
+    u"""Seconds from sending a goal to the node to its first feedback
+
+    Needs rclpy and tmc_voice_msgs, otherwise None is returned.
+    """
+    try:
+        import rclpy
+        from rclpy.action import ActionClient
+        from rclpy.executors import MultiThreadedExecutor
+        from tmc_voice_msgs.action import TalkRequest
+        from tmc_voice_msgs.msg import Voice as VoiceMsg
+
+        from tmc_talk_hoya_py.node import VoiceTextNode
+    except ImportError:
+        return None
+    sinks = Sinks(args.speed)
+    with engine(args, sinks) as (path, voice):
+        # The node looks for the voices in <root_path>/vt
+        root_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_root')
+        if not os.path.isdir(root_path):
+            os.mkdir(root_path)
+        link = os.path.join(root_path, 'vt')
+        if os.path.islink(link):
+            os.remove(link)
+        os.symlink(os.path.abspath(path), link)
+        rclpy.init(args=['--ros-args',
+                         '-p', 'root_path:=' + root_path,
+                         '-p', 'eng_voice:=[' + voice + ']',
+                         '-p', 'audio_latency:=' + str(args.latency)])
+        try:
+            with VoiceTextNode() as node:
+                client_node = rclpy.create_node('benchmark_pipeline')
+                client = ActionClient(client_node, TalkRequest, 'talk_request_action')
+                executor = MultiThreadedExecutor()
+                executor.add_node(node)
+                executor.add_node(client_node)
+                thread = threading.Thread(target=executor.spin)
+                thread.daemon = True
+                thread.start()
+                client.wait_for_server()
+                results = []
+                for _ in range(args.repeat):
+                    feedback = threading.Event()
+                    goal = TalkRequest.Goal()
+                    goal.data.language = VoiceMsg.ENGLISH
+                    goal.data.sentence = make_text(args.sentences)
+                    start = time.perf_counter()
+                    future = client.send_goal_async(
+                        goal, feedback_callback=lambda _: feedback.set())
+                    if feedback.wait(10.0):
+                        results.append(time.perf_counter() - start)
+                    while not future.done():
+                        time.sleep(0.001)
+                    future.result().cancel_goal_async()
+                executor.shutdown()
+                client_node.destroy_node()
+        finally:
+            rclpy.shutdown()
+            os.remove(link)
+            os.rmdir(root_path)
+    return summary(results) if results else None
+
+
+BENCHMARKS = [
+    ('time_to_first_frame', time_to_first_frame),
+    ('throughput', throughput),
+    ('allocation', allocation),
+    ('queue_depth', queue_depth),
+    ('cancel_to_silence', cancel_to_silence),
+    ('request_to_feedback', request_to_feedback),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', help='JSON file, the standard output by default')
+    parser.add_argument('--root-path', help='Directory of the real voices, e.g. /opt/tmc/vt')
+    parser.add_argument('--voice', default='julie', help='Real voice with --root-path')
+    parser.add_argument('--sentences', type=int, default=20, help='Sentences of the long text')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--speed', type=float, default=20.0,
+                        help='Playback speed of the sink relative to the real time')
+    parser.add_argument('--latency', type=float, default=0.05, help='Target latency of the sink')
+    parser.add_argument('--synthesis-time', type=float, default=0.0005,
+                        help='Seconds per frame of the fake engine')
+    parser.add_argument('--only', action='append', choices=[name for name, _ in BENCHMARKS])
+    args = parser.parse_args(argv)
+    if args.root_path is not None:
+        # Fail early rather than in every benchmark
+        find_voice(args.root_path, args.voice)
+
+    results = {}
+    for name, benchmark in BENCHMARKS:
+        if args.only is None or name in args.only:
+            results[name] = benchmark(args)
+    report = {
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'engine': 'fake' if args.root_path is None else 'libvt',
+        'voice': 'bridget' if args.root_path is None else args.voice,
+        'options': vars(args),
+        'results': results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
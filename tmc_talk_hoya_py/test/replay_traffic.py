@@ -0,0 +1,237 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+u"""Replay a capture of talk requests on a VoiceTextNode without hardware
+
+The requests recorded with the capture_path parameter of the node are sent
+again at --speed times their original pace: the messages of the topic
+through the subscriber callback, the goals through an action client.  As
+in benchmark_pipeline.py, VoiceText is replaced with the fake engine unless
+--root-path is given, and the audio goes to a TimingSink which plays at
+--speed times the real time.  The latency and the outcome of every request
+are printed as JSON, with the counts of the outcomes.
+
+Run with: python3 test/replay_traffic.py capture.jsonl [--speed 4] [--output results.json]
+"""
+import argparse
+import collections
+import contextlib
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import rclpy
+from rclpy.action import ActionClient
+from rclpy.executors import MultiThreadedExecutor
+from tmc_voice_msgs.action import TalkRequest
+from tmc_voice_msgs.msg import Voice
+from unique_identifier_msgs.msg import UUID
+
+from benchmark_pipeline import (
+    engine,
+    Sinks,
+    summary
+)
+from tmc_talk_hoya_py.capture import (
+    ACTION,
+    dict_to_voice,
+    read_traffic
+)
+from tmc_talk_hoya_py.metrics import Trace
+from tmc_talk_hoya_py.node import VoiceTextNode
+from tmc_talk_hoya_py.scheduler import Utterance
+
+STATES = {
+    Utterance.SUCCEEDED: 'succeeded',
+    Utterance.CANCELED: 'canceled',
+    Utterance.PREEMPTED: 'preempted',
+    Utterance.DROPPED: 'dropped',
+    Utterance.ABORTED: 'aborted',
+}
+
+
+@contextlib.contextmanager
+def voice_root(path):
+    u"""Temporary root_path of the node whose vt directory is path"""
+    root_path = tempfile.mkdtemp()
+    link = os.path.join(root_path, 'vt')
+    os.symlink(os.path.abspath(path), link)
+    try:
+        yield root_path
+    finally:
+        os.remove(link)
+        os.rmdir(root_path)
+
+
+class Outcomes(object):
+    u"""Collects the utterances finished by the node, by request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self.results = {}
+
+    def add(self, key, utterance):
+        trace = utterance.trace
+        result = {
+            'state': STATES.get(utterance.state, str(utterance.state)),
+            'priority': utterance.priority,
+            'queueing_delay': utterance.queueing_delay,
+            'first_sound': None if trace is None else trace.interval(Trace.RECEIVED, Trace.WRITTEN),
+            'total': None if trace is None else trace.interval(Trace.RECEIVED, Trace.DRAINED),
+        }
+        with self._finished:
+            self.results[key] = result
+            self._finished.notify_all()
+
+    def wait(self, count, timeout):
+        with self._finished:
+            return self._finished.wait_for(lambda: len(self.results) >= count, timeout)
+
+
+def replay(args, entries):
+    outcomes = Outcomes()
+    sinks = Sinks(args.speed)
+    with engine(args, sinks) as (path, voice), voice_root(path) as root_path:
+        rclpy.init(args=['--ros-args',
+                         '-p', 'root_path:=' + root_path,
+                         '-p', 'jpn_voice:=[' + voice + ']',
+                         '-p', 'eng_voice:=[' + voice + ']',
+                         '-p', 'audio_latency:=' + str(args.latency),
+                         '-p', 'metrics_period:=1.0'])
+        try:
+            with VoiceTextNode() as node:
+                keys = {}
+                on_finish = node._on_finish
+
+                def record_finish(utterance):
+                    on_finish(utterance)
+                    if utterance.goal_handle is not None:
+                        key = bytes(utterance.goal_handle.goal_id.uuid)
+                    else:
+                        key = id(utterance.data)
+                    if key in keys:
+                        outcomes.add(keys[key], utterance)
+
+                # The scheduler holds the bound method
+                node._scheduler._on_finish = record_finish
+                client_node = rclpy.create_node('replay_traffic')
+                client = ActionClient(client_node, TalkRequest, 'talk_request_action')
+                executor = MultiThreadedExecutor()
+                executor.add_node(node)
+                executor.add_node(client_node)
+                thread = threading.Thread(target=executor.spin)
+                thread.daemon = True
+                thread.start()
+                client.wait_for_server()
+
+                messages = []
+                start = time.monotonic()
+                for index, entry in enumerate(entries):
+                    data = dict_to_voice(entry['data'], Voice)
+                    # Deadlines scale with the pace of the replay
+                    nanoseconds = (data.deadline.sec * 1000000000 + data.deadline.nanosec) / args.speed
+                    data.deadline.sec, data.deadline.nanosec = divmod(int(nanoseconds), 1000000000)
+                    time.sleep(max(start + entry['time'] / args.speed - time.monotonic(), 0.0))
+                    if entry['kind'] == ACTION:
+                        goal_id = uuid.uuid4().bytes
+                        keys[goal_id] = index
+                        client.send_goal_async(TalkRequest.Goal(data=data),
+                                               goal_uuid=UUID(uuid=list(goal_id)))
+                    else:
+                        # Kept alive, their ids are the keys
+                        messages.append(data)
+                        keys[id(data)] = index
+                        node._subscriber_callback(data)
+                completed = outcomes.wait(len(entries), args.timeout)
+                elapsed = time.monotonic() - start
+                metrics = None if node._metrics is None else node._metrics.summary()
+                executor.shutdown()
+                client_node.destroy_node()
+        finally:
+            rclpy.shutdown()
+    return outcomes.results, completed, elapsed, metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('capture', help='File written by the capture_path parameter of the node')
+    parser.add_argument('--output', help='JSON file, the standard output by default')
+    parser.add_argument('--root-path', help='Directory of the real voices, e.g. /opt/tmc/vt')
+    parser.add_argument('--voice', default='julie', help='Real voice with --root-path')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Pace of the requests and of the sink relative to the capture')
+    parser.add_argument('--latency', type=float, default=0.05, help='Target latency of the sink')
+    parser.add_argument('--synthesis-time', type=float, default=0.0005,
+                        help='Seconds per frame of the fake engine')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='Seconds to wait for the requests after the last one is sent')
+    args = parser.parse_args(argv)
+
+    entries = read_traffic(args.capture)
+    results, completed, elapsed, metrics = replay(args, entries)
+    requests = []
+    for index, entry in enumerate(entries):
+        request = {'time': entry['time'], 'kind': entry['kind'],
+                   'sentence': entry['data'].get('sentence', '')}
+        request.update(results.get(index, {'state': 'unfinished'}))
+        requests.append(request)
+    delays = collections.defaultdict(list)
+    for request in requests:
+        if request.get('queueing_delay') is not None:
+            delays[request['priority']].append(request['queueing_delay'])
+    first_sounds = [request['first_sound'] for request in requests
+                    if request.get('first_sound') is not None]
+    report = {
+        'date': datetime.datetime.now().isoformat(),
+        'engine': 'fake' if args.root_path is None else 'libvt',
+        'options': vars(args),
+        'completed': completed,
+        'elapsed': elapsed,
+        'outcomes': dict(collections.Counter(request['state'] for request in requests)),
+        'first_sound': summary(first_sounds) if first_sounds else None,
+        'queueing_delay': {str(priority): summary(values) for priority, values in sorted(delays.items())},
+        'metrics': metrics,
+        'requests': requests,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+import array
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import wave
+
+from tmc_talk_hoya_py import codec
+from tmc_talk_hoya_py import (
+    FileDescriptorOut,
+    FileOut,
+    NullOut,
+    open_audio_out,
+    TopicOut
+)
+
+
+class TestAudioBackends(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_wav_file(self):
+        u"""Is the audio written to a 16kHz mono WAV file?"""
+        path = os.path.join(self.path, 'out.wav')
+        with open_audio_out(backend='file', path=path) as out:
+            out.write(b'\x01\x00' * 1600)
+            out.write(memoryview(bytearray(3200)))
+        self.assertFalse(out.realtime)
+        self.assertAlmostEqual(out.written, 0.2)
+        with wave.open(path) as wav:
+            self.assertEqual(wav.getframerate(), 16000)
+            self.assertEqual(wav.getnchannels(), 1)
+            self.assertEqual(wav.getnframes(), 3200)
+
+    def test_raw_file(self):
+        u"""Is the audio written as is to a raw file?"""
+        path = os.path.join(self.path, 'out.pcm')
+        with FileOut(path) as out:
+            out.write(b'\x01\x02')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'\x01\x02')
+
+    def test_pipe(self):
+        u"""Is the latency of a pipe estimated from the time of the writes?"""
+        read_fd, write_fd = os.pipe()
+        try:
+            out = FileDescriptorOut(fd=write_fd, latency=0.1)
+            out.write(b'\x00' * 3200)
+            self.assertEqual(os.read(read_fd, 4000), b'\x00' * 3200)
+            self.assertAlmostEqual(out.latency(), 0.1, places=2)
+            self.assertAlmostEqual(out.buffer_time, 0.1)
+            out.flush()
+            self.assertEqual(out.latency(), 0.0)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def test_unknown_delay(self):
+        u"""Is the latency unknown when the device fails to report its delay?"""
+        read_fd, write_fd = os.pipe()
+        try:
+            out = FileDescriptorOut(fd=write_fd)
+            # A pipe rejects the ioctls of OSS
+            out._oss = True
+            self.assertIsNone(out.latency())
+            self.assertIsNone(out.position())
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def test_samples_in_bytes(self):
+        u"""Are arrays of int16 samples counted in bytes?"""
+        read_fd, write_fd = os.pipe()
+        try:
+            outs = [FileDescriptorOut(fd=write_fd), FileOut(os.path.join(self.path, 'out.pcm')),
+                    NullOut(latency=0.05, realtime=True)]
+            for out in outs:
+                out.write(array.array('h', [1] * 1600))
+            self.assertEqual(os.read(read_fd, 4000), b'\x01\x00' * 1600)
+            self.assertEqual([out.written for out in outs], [0.1] * 3)
+            self.assertAlmostEqual(outs[0].latency(), 0.1, places=2)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def test_null_realtime(self):
+        u"""Does a realtime null output block while its buffer is full?"""
+        out = NullOut(latency=0.05, realtime=True)
+        start = time.monotonic()
+        for _ in range(3):
+            out.write(b'\x00' * 3200)
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertGreater(out.latency(), 0.0)
+        out.flush()
+        self.assertEqual(out.position(), 0.3)
+
+    def test_null(self):
+        u"""Does a null output discard the audio immediately?"""
+        out = NullOut()
+        out.write(b'\x00' * 32000)
+        self.assertEqual(out.latency(), 0.0)
+        self.assertEqual(out.buffer_time, 0.0)
+
+    def test_topic(self):
+        u"""Is the audio published in numbered chunks of whole samples?"""
+        chunks = []
+        out = TopicOut(lambda seq, data, flush: chunks.append((seq, bytes(data), flush)),
+                       chunk_size=1001, latency=1.0)
+        self.assertEqual(out.chunk_size, 1000)
+        self.assertEqual(out.write_size, 1000)
+        out.write(b'\x01' * 2500)
+        out.flush()
+        self.assertEqual([(seq, len(data), flush) for seq, data, flush in chunks],
+                         [(0, 1000, False), (1, 1000, False), (2, 500, False), (3, 0, True)])
+        self.assertEqual(out.latency(), 0.0)
+
+    def test_topic_in_adpcm(self):
+        u"""Is every ADPCM chunk of the topic decoded on its own?"""
+        chunks = []
+        out = TopicOut(lambda seq, data, flush: chunks.append(bytes(data)),
+                       chunk_size=1000, latency=1.0, encoding=codec.ENCODING_IMA_ADPCM)
+        pcm = bytes(range(256)) * 12
+        out.write(pcm)
+        self.assertEqual([len(chunk) for chunk in chunks], [254, 254, 254, 22])
+        decoded = [codec.Decoder(codec.ENCODING_IMA_ADPCM).decode_chunk(chunk) for chunk in chunks]
+        self.assertEqual(b''.join(decoded), codec.decode(
+            codec.encode(pcm, codec.ENCODING_IMA_ADPCM), codec.ENCODING_IMA_ADPCM))
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, lambda: open_audio_out(backend='jack'))
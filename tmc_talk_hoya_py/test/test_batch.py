@@ -0,0 +1,152 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from tmc_talk_hoya_py.batch import (
+    content_hash,
+    FORMATS,
+    load_manifest,
+    main,
+    make_job,
+    render
+)
+from tmc_talk_hoya_py.voicetext import VoiceText
+
+
+def text_to_file(fmt, tts_text, filename, *args):
+    u"""VoiceText Mock of TextToFile which writes the text"""
+    if len(tts_text) == 0:
+        return -4
+    with open(filename, 'wb') as f:
+        f.write(tts_text)
+    return 1
+
+
+class TestBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.test_path = os.path.join(os.path.dirname(__file__), 'license')
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_formats(self):
+        u"""Are all of the file formats of VoiceText available?"""
+        self.assertEqual(FORMATS['s16pcm_wave'], VoiceText.VT_FILE_API_FMT_S16PCM_WAVE)
+        self.assertEqual(FORMATS['dadpcm'], VoiceText.VT_FILE_API_FMT_DADPCM)
+        self.assertEqual(len(FORMATS), 9)
+        self.assertRaises(ValueError, lambda: make_job(u"test", format='mp3'))
+
+    def test_load_manifest(self):
+        u"""Are JSONL and CSV manifests read with default values?"""
+        jsonl = os.path.join(self.output_dir, 'manifest.jsonl')
+        with open(jsonl, 'w') as f:
+            f.write(json.dumps({'sentence': u"こんにちは", 'output': 'hello.wav'}) + '\n\n')
+            f.write(json.dumps({'sentence': u"hello", 'voice': 'julie', 'format': 'mulaw', 'pitch': 120}) + '\n')
+        csv = os.path.join(self.output_dir, 'manifest.csv')
+        with open(csv, 'w') as f:
+            f.write('sentence,voice,output,format,pitch,speed,volume,pause\n')
+            f.write(u'hello,julie,,mulaw,120,,,\n')
+        jobs = load_manifest(jsonl)
+        self.assertEqual(jobs[0], make_job(u"こんにちは", output='hello.wav'))
+        self.assertEqual(jobs[1].format, VoiceText.VT_FILE_API_FMT_MULAW)
+        self.assertEqual(jobs[1].output, content_hash(jobs[1]) + '.ulaw')
+        self.assertEqual(load_manifest(csv), jobs[1:])
+
+    def test_invalid_rows(self):
+        u"""Are invalid rows reported with their line number and the others read?"""
+        jsonl = os.path.join(self.output_dir, 'manifest.jsonl')
+        with open(jsonl, 'w') as f:
+            f.write(json.dumps({'sentence': u"hello", 'output': 'a.wav'}) + '\n\n')
+            f.write(json.dumps({'sentence': u"hello", 'language': 'en'}) + '\n')
+            f.write(json.dumps({'sentence': u"hello", 'format': 'mp3'}) + '\n')
+            f.write('{"sentence": \n')
+            f.write(json.dumps({'sentence': u"world", 'output': 'b.wav'}) + '\n')
+        csv = os.path.join(self.output_dir, 'manifest.csv')
+        with open(csv, 'w') as f:
+            f.write('sentence,output,pitch\n')
+            f.write('hello,a.wav,high\n')
+            f.write('world,b.wav,,extra\n')
+            f.write('again,c.wav,\n')
+        errors = []
+        jobs = load_manifest(jsonl, on_error=lambda line, message: errors.append(line))
+        self.assertEqual([job.output for job in jobs], ['a.wav', 'b.wav'])
+        self.assertEqual(errors, [3, 4, 5])
+        errors = []
+        jobs = load_manifest(csv, on_error=lambda line, message: errors.append((line, message)))
+        self.assertEqual([job.output for job in jobs], ['c.wav'])
+        self.assertEqual([line for line, _ in errors], [2, 3])
+        self.assertIn('Unknown field None', errors[1][1])
+        self.assertRaisesRegex(ValueError, 'manifest.csv:2:', lambda: load_manifest(csv))
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    def test_main_with_invalid_rows(self, vtlib):
+        u"""Are the valid rows rendered and the invalid ones counted as failed?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToFile.side_effect = text_to_file
+        jsonl = os.path.join(self.output_dir, 'manifest.jsonl')
+        with open(jsonl, 'w') as f:
+            f.write(json.dumps({'sentence': u"hello", 'voice': 'bridget', 'output': 'a.wav'}) + '\n')
+            f.write(json.dumps({'sentence': u"hello", 'volume': 'loud'}) + '\n')
+        with patch('sys.stderr'), patch('builtins.print') as output:
+            status = main([jsonl, '-o', self.output_dir, '--path', self.test_path, '-j', '0'])
+        self.assertEqual(status, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'a.wav')))
+        self.assertIn('rendered 1, skipped 0, failed 1', output.call_args_list[-1][0][0])
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    def test_render(self, vtlib):
+        u"""Are up-to-date outputs skipped and changed ones rendered again?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToFile.side_effect = text_to_file
+        jobs = [make_job(u"hello", voice='bridget', output='a.wav'),
+                make_job(u"world", voice='bridget', output='sub/b.wav'),
+                make_job(u"", voice='bridget', output='c.wav')]
+        stats = render(jobs, output_dir=self.output_dir, path=self.test_path, processes=0)
+        self.assertEqual((stats['rendered'], stats['skipped'], stats['failed']), (2, 0, 1))
+        with open(os.path.join(self.output_dir, 'sub', 'b.wav'), 'rb') as f:
+            self.assertEqual(f.read(), b'world')
+        jobs[1] = jobs[1]._replace(pitch=120)
+        stats = render(jobs, output_dir=self.output_dir, path=self.test_path, processes=0)
+        self.assertEqual((stats['rendered'], stats['skipped'], stats['failed']), (1, 1, 1))
+        # The voice is loaded once per process
+        self.assertEqual(vtlib.call_count, 2)
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ['a.wav', 'a.wav.sha1', 'sub'])
@@ -0,0 +1,110 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from tmc_talk_hoya_py.capture import (
+    ACTION,
+    dict_to_voice,
+    read_traffic,
+    TOPIC,
+    TrafficRecorder
+)
+
+
+class Duration(object):
+    u"""Minimum substitute of builtin_interfaces.msg.Duration"""
+
+    def __init__(self, sec=0, nanosec=0):
+        self.sec = sec
+        self.nanosec = nanosec
+
+
+class Voice(object):
+    u"""Minimum substitute of tmc_voice_msgs.msg.Voice"""
+
+    def __init__(self, sentence=u'', priority=0, deadline=None):
+        self.sentence = sentence
+        self.language = 1
+        self.interrupting = False
+        self.queueing = True
+        self.priority = priority
+        self.deadline = Duration() if deadline is None else deadline
+        self.pitch = -1
+        self.speed = 120
+        self.volume = -1
+        self.pause = -1
+
+
+class TestTrafficRecorder(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def record(self, name):
+        path = os.path.join(self.path, name)
+        with TrafficRecorder(path) as recorder:
+            recorder.record(TOPIC, Voice(u'こんにちは'))
+            recorder.record(ACTION, Voice(u'Stop.', priority=2, deadline=Duration(1, 500000000)))
+            self.assertEqual(recorder.count, 2)
+        # Ignored once closed
+        recorder.record(TOPIC, Voice(u'late'))
+        return read_traffic(path)
+
+    def test_round_trip(self):
+        u"""Are the requests read back in order with all of their fields?"""
+        entries = self.record('capture.jsonl')
+        self.assertEqual([entry['kind'] for entry in entries], [TOPIC, ACTION])
+        self.assertLessEqual(entries[0]['time'], entries[1]['time'])
+        self.assertEqual(entries[0]['data']['sentence'], u'こんにちは')
+        self.assertEqual(entries[0]['data']['speed'], 120)
+        data = dict_to_voice(entries[1]['data'], Voice)
+        self.assertEqual(data.sentence, u'Stop.')
+        self.assertEqual(data.priority, 2)
+        self.assertEqual((data.deadline.sec, data.deadline.nanosec), (1, 500000000))
+        self.assertTrue(data.queueing)
+
+    def test_compressed(self):
+        u"""Is a capture whose name ends with .gz compressed?"""
+        entries = self.record('capture.jsonl.gz')
+        with open(os.path.join(self.path, 'capture.jsonl.gz'), 'rb') as f:
+            self.assertEqual(f.read(2), b'\x1f\x8b')
+        self.assertEqual(len(entries), 2)
+
+    def test_missing_fields(self):
+        u"""Do the fields missing from older captures keep their defaults?"""
+        data = dict_to_voice({'sentence': u'hello'}, Voice)
+        self.assertEqual(data.sentence, u'hello')
+        self.assertEqual(data.priority, 0)
+        self.assertEqual(data.speed, 120)
@@ -0,0 +1,106 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+from unittest.mock import patch
+
+import numpy
+
+from tmc_talk_hoya_py import codec
+
+
+def sine(samples):
+    u"""A 160Hz tone with noise as S16LE"""
+    rng = numpy.random.default_rng(0)
+    wave = numpy.sin(numpy.arange(samples) * 2 * numpy.pi / 100) * 10000
+    return (wave + rng.normal(0, 300, samples)).astype('<i2').tobytes()
+
+
+class TestCodec(unittest.TestCase):
+    def test_g711(self):
+        u"""Do A-law and mu-law halve the size within the quantization error?"""
+        pcm = sine(1600)
+        samples = numpy.frombuffer(pcm, dtype='<i2')
+        for encoding in (codec.ENCODING_ALAW, codec.ENCODING_MULAW):
+            data = codec.encode(pcm, encoding)
+            self.assertEqual(len(data), len(pcm) // 2)
+            decoded = numpy.frombuffer(codec.decode(data, encoding), dtype='<i2')
+            error = numpy.abs(decoded.astype(int) - samples)
+            # 4 bits of mantissa
+            self.assertTrue(numpy.all(error <= numpy.abs(samples) / 16 + 16))
+
+    def test_g711_silence(self):
+        u"""Is the silence encoded to the G.711 codes of zero?"""
+        self.assertEqual(codec.encode(b'\x00\x00', codec.ENCODING_ALAW), b'\xd5')
+        self.assertEqual(codec.encode(b'\x00\x00', codec.ENCODING_MULAW), b'\xff')
+
+    def test_adpcm_stream(self):
+        u"""Is a stream of frames with odd samples encoded as a whole?"""
+        pcm = sine(1601)
+        encoder = codec.Encoder(codec.ENCODING_IMA_ADPCM)
+        data = encoder.encode(pcm[:1002]) + encoder.encode(pcm[1002:]) + encoder.flush()
+        self.assertEqual(data, codec.encode(pcm, codec.ENCODING_IMA_ADPCM))
+        self.assertEqual(len(data), 801)
+        decoder = codec.Decoder(codec.ENCODING_IMA_ADPCM)
+        decoded = decoder.decode(data[:400]) + decoder.decode(data[400:])
+        self.assertEqual(len(decoded), 3204)
+        error = numpy.abs(numpy.frombuffer(decoded[:3202], dtype='<i2').astype(int)
+                          - numpy.frombuffer(pcm, dtype='<i2'))
+        self.assertLess(numpy.mean(error), 500)
+
+    def test_adpcm_chunks(self):
+        u"""Is an ADPCM chunk decoded as in the stream, even after a lost chunk?"""
+        pcm = sine(1600)
+        encoder = codec.Encoder(codec.ENCODING_IMA_ADPCM)
+        chunks = [encoder.encode_chunk(pcm[offset:offset + 800])
+                  for offset in range(0, len(pcm), 800)]
+        self.assertEqual([len(chunk) for chunk in chunks], [204] * 4)
+        stream = codec.Decoder(codec.ENCODING_IMA_ADPCM)
+        decoded = [stream.decode_chunk(chunk) for chunk in chunks]
+        self.assertEqual(b''.join(decoded), codec.decode(
+            b''.join(chunk[4:] for chunk in chunks), codec.ENCODING_IMA_ADPCM))
+        decoder = codec.Decoder(codec.ENCODING_IMA_ADPCM)
+        self.assertEqual(decoder.decode_chunk(chunks[0]), decoded[0])
+        # The second chunk is lost
+        self.assertEqual(decoder.decode_chunk(chunks[2]), decoded[2])
+        self.assertRaises(ValueError, lambda: decoder.decode_chunk(b'\x00'))
+
+    @unittest.skipIf(codec.audioop is None, 'audioop is not available')
+    def test_adpcm_without_audioop(self):
+        u"""Is the ADPCM of audioop reproduced without it?"""
+        pcm = sine(1600)
+        data = codec.encode(pcm, codec.ENCODING_IMA_ADPCM)
+        decoded = codec.decode(data, codec.ENCODING_IMA_ADPCM)
+        with patch.object(codec, 'audioop', None):
+            self.assertEqual(codec.encode(pcm, codec.ENCODING_IMA_ADPCM), data)
+            self.assertEqual(codec.decode(data, codec.ENCODING_IMA_ADPCM), decoded)
+
+    def test_unknown_encoding(self):
+        self.assertRaises(ValueError, lambda: codec.Encoder(4))
@@ -0,0 +1,172 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+import wave
+
+import numpy
+
+from unittest.mock import patch
+
+from tmc_talk_hoya_py import (
+    AudioPlayer,
+    Playback
+)
+from tmc_talk_hoya_py.dsp import (
+    AudioProcessor,
+    Resampler
+)
+import tmc_talk_hoya_py.pulse as pulse
+
+
+def sine(frequency, duration, rate=16000, amplitude=10000.0, delay=0.0):
+    t = numpy.arange(int(duration * rate)) / float(rate) - delay
+    return (amplitude * numpy.sin(2.0 * numpy.pi * frequency * t)).astype(numpy.float32)
+
+
+class TestResampler(unittest.TestCase):
+    def test_upsample(self):
+        u"""Is a sine resampled to 48kHz frame by frame without distortion?"""
+        resampler = Resampler(16000, 48000)
+        x = sine(1000, 1.0)
+        y = numpy.concatenate([resampler.process(x[offset:offset + 1600])
+                               for offset in range(0, len(x), 1600)])
+        self.assertEqual(len(y), 48000)
+        # The filter delays the signal by half of its 48 taps at 48kHz
+        expected = sine(1000, 1.0, 48000, delay=23.5 / 48000)
+        self.assertLess(numpy.abs(y - expected)[100:-100].max(), 100.0)
+
+    def test_fractional_rate(self):
+        u"""Is the number of samples right for a rate which is not a multiple?"""
+        resampler = Resampler(16000, 44100)
+        x = sine(440, 1.0)
+        lengths = [len(resampler.process(x[offset:offset + 1000]))
+                   for offset in range(0, len(x), 1000)]
+        self.assertEqual(sum(lengths), 44100)
+
+
+class TestAudioProcessor(unittest.TestCase):
+    def test_gain_in_place(self):
+        u"""Is the gain applied in place to a writable frame, and to a copy of a read only one?"""
+        processor = AudioProcessor(gain=0.5)
+        frame = bytearray(numpy.full(160, 1000, numpy.int16).tobytes())
+        self.assertIs(processor.process(frame), frame)
+        self.assertTrue((numpy.frombuffer(frame, numpy.int16) == 500).all())
+        data = numpy.full(160, 1000, numpy.int16).tobytes()
+        out = processor.process(data)
+        self.assertTrue((out == 500).all())
+        self.assertTrue((numpy.frombuffer(data, numpy.int16) == 1000).all())
+
+    def test_clipping(self):
+        processor = AudioProcessor(gain=4.0)
+        frame = bytearray(numpy.array([20000, -20000, 100], numpy.int16).tobytes())
+        processor.process(frame)
+        self.assertEqual(list(numpy.frombuffer(frame, numpy.int16)), [32767, -32768, 400])
+
+    def test_passthrough(self):
+        processor = AudioProcessor()
+        data = b'\x01\x02' * 160
+        self.assertIs(processor.process(data), data)
+
+    def test_fade_in(self):
+        u"""Does the first frame of a playback ramp up from silence?"""
+        processor = AudioProcessor(fade_time=0.005)
+        frame = bytearray(numpy.full(1600, 1000, numpy.int16).tobytes())
+        processor.process(frame, fade_in=True)
+        samples = numpy.frombuffer(frame, numpy.int16)
+        self.assertEqual(samples[0], 0)
+        self.assertTrue((numpy.diff(samples[:80]) >= 0).all())
+        self.assertTrue((samples[80:] == 1000).all())
+
+    def test_up_mix(self):
+        u"""Is a mono frame converted to interleaved 48kHz stereo?"""
+        processor = AudioProcessor(rate=48000, channels=2)
+        out = processor.process(sine(1000, 0.1).astype(numpy.int16).tobytes())
+        self.assertEqual(len(out), 4800 * 2)
+        self.assertTrue((out[0::2] == out[1::2]).all())
+
+    def test_fade_out(self):
+        u"""Does a cancel fade out from the position of the playback?"""
+        processor = AudioProcessor(fade_time=0.005, history_time=0.5)
+        processor.process(numpy.arange(1600, dtype=numpy.int16).tobytes())
+        tail = processor.fade_out(0.05)
+        self.assertEqual(len(tail), 80)
+        # 0.05 seconds before the end of the frame
+        self.assertEqual(tail[0], 800)
+        self.assertEqual(tail[-1], 0)
+        self.assertIsNone(processor.fade_out(None))
+        self.assertIsNone(AudioProcessor().fade_out(0.05))
+
+
+class TestAudioPlayer(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_native_format(self):
+        u"""Does the player write at the rate and the channels of the output?"""
+        path = os.path.join(self.path, 'out.wav')
+        with AudioPlayer({'backend': 'file', 'path': path, 'rate': 48000, 'channels': 2},
+                         gain=0.5) as player:
+            playback = Playback()
+            for _ in range(3):
+                playback.duration += 0.1
+                player.put(bytearray(3200), 0.1, playback)
+            playback.finish_synthesis()
+            drained = playback.drained.wait(1.0)
+        self.assertTrue(drained)
+        with wave.open(path) as wav:
+            self.assertEqual(wav.getframerate(), 48000)
+            self.assertEqual(wav.getnchannels(), 2)
+            self.assertEqual(wav.getnframes(), 3 * 4800)
+
+    @patch.object(pulse, 'pa_simple_free')
+    @patch.object(pulse, 'pa_simple_get_latency', return_value=0)
+    @patch.object(pulse, 'pa_simple_write')
+    @patch.object(pulse, 'pa_simple_new')
+    def test_processed_frames_in_bytes(self, pa_simple_new, pa_simple_write, *args):
+        u"""Are the int16 arrays of the processor written to PulseAudio in bytes?"""
+        for rate, size in ((16000, 3200), (48000, 9600)):
+            pa_simple_write.reset_mock()
+            with AudioPlayer({'latency': 0.05, 'rate': rate}, fade_time=0.005) as player:
+                playback = Playback()
+                playback.duration = 0.1
+                # A cached frame is read-only, so the fade-in makes a new array
+                player.put(bytes(3200), 0.1, playback)
+                playback.finish_synthesis()
+                drained = playback.drained.wait(1.0)
+                written = player._audio_out.written
+            self.assertTrue(drained)
+            self.assertEqual(sum(call[0][2] for call in pa_simple_write.call_args_list), size)
+            self.assertAlmostEqual(written, 0.1)
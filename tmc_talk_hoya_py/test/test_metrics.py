@@ -0,0 +1,93 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+from tmc_talk_hoya_py.metrics import (
+    LatencyHistogram,
+    LatencyMetrics,
+    Trace
+)
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_quantile(self):
+        u"""Are the quantiles the upper bounds of the buckets?"""
+        histogram = LatencyHistogram(bounds=(0.01, 0.1, 1.0))
+        for value in (0.005, 0.05, 0.05, 0.5, 5.0):
+            histogram.add(value)
+        self.assertEqual(histogram.buckets, [1, 2, 1, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.mean, 1.121)
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.8), 1.0)
+        self.assertEqual(histogram.quantile(1.0), 5.0)
+
+    def test_empty(self):
+        u"""Does an empty histogram report zeros?"""
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.mean, 0.0)
+        self.assertEqual(histogram.quantile(0.5), 0.0)
+
+
+class TestLatencyMetrics(unittest.TestCase):
+    def test_add(self):
+        u"""Are only the intervals between reached stages recorded?"""
+        trace = Trace()
+        trace.times = {Trace.RECEIVED: 1.0, Trace.ENCODED: 1.5, Trace.SYNTHESIZED: 1.75}
+        metrics = LatencyMetrics()
+        metrics.add(trace)
+        summary = metrics.summary()
+        self.assertEqual(summary['queueing']['count'], 1)
+        self.assertAlmostEqual(summary['queueing']['max'], 0.5)
+        self.assertAlmostEqual(summary['synthesis']['mean'], 0.25)
+        self.assertEqual(summary['total']['count'], 0)
+
+    def test_queueing_delay_by_priority(self):
+        u"""Is the delay until the start recorded for every priority?"""
+        metrics = LatencyMetrics()
+        for priority, started in ((2, 1.01), (0, 1.5), (0, 2.0)):
+            trace = Trace()
+            trace.times = {Trace.RECEIVED: 1.0, Trace.STARTED: started}
+            metrics.add(trace, priority)
+        metrics.add(Trace(), 2)
+        summary = metrics.summary()
+        self.assertEqual(summary['queueing_delay_priority_2']['count'], 1)
+        self.assertAlmostEqual(summary['queueing_delay_priority_2']['max'], 0.01)
+        self.assertAlmostEqual(summary['queueing_delay_priority_0']['mean'], 0.75)
+
+    def test_written(self):
+        u"""Is the first write kept and the last write updated?"""
+        trace = Trace()
+        trace.written()
+        first = trace.times[Trace.WRITTEN]
+        trace.written()
+        self.assertEqual(trace.times[Trace.WRITTEN], first)
+        self.assertGreaterEqual(trace.times[Trace.LAST_WRITTEN], first)
+        self.assertIsNone(trace.interval(Trace.WRITTEN, Trace.DRAINED))
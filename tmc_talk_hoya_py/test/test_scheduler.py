@@ -0,0 +1,410 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+
+from unittest.mock import patch
+
+from tmc_talk_hoya_py import (
+    AudioPlayer,
+    Playback
+)
+from tmc_talk_hoya_py.scheduler import (
+    Utterance,
+    UtteranceScheduler
+)
+
+
+# A mock of AudioOut is written in blocks of the AudioPlayer, as PulseAudio
+AUDIO_OUT = {'return_value.write_size': None}
+
+
+class Voice(object):
+    u"""Minimum substitute of tmc_voice_msgs.msg.Voice"""
+
+    def __init__(self, sentence, interrupting=False, queueing=False, priority=0):
+        self.sentence = sentence
+        self.interrupting = interrupting
+        self.queueing = queueing
+        self.priority = priority
+
+
+class Speaker(object):
+    u"""Records the scheduler's calls, each character takes 0.1 seconds"""
+
+    def __init__(self):
+        self.synthesized = []
+        self.played = []
+        self.stopped = []
+
+    def synthesize(self, utterance):
+        self.synthesized.append(utterance.data.sentence)
+        return [b'\x00' * 3200 for _ in utterance.data.sentence]
+
+    def play(self, utterance, on_event):
+        self.played.append(utterance.data.sentence)
+        playback = Playback(on_event)
+        if utterance.frames is None:
+            playback.duration = len(utterance.data.sentence) * 0.1
+        else:
+            playback.duration = len(utterance.frames) * 0.1
+        playback.finish_synthesis()
+        return playback
+
+    def stop(self, utterance):
+        self.stopped.append(utterance.data.sentence)
+
+
+class TestUtteranceScheduler(unittest.TestCase):
+    def setUp(self):
+        self.speaker = Speaker()
+        self.scheduler = UtteranceScheduler(
+            self.speaker.synthesize, self.speaker.play, self.speaker.stop,
+            max_queue=2)
+
+    def tearDown(self):
+        self.scheduler.close()
+
+    def drain(self, utterance, duration=None, scheduler=None):
+        playback = utterance.playback
+        playback.frame_played(playback.duration - playback.played if duration is None else duration)
+        # Until the event thread has handled the events
+        (scheduler or self.scheduler)._events.join()
+
+    def wait_presynthesis(self, utterance):
+        for _ in range(100):
+            if utterance.frames is not None:
+                return
+            time.sleep(0.01)
+
+    def test_queueing(self):
+        u"""Are queued utterances spoken in order after the current one?"""
+        first = Utterance(Voice(u"ab"))
+        second = Utterance(Voice(u"cd", queueing=True))
+        self.assertTrue(self.scheduler.submit(first))
+        self.assertTrue(self.scheduler.submit(second))
+        self.assertIs(self.scheduler.active, first)
+        self.wait_presynthesis(second)
+        self.assertEqual(self.speaker.synthesized, [u"cd"])
+        self.drain(first, 0.1)
+        self.assertEqual(first.state, Utterance.ACTIVE)
+        self.assertAlmostEqual(self.scheduler.remaining_time(first), 0.1)
+        self.assertAlmostEqual(self.scheduler.remaining_time(second), 0.3)
+        self.drain(first)
+        self.assertEqual(first.state, Utterance.SUCCEEDED)
+        self.assertIs(self.scheduler.active, second)
+        self.assertEqual(self.speaker.played, [u"ab", u"cd"])
+        self.drain(second)
+        self.assertEqual(second.state, Utterance.SUCCEEDED)
+        self.assertIsNone(self.scheduler.active)
+
+    def test_output_latency(self):
+        u"""Is the latency of the audio output added until the first frame is played?"""
+        scheduler = UtteranceScheduler(
+            self.speaker.synthesize, self.speaker.play, self.speaker.stop,
+            output_latency=0.05)
+        self.addCleanup(scheduler.close)
+        utterance = Utterance(Voice(u"ab"))
+        scheduler.submit(utterance)
+        self.assertAlmostEqual(scheduler.remaining_time(utterance), 0.25)
+        self.drain(utterance, 0.1, scheduler)
+        self.assertAlmostEqual(scheduler.remaining_time(utterance), 0.1)
+
+    def test_done_callback(self):
+        u"""Are done callbacks called once the utterance is finished, or right away?"""
+        finished = []
+        utterance = Utterance(Voice(u"ab"))
+        utterance.add_done_callback(finished.append)
+        self.scheduler.submit(utterance)
+        self.assertEqual(finished, [])
+        self.drain(utterance)
+        self.assertEqual(finished, [utterance])
+        utterance.add_done_callback(finished.append)
+        self.assertEqual(finished, [utterance, utterance])
+
+    def test_drop_on_overflow(self):
+        u"""Is a queued utterance dropped when the queue is full?"""
+        utterances = [Utterance(Voice(u"a", queueing=True)) for _ in range(4)]
+        results = [self.scheduler.submit(utterance) for utterance in utterances]
+        self.assertEqual(results, [True, True, True, False])
+        self.assertEqual(utterances[3].state, Utterance.DROPPED)
+        self.assertTrue(utterances[3].done.is_set())
+
+    def test_without_queue(self):
+        u"""Is a queued utterance dropped when max_queue is 0?"""
+        scheduler = UtteranceScheduler(
+            self.speaker.synthesize, self.speaker.play, self.speaker.stop,
+            max_queue=0)
+        self.addCleanup(scheduler.close)
+        first = Utterance(Voice(u"ab"))
+        second = Utterance(Voice(u"cd", queueing=True, priority=1))
+        self.assertTrue(scheduler.submit(first))
+        self.assertFalse(scheduler.submit(Utterance(Voice(u"cd", queueing=True))))
+        self.assertTrue(scheduler.submit(second))
+        self.assertEqual(first.state, Utterance.PREEMPTED)
+        self.assertEqual(scheduler.utterances, [second])
+
+    def test_interrupting(self):
+        u"""Does an interrupting utterance preempt only the current one?"""
+        first = Utterance(Voice(u"ab"))
+        second = Utterance(Voice(u"cd", queueing=True))
+        third = Utterance(Voice(u"ef", interrupting=True))
+        for utterance in (first, second, third):
+            self.scheduler.submit(utterance)
+        self.assertEqual(first.state, Utterance.PREEMPTED)
+        self.assertEqual(self.speaker.stopped, [u"ab"])
+        self.assertIs(self.scheduler.active, third)
+        self.assertEqual(self.scheduler.utterances, [third, second])
+
+    def test_replace(self):
+        u"""Does a plain utterance preempt the current and queued ones?"""
+        first = Utterance(Voice(u"ab"))
+        second = Utterance(Voice(u"cd", queueing=True))
+        third = Utterance(Voice(u"ef"))
+        for utterance in (first, second, third):
+            self.scheduler.submit(utterance)
+        self.assertEqual(first.state, Utterance.PREEMPTED)
+        self.assertEqual(second.state, Utterance.PREEMPTED)
+        self.assertEqual(self.scheduler.utterances, [third])
+
+    def test_cancel(self):
+        u"""Does the next utterance start when the current one is canceled?"""
+        first = Utterance(Voice(u"ab"))
+        second = Utterance(Voice(u"cd", queueing=True))
+        self.scheduler.submit(first)
+        self.scheduler.submit(second)
+        self.scheduler.cancel(first)
+        self.assertEqual(first.state, Utterance.CANCELED)
+        self.assertIs(self.scheduler.active, second)
+
+    def test_events_of_preempted_playback(self):
+        u"""Are the events of a preempted playback ignored?"""
+        progress = []
+        scheduler = UtteranceScheduler(
+            self.speaker.synthesize, self.speaker.play, self.speaker.stop,
+            on_progress=progress.append)
+        self.addCleanup(scheduler.close)
+        first = Utterance(Voice(u"ab"))
+        second = Utterance(Voice(u"cd"))
+        scheduler.submit(first)
+        self.drain(first, 0.1, scheduler)
+        scheduler.submit(second)
+        self.drain(first, scheduler=scheduler)
+        self.assertEqual(first.state, Utterance.PREEMPTED)
+        self.assertIs(scheduler.active, second)
+        self.assertEqual(progress, [first, first])
+
+    def test_empty_sentence(self):
+        u"""Is an utterance without any frame aborted?"""
+        utterance = Utterance(Voice(u""))
+        self.scheduler.submit(utterance)
+        # Drained as soon as it is played
+        self.scheduler._events.join()
+        self.assertEqual(utterance.state, Utterance.ABORTED)
+        self.assertIsNone(self.scheduler.active)
+
+    def test_preempt_by_priority(self):
+        u"""Does a higher priority preempt the current utterance and keep the queued ones?"""
+        first = Utterance(Voice(u"ab"))
+        second = Utterance(Voice(u"cd", queueing=True))
+        warning = Utterance(Voice(u"ef", priority=2))
+        for utterance in (first, second, warning):
+            self.scheduler.submit(utterance)
+        self.assertEqual(first.state, Utterance.PREEMPTED)
+        self.assertEqual(second.state, Utterance.PENDING)
+        self.assertEqual(self.scheduler.utterances, [warning, second])
+        self.assertIsNotNone(warning.queueing_delay)
+
+    def test_lower_priority_waits(self):
+        u"""Does a lower priority wait whatever its flags, and the queue follow the priorities?"""
+        warning = Utterance(Voice(u"ab", priority=2))
+        chat = Utterance(Voice(u"cd", interrupting=True, priority=-1))
+        normal = Utterance(Voice(u"ef", priority=0))
+        self.scheduler.submit(warning)
+        self.scheduler.submit(chat)
+        self.wait_presynthesis(chat)
+        self.assertTrue(self.scheduler.submit(normal))
+        self.assertEqual(self.scheduler.utterances, [warning, normal, chat])
+        self.wait_presynthesis(normal)
+        self.assertIsNone(chat.frames)
+        self.drain(warning)
+        self.assertIs(self.scheduler.active, normal)
+        self.drain(normal)
+        self.assertIs(self.scheduler.active, chat)
+        self.assertEqual(self.speaker.played, [u"ab", u"ef", u"cd"])
+        self.assertEqual(self.speaker.stopped, [])
+
+    def test_presynthesis_of_highest_priority(self):
+        u"""Are the frames of a pending utterance released when it is displaced?"""
+        first = Utterance(Voice(u"ab", priority=2))
+        low = Utterance(Voice(u"cd", priority=-1))
+        self.scheduler.submit(first)
+        self.scheduler.submit(low)
+        self.wait_presynthesis(low)
+        self.assertIsNotNone(low.frames)
+        high = Utterance(Voice(u"ef", priority=1))
+        self.scheduler.submit(high)
+        self.wait_presynthesis(high)
+        self.assertIsNone(low.frames)
+        self.assertEqual(self.scheduler.utterances, [first, high, low])
+
+    def test_drop_lower_priority_on_overflow(self):
+        u"""Is the last queued utterance of the lowest priority dropped for a higher one?"""
+        self.scheduler.submit(Utterance(Voice(u"a", priority=2)))
+        low = [Utterance(Voice(u"b", priority=-1)) for _ in range(2)]
+        for utterance in low:
+            self.scheduler.submit(utterance)
+        high = Utterance(Voice(u"c", priority=1))
+        self.assertTrue(self.scheduler.submit(high))
+        self.assertEqual(low[0].state, Utterance.PENDING)
+        self.assertEqual(low[1].state, Utterance.DROPPED)
+        other = Utterance(Voice(u"d", priority=-1))
+        self.assertFalse(self.scheduler.submit(other))
+        self.assertEqual(other.state, Utterance.DROPPED)
+
+    def test_deadline(self):
+        u"""Is a pending utterance dropped once its deadline passes?"""
+        first = Utterance(Voice(u"ab", priority=1))
+        late = Utterance(Voice(u"cd"), max_wait=0.05)
+        patient = Utterance(Voice(u"ef"))
+        for utterance in (first, late, patient):
+            self.scheduler.submit(utterance)
+        self.scheduler.expire()
+        self.assertEqual(late.state, Utterance.PENDING)
+        time.sleep(0.06)
+        self.scheduler.expire()
+        self.assertEqual(late.state, Utterance.DROPPED)
+        self.assertTrue(late.done.is_set())
+        self.drain(first)
+        self.assertIs(self.scheduler.active, patient)
+
+    def test_deadline_timer(self):
+        u"""Is a pending utterance dropped at its deadline without any other call?"""
+        first = Utterance(Voice(u"ab", priority=1))
+        late = Utterance(Voice(u"cd"), max_wait=0.05)
+        self.scheduler.submit(first)
+        self.assertIsNone(self.scheduler._expiry)
+        self.scheduler.submit(late)
+        self.assertTrue(late.done.wait(1.0))
+        self.assertEqual(late.state, Utterance.DROPPED)
+        self.assertIsNone(self.scheduler._expiry)
+
+    def test_deadline_timer_canceled(self):
+        u"""Is the timer canceled once the utterance with a deadline starts?"""
+        first = Utterance(Voice(u"ab"))
+        second = Utterance(Voice(u"cd", queueing=True), max_wait=10.0)
+        self.scheduler.submit(first)
+        self.scheduler.submit(second)
+        timer = self.scheduler._expiry[1]
+        self.drain(first)
+        self.assertIs(self.scheduler.active, second)
+        self.assertIsNone(self.scheduler._expiry)
+        timer.join(1.0)
+        self.assertFalse(timer.is_alive())
+
+    def test_synthesis_error(self):
+        u"""Is an utterance whose synthesis failed after some frames aborted?"""
+        def play(utterance, on_event):
+            playback = Playback(on_event)
+            playback.duration = 0.1
+            playback.error = RuntimeError("VT_TextToBuffer failed. ret=-8")
+            playback.finish_synthesis()
+            return playback
+        scheduler = UtteranceScheduler(self.speaker.synthesize, play, self.speaker.stop)
+        self.addCleanup(scheduler.close)
+        utterance = Utterance(Voice(u"ab"))
+        scheduler.submit(utterance)
+        self.drain(utterance, scheduler=scheduler)
+        self.assertEqual(utterance.state, Utterance.ABORTED)
+
+    def test_start_during_presynthesis(self):
+        u"""Is an utterance which starts during its pre-synthesis streamed, and synthesized once?"""
+        entered = threading.Event()
+        release = threading.Event()
+        synthesized = []
+
+        def synthesize(utterance):
+            synthesized.append(utterance.data.sentence)
+            entered.set()
+            release.wait(1.0)
+            return [b'\x00' * 3200]
+        scheduler = UtteranceScheduler(synthesize, self.speaker.play, self.speaker.stop)
+        self.addCleanup(scheduler.close)
+        first = Utterance(Voice(u"ab"))
+        second = Utterance(Voice(u"cd", queueing=True))
+        scheduler.submit(first)
+        scheduler.submit(second)
+        self.assertTrue(entered.wait(1.0))
+        start = time.monotonic()
+        scheduler.cancel(first)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertIs(scheduler.active, second)
+        release.set()
+        time.sleep(0.05)
+        self.assertEqual(synthesized, [u"cd"])
+        self.assertIsNone(second.frames)
+        self.assertEqual(self.speaker.played, [u"ab", u"cd"])
+
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_earcon_during_presynthesis(self, ao):
+        u"""Does the mixer keep writing an earcon while the next utterance is synthesized?"""
+        writes = []
+
+        def write(buf):
+            duration = memoryview(buf).nbytes / 32000.0
+            writes.append((time.monotonic(), duration))
+            time.sleep(duration)
+        ao.return_value.latency.return_value = 0.0
+        ao.return_value.write.side_effect = write
+
+        def synthesize(utterance):
+            time.sleep(0.5)
+            return [b'\x00' * 3200]
+        with AudioPlayer() as player:
+            def play(utterance, on_event):
+                self.speaker.played.append(utterance.data.sentence)
+                return player.play(b'\x00' * 3200, source='voice', on_event=on_event)
+            scheduler = UtteranceScheduler(synthesize, play, self.speaker.stop)
+            earcon = player.play(b'\x01\x00' * 16000)
+            first = Utterance(Voice(u"a"))
+            second = Utterance(Voice(u"b", queueing=True))
+            scheduler.submit(first)
+            scheduler.submit(second)
+            finished = second.done.wait(0.4)
+            drained = earcon.drained.wait(2.0)
+            scheduler.close()
+        self.assertTrue(finished)
+        self.assertTrue(drained)
+        self.assertEqual(second.state, Utterance.SUCCEEDED)
+        self.assertEqual(self.speaker.played, [u"a", u"b"])
+        gaps = [start - (previous + duration)
+                for (previous, duration), (start, _) in zip(writes, writes[1:])]
+        self.assertLess(max(gaps), 0.05)
@@ -0,0 +1,61 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+from tmc_talk_hoya_py import split_sentences
+
+
+class TestSplitSentences(unittest.TestCase):
+    def test_japanese(self):
+        u"""Is a Japanese text split after the terminators?"""
+        self.assertEqual(split_sentences(u"こんにちは。元気ですか？はい！"),
+                         [u"こんにちは。", u"元気ですか？", u"はい！"])
+
+    def test_english(self):
+        u"""Are numbers and titles kept in an English sentence?"""
+        self.assertEqual(split_sentences(u"Hello, Mr. Smith. Pi is 3.14! Really? \"Yes.\" OK"),
+                         [u"Hello, Mr. Smith.", u"Pi is 3.14!", u"Really?", u"\"Yes.\"", u"OK"])
+
+    def test_paragraphs(self):
+        u"""Is a text split at blank lines but not at line breaks?"""
+        self.assertEqual(split_sentences(u"first\nline\n\nsecond"),
+                         [u"first\nline", u"second"])
+
+    def test_long_sentence(self):
+        u"""Is a long sentence split after the last comma or space?"""
+        self.assertEqual(split_sentences(u"あいうえお、かきくけこ、さしすせそ", max_length=12),
+                         [u"あいうえお、かきくけこ、", u"さしすせそ"])
+        self.assertEqual(split_sentences(u"abcdefgh", max_length=3),
+                         [u"abc", u"def", u"gh"])
+
+    def test_empty(self):
+        u"""Are blank texts ignored?"""
+        self.assertEqual(split_sentences(u""), [])
+        self.assertEqual(split_sentences(u" \n\n "), [])
@@ -27,14 +27,33 @@ DAMAGE.
 '''
 #! /usr/bin/env python
 # -*- coding: utf-8 -*-
+import asyncio
 import os
+import shutil
+import tempfile
+import threading
 import time
 import unittest
 
+import numpy
+
+from concurrent.futures import ThreadPoolExecutor
+
 from unittest.mock import patch
 
+from tmc_talk_hoya_py import codec
+from tmc_talk_hoya_py.metrics import Trace
+import tmc_talk_hoya_py.pulse as pulse
 from tmc_talk_hoya_py import (
+    AudioOut,
+    AudioPlayer,
+    find_voice,
+    FramePool,
+    Playback,
+    Prosody,
     VoiceText,
+    VoiceTextCache,
+    VoiceTextChannelPool,
     VoiceTextLibvtNotFound,
     VoiceTextLicenseNotFound,
     VoiceTextRuntimeError,
@@ -42,6 +61,29 @@ from tmc_talk_hoya_py import (
 )
 
 
+# A mock of AudioOut is written in blocks of the AudioPlayer, as PulseAudio
+AUDIO_OUT = {'return_value.write_size': None}
+
+
+def written_time(write):
+    u"""Seconds of 16kHz mono audio written in chunks to a mock of AudioOut"""
+    return sum(memoryview(call[0][0]).nbytes for call in write.call_args_list) / 32000.0
+
+
+def play_in_real_time(buf):
+    u"""Side effect of a mock of AudioOut.write which blocks as long as 16kHz mono buf plays"""
+    time.sleep(memoryview(buf).nbytes / 32000.0)
+
+
+def raised(function):
+    u"""Call function and return the exception it raised, None if it returned"""
+    try:
+        function()
+    except Exception as err:
+        return err
+    return None
+
+
 class TextToBuffer(object):
     u"""VoiceText Mock of TextTobuffer
 
@@ -73,7 +115,7 @@ class TextToBuffer(object):
         if len(tts_text) == 0:
             return -4
         # Return -5 (error) for "error"
-        if tts_text == "error":
+        if tts_text == b"error":
             return -5
         # Return 1 at the end if the length of the string
         if self._count >= len(tts_text):
@@ -88,7 +130,7 @@ class TestVoiceText(unittest.TestCase):
         cls.test_path = os.path.join(os.path.dirname(__file__), 'license')
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_to_file_fails(self, ao, vtlib):
         u"""If an error occurs in Texttofile, an exception can be applied"""
         instance = vtlib.return_value
@@ -99,7 +141,7 @@ class TestVoiceText(unittest.TestCase):
                           lambda: vt.to_file(u"test", "/tmp/test.wave"))
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_to_file(self, ao, vtlib):
         u"""Test if you do not have an error"""
         instance = vtlib.return_value
@@ -109,7 +151,7 @@ class TestVoiceText(unittest.TestCase):
         self.assertTrue(vt.to_file(u"test", "/tmp/test.wave"))
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_to_file_with_empty_string(self, ao, vtlib):
         u"""Testing whether to return FALSE without an error even in the empty string (does it get an error even if VoiceText returns -4)"""
         instance = vtlib.return_value
@@ -118,6 +160,68 @@ class TestVoiceText(unittest.TestCase):
         vt = VoiceText(path=self.test_path, voice='bridget')
         self.assertFalse(vt.to_file(u"test", "/tmp/test.wave"))
 
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_to_buffer_in_mulaw(self, ao, vtlib):
+        u"""Are the frames encoded into mu-law of half the size?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        vt = VoiceText(path=self.test_path, voice='bridget')
+        pool = FramePool(vt.frame_size, count=1)
+        frames = list(vt.to_buffer(u"123", pool=pool, encoding=codec.ENCODING_MULAW))
+        self.assertEqual([(bytes(frame), duration) for frame, duration in frames],
+                         [(b'\xff' * 1600, 0.1)] * 3)
+        self.assertEqual(pool.size, 1)
+
+
+class ConcurrentTextToBuffer(object):
+    u"""VoiceText Mock of TextToBuffer which records the use of the thread IDs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self.buffers = {}
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, fmt, tts_text, output_buff, output_len, flag, nThreadID, *args):
+        output_len._obj.value = 3200
+        if tts_text is None:
+            return 0
+        with self._lock:
+            if flag == 0:
+                self._counts[nThreadID] = 0
+            self._counts[nThreadID] += 1
+            self.buffers.setdefault(nThreadID, set()).add(id(output_buff))
+            self.running += 1
+            self.max_running = max(self.running, self.max_running)
+        time.sleep(0.01)
+        with self._lock:
+            self.running -= 1
+            return 1 if self._counts[nThreadID] >= len(tts_text) else 0
+
+
+class TestVoiceTextChannelPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.test_path = os.path.join(os.path.dirname(__file__), 'license')
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    def test_concurrent_synthesis(self, vtlib):
+        u"""Are sentences synthesized in parallel on distinct thread IDs and buffers?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        text_to_buffer = ConcurrentTextToBuffer()
+        instance.VT_TextToBuffer.side_effect = text_to_buffer
+        channels = VoiceTextChannelPool(VoiceText(path=self.test_path, voice='bridget'), 2)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(channels.synthesize, [u"123", u"1234", u"12", u"1"]))
+        self.assertEqual([len(pcm) for pcm in results], [9600, 12800, 6400, 3200])
+        self.assertEqual(set(text_to_buffer.buffers), {0, 1})
+        self.assertEqual(text_to_buffer.max_running, 2)
+        self.assertEqual(len(text_to_buffer.buffers[0] | text_to_buffer.buffers[1]), 2)
+
 
 class TestVoiceTextSpeaker(unittest.TestCase):
     @classmethod
@@ -149,7 +253,7 @@ class TestVoiceTextSpeaker(unittest.TestCase):
                                                    voice='julie'))
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_init_fail(self, ao, vtlib):
         u"""Failed to initialize VoiceText"""
         instance = vtlib.return_value
@@ -159,93 +263,767 @@ class TestVoiceTextSpeaker(unittest.TestCase):
                                                    voice='bridget'))
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_speak_in_english(self, ao, vtlib):
         u"""Will VoiceText return the end time when VoiceText behaves in the English language version?"""
         instance = vtlib.return_value
         instance.VT_LOADTTS.return_value = 0
         instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
         with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
-            self.assertAlmostEqual(speaker.speak(u"123"), 0.3)
+            duration = speaker.speak(u"123")
+        self.assertAlmostEqual(duration, 0.3)
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_speak_in_japanese(self, ao, vtlib):
         u"""Do you return the end time when VoiceText behaves in the Japanese version?"""
         instance = vtlib.return_value
         instance.VT_LOADTTS.return_value = 0
         instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
         instance.language = "jpn"
         with VoiceTextSpeaker(path=self.test_path, voice='sakura') as speaker:
-            self.assertAlmostEqual(speaker.speak(u"日本語"), 0.6)
+            duration = speaker.speak(u"日本語")
+        self.assertAlmostEqual(duration, 0.6)
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_speak_encoding_error_in_english(self, ao, vtlib):
         u"""Will UnicodingEncodeRror occur if I speak Japanese in the English version?"""
         instance = vtlib.return_value
         instance.VT_LOADTTS.return_value = 0
         instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
         with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
-            self.assertRaises(UnicodeEncodeError,
-                              lambda: speaker.speak(u"日本語"))
+            error = raised(lambda: speaker.speak(u"日本語"))
+        self.assertIsInstance(error, UnicodeEncodeError)
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_speak_encoding_error_in_japanese(self, ao, vtlib):
         u"""Will UnicodingEncodeRror generate if you speak the characters that cause encoding errors in the Japanese version?"""
         instance = vtlib.return_value
         instance.VT_LOADTTS.return_value = 0
         instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
         instance.language = "jpn"
         with VoiceTextSpeaker(path=self.test_path, voice='sakura') as speaker:
-            self.assertRaises(UnicodeEncodeError,
-                              lambda: speaker.speak(u"\u4039"))
+            error = raised(lambda: speaker.speak(u"\u4039"))
+        self.assertIsInstance(error, UnicodeEncodeError)
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_speak_with_emptry_string(self, ao, vtlib):
         u"""Testing whether an error occurs even in the empty string (does it get an error even if VoiceText returns -4)"""
         instance = vtlib.return_value
         instance.VT_LOADTTS.return_value = 0
         instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
         with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
-            self.assertAlmostEqual(speaker.speak(u""), 0.0)
+            duration = speaker.speak(u"")
+        self.assertAlmostEqual(duration, 0.0)
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_speak_voicetext_fails(self, ao, vtlib):
         u"""If an error occurs in VOICETEXT, an exception can be applied"""
         instance = vtlib.return_value
         instance.VT_LOADTTS.return_value = 0
         instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
         with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
-            self.assertRaises(VoiceTextRuntimeError,
-                              lambda: speaker.speak(u"error"))
+            error = raised(lambda: speaker.speak(u"error"))
+        self.assertIsInstance(error, VoiceTextRuntimeError)
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_cancel_on_talking(self, ao, vtlib):
         u"""Can I stop writing to pulseAudio with cancellation during the speech?"""
         instance = vtlib.return_value
         instance.VT_LOADTTS.return_value = 0
         instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        ao.return_value.write.side_effect = play_in_real_time
         with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
             speaker.speak(u"1234")
             time.sleep(0.25)
             speaker.cancel()
-            self.assertAlmostEqual(ao.write.call_count, 3)
+            written = written_time(ao.return_value.write)
+            time.sleep(0.1)
+        # Stopped within the chunk being written
+        self.assertGreaterEqual(written, 0.2)
+        self.assertLess(written, 0.35)
+        self.assertAlmostEqual(written_time(ao.return_value.write), written)
 
     @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
-    @patch('tmc_talk_hoya_py.voicetext.AudioOut')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
     def test_speak_on_talking(self, ao, vtlib):
         u"""Is the utterance in the middle of the utterance canceled?"""
         instance = vtlib.return_value
         instance.VT_LOADTTS.return_value = 0
         instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        ao.return_value.write.side_effect = play_in_real_time
         with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
             speaker.speak(u"123")
             time.sleep(0.05)
             speaker.speak(u"123")
             time.sleep(0.3)
-            self.assertAlmostEqual(ao.write.call_count, 4)
+            written = written_time(ao.return_value.write)
+        self.assertGreaterEqual(written, 0.3)
+        self.assertLess(written, 0.45)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_speak_stream(self, ao, vtlib):
+        u"""Does speak_stream return before the synthesis and report the duration afterwards?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
+            playback = speaker.speak_stream(u"123")
+            first_frame = playback.first_frame.wait(1.0)
+            synthesized = playback.synthesized.wait(1.0)
+            time.sleep(0.05)
+        self.assertTrue(first_frame)
+        self.assertTrue(synthesized)
+        self.assertAlmostEqual(playback.duration, 0.3)
+        self.assertIsNone(playback.error)
+        self.assertAlmostEqual(written_time(ao.return_value.write), 0.3)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_playback_events(self, ao, vtlib):
+        u"""Does the writer thread report the start, every frame and the end of an utterance?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        events = []
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
+            playback = speaker.speak_stream(
+                u"123", on_event=lambda playback, event: events.append(event))
+            drained = playback.drained.wait(1.0)
+        self.assertTrue(drained)
+        self.assertAlmostEqual(playback.played, 0.3)
+        self.assertEqual(events, [Playback.STARTED] + [Playback.FRAME_PLAYED] * 3 + [Playback.DRAINED])
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_playback_trace(self, ao, vtlib):
+        u"""Are the stages of a traced utterance recorded in order?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        trace = Trace()
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
+            drained = speaker.speak_stream(u"123", trace=trace).drained.wait(1.0)
+        self.assertTrue(drained)
+        stages = [Trace.RECEIVED, Trace.ENCODED, Trace.SYNTHESIZED,
+                  Trace.WRITTEN, Trace.LAST_WRITTEN, Trace.DRAINED]
+        times = [trace.times[stage] for stage in stages]
+        self.assertEqual(times, sorted(times))
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_speak_async(self, ao, vtlib):
+        u"""Can a coroutine await the end of an utterance and its events?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+
+        async def speak(speaker):
+            playback = await speaker.speak_async(u"12")
+            events = [event async for event in speaker.speak_events(u"3")]
+            return playback, events
+
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
+            playback, events = asyncio.run(speak(speaker))
+        self.assertTrue(playback.drained.is_set())
+        self.assertEqual(events, [Playback.STARTED, Playback.FRAME_PLAYED, Playback.DRAINED])
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_cancel_speak_async(self, ao, vtlib):
+        u"""Is the playback canceled with the task which awaits it?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        start = time.monotonic()
+        # Audio output which plays in real time
+        ao.return_value.latency.side_effect = lambda: max(
+            written_time(ao.return_value.write) - (time.monotonic() - start), 0.0)
+        received = []
+
+        async def listen(events):
+            async for event in events:
+                received.append(event)
+
+        async def speak(speaker):
+            events = speaker.speak_events(u"12345678")
+            task = asyncio.ensure_future(listen(events))
+            await asyncio.sleep(0.15)
+            task.cancel()
+            await asyncio.wait([task])
+            return events.playback
+
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
+            playback = asyncio.run(speak(speaker))
+        self.assertTrue(playback.canceled)
+        self.assertNotIn(Playback.DRAINED, received)
+        self.assertFalse(playback.drained.is_set())
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_playback_waits_for_latency(self, ao, vtlib):
+        u"""Is an utterance drained only after the audio output has played it?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        start = time.monotonic()
+        # Audio output which plays in real time
+        ao.return_value.latency.side_effect = lambda: max(
+            written_time(ao.return_value.write) - (time.monotonic() - start), 0.0)
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
+            playback = speaker.speak_stream(u"123")
+            playback.synthesized.wait(1.0)
+            played = playback.played
+            drained = playback.drained.wait(1.0)
+            elapsed = time.monotonic() - start
+        self.assertLess(played, 0.3)
+        self.assertTrue(drained)
+        self.assertGreaterEqual(elapsed, 0.29)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_playback_with_unknown_latency(self, ao, vtlib):
+        u"""Is the audio output drained if its latency is unknown?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = None
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
+            playback = speaker.speak_stream(u"123")
+            drained = playback.drained.wait(1.0)
+        self.assertTrue(drained)
+        self.assertTrue(ao.return_value.drain.called)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_playback_of_empty_string(self, ao, vtlib):
+        u"""Is an empty utterance drained without any frame?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
+            playback = speaker.speak_stream(u"")
+            drained = playback.drained.wait(1.0)
+        self.assertTrue(drained)
+        self.assertFalse(playback.started.is_set())
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_speak_stream_fails(self, ao, vtlib):
+        u"""Is an error of VoiceText reported through the Playback?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
+            playback = speaker.speak_stream(u"error")
+            playback.synthesized.wait(1.0)
+        self.assertIsInstance(playback.error, VoiceTextRuntimeError)
+        self.assertAlmostEqual(playback.duration, 0.0)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_frame_buffers_are_recycled(self, ao, vtlib):
+        u"""Are the frame buffers reused once they are written to PulseAudio?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget') as speaker:
+            frames = 0
+            for _ in range(10):
+                instance.VT_TextToBuffer.side_effect = TextToBuffer()
+                frames += round(speaker.speak(u"123") / 0.1)
+                time.sleep(0.02)
+            pool_size = speaker._pool.size
+        self.assertEqual(frames, 30)
+        self.assertAlmostEqual(written_time(ao.return_value.write), 3.0)
+        self.assertEqual(pool_size, 16)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_bounded_playback_queue(self, ao, vtlib):
+        u"""Does the synthesis pause while the queue of the player is full?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        # The output takes 5 ms per frame
+        ao.return_value.write.side_effect = lambda buf: time.sleep(0.005)
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget',
+                              max_queue_bytes=6400) as speaker:
+            playback = speaker.speak_stream(u"a" * 40)
+            drained = playback.drained.wait(2.0)
+            stats = speaker._player.stats
+            pool_size = speaker._pool.size
+        self.assertTrue(drained)
+        self.assertAlmostEqual(playback.duration, 4.0)
+        self.assertEqual(stats['bytes'], 0)
+        self.assertEqual(stats['max_bytes'], 6400)
+        self.assertLessEqual(stats['peak_bytes'], 6400)
+        self.assertLessEqual(pool_size, 16)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_cancel_paused_synthesis(self, ao, vtlib):
+        u"""Does a cancel wake up a synthesis waiting for the queue?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        ao.return_value.write.side_effect = lambda buf: time.sleep(0.05)
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget',
+                              max_queue_bytes=3200) as speaker:
+            playback = speaker.speak_stream(u"a" * 40)
+            playback.first_frame.wait(1.0)
+            speaker.cancel(playback)
+            synthesized = playback.synthesized.wait(0.5)
+        self.assertTrue(synthesized)
+        self.assertTrue(playback.canceled)
+        self.assertLess(playback.duration, 1.0)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_bounded_presynthesis(self, ao, vtlib):
+        u"""Are the sentences beyond max_bytes streamed by play within the playback queue?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = ConcurrentTextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        ao.return_value.write.side_effect = lambda buf: time.sleep(0.001)
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget',
+                              max_queue_bytes=6400) as speaker:
+            frames = speaker.synthesize(u"aaaa. bbbb. cccc.", max_bytes=6400)
+            playback = speaker.play(frames)
+            drained = playback.drained.wait(2.0)
+            stats = speaker._player.stats
+        self.assertEqual(len(frames), 5)
+        self.assertEqual(frames.sentences, [u"bbbb.", u"cccc."])
+        self.assertTrue(drained)
+        self.assertAlmostEqual(playback.duration, 1.5)
+        self.assertAlmostEqual(written_time(ao.return_value.write), 1.5)
+        self.assertLessEqual(stats['peak_bytes'], 6400)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_channel_released_while_paused(self, ao, vtlib):
+        u"""Is the channel of a synthesis waiting for the queue free for other syntheses?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = ConcurrentTextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        ao.return_value.write.side_effect = play_in_real_time
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget', channels=1,
+                              max_queue_bytes=3200) as speaker:
+            playback = speaker.speak_stream(u"a" * 20)
+            playback.first_frame.wait(1.0)
+            time.sleep(0.3)
+            start = time.monotonic()
+            frames = speaker.synthesize(u"bb")
+            elapsed = time.monotonic() - start
+            drained = playback.drained.is_set()
+        self.assertEqual(len(frames), 2)
+        self.assertLess(elapsed, 0.2)
+        self.assertFalse(drained)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_cancel_flushes_audio_out(self, ao, vtlib):
+        u"""Is the audio buffered in PulseAudio discarded on cancellation?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget',
+                              audio_options={'latency': 0.05}) as speaker:
+            speaker.speak(u"1234")
+            speaker.cancel()
+            flushed = ao.return_value.flush.called
+        ao.assert_called_once_with(latency=0.05)
+        self.assertTrue(flushed)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_null_backend(self, ao, vtlib):
+        u"""Does the speaker play without PulseAudio on the null backend?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget',
+                              audio_options={'backend': 'null'}) as speaker:
+            drained = speaker.speak_stream(u"123").drained.wait(1.0)
+        self.assertTrue(drained)
+        self.assertFalse(ao.called)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    def test_find_voice(self, vtlib):
+        u"""Is the voice found without loading the library?"""
+        root_path, lib_path = find_voice(path=self.test_path, voice='bridget')
+        self.assertEqual(root_path, os.path.join(self.test_path, 'bridget', 'M16'))
+        self.assertTrue(lib_path.endswith('.so'))
+        self.assertRaises(VoiceTextLicenseNotFound,
+                          lambda: find_voice(path=self.test_path, voice='mark'))
+        self.assertFalse(vtlib.called)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_shared_player(self, ao, vtlib):
+        u"""Do the speakers share one stream and cancel only their own frames?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        with AudioPlayer() as player:
+            first = VoiceTextSpeaker(path=self.test_path, voice='bridget', player=player)
+            second = VoiceTextSpeaker(path=self.test_path, voice='bridget', player=player)
+            first_frames = first.synthesize(u"1234")
+            instance.VT_TextToBuffer.side_effect = TextToBuffer()
+            second_frames = second.synthesize(u"12")
+            first_playback = first.play(first_frames)
+            second_playback = second.play(second_frames)
+            first.cancel()
+            drained = second_playback.drained.wait(1.0)
+            first.__exit__(None, None, None)
+            second.__exit__(None, None, None)
+        ao.assert_called_once_with()
+        self.assertTrue(first_playback.canceled)
+        self.assertTrue(drained)
+        self.assertFalse(second_playback.canceled)
+        self.assertAlmostEqual(second_playback.played, 0.2)
+
+    @patch.object(pulse, 'pa_simple_new')
+    def test_buffer_attributes(self, pa_simple_new):
+        u"""Is the target latency passed to PulseAudio as tlength?"""
+        AudioOut(latency=0.05, minreq=320)
+        attr = pa_simple_new.call_args[0][7]
+        self.assertEqual(attr.tlength, 1600)
+        self.assertEqual(attr.minreq, 320)
+        self.assertEqual(attr.prebuf, pulse.PA_BUFFER_ATTR_DEFAULT)
+        self.assertEqual(attr.maxlength, pulse.PA_BUFFER_ATTR_DEFAULT)
+
+    @patch.object(pulse, 'pa_simple_new')
+    def test_default_buffer_attributes(self, pa_simple_new):
+        u"""Does PulseAudio choose the buffer attributes by default?"""
+        AudioOut()
+        attr = pa_simple_new.call_args[0][7]
+        self.assertEqual(attr.tlength, pulse.PA_BUFFER_ATTR_DEFAULT)
+
+
+class TestAudioMixer(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def frame(self, value, samples=1600):
+        return bytearray(numpy.full(samples, value, numpy.int16).tobytes())
+
+    def test_mix_sources(self):
+        u"""Are concurrent sources summed with their gains and clipped?"""
+        path = os.path.join(self.path, 'out.pcm')
+        with AudioPlayer({'backend': 'file', 'path': path}) as player:
+            player.set_gain('quiet', 0.5)
+            playbacks = [Playback() for _ in range(3)]
+            # Queued at once, so that the writer mixes them
+            with player._condition:
+                player.put(self.frame(1000), 0.1, playbacks[0], source='voice')
+                player.put(self.frame(2000, 800), 0.05, playbacks[1], source='quiet')
+                player.put(self.frame(32000, 400), 0.025, playbacks[2], source='loud')
+            for playback, duration in zip(playbacks, (0.1, 0.05, 0.025)):
+                playback.duration = duration
+                playback.finish_synthesis()
+            drained = [playback.drained.wait(1.0) for playback in playbacks]
+        self.assertEqual(drained, [True] * 3)
+        with open(path, 'rb') as f:
+            samples = numpy.frombuffer(f.read(), numpy.int16)
+        self.assertEqual(len(samples), 1600)
+        self.assertTrue((samples[:400] == 32767).all())
+        self.assertTrue((samples[400:800] == 2000).all())
+        self.assertTrue((samples[800:] == 1000).all())
+
+    def test_topic_chunk_size(self):
+        u"""Are the messages of a topic output as large as its chunk_size?"""
+        chunks = []
+        options = {'backend': 'topic', 'chunk_size': 16000, 'latency': 2.0,
+                   'publish': lambda seq, data, flush: chunks.append(len(data))}
+        with AudioPlayer(options) as player:
+            player.play(self.frame(1000, 24000))
+            # Published without waiting, the latency covers the frame
+            time.sleep(0.1)
+        self.assertEqual(chunks, [16000, 16000, 16000])
+
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_cancel_during_write(self, ao):
+        u"""Does a flush wait only for the chunk being written, not the whole frame?"""
+        ao.return_value.latency.return_value = 0.0
+        # Blocks as long as the chunk takes to play
+        ao.return_value.write.side_effect = lambda buf: time.sleep(memoryview(buf).nbytes / 32000.0)
+        with AudioPlayer() as player:
+            playback = Playback()
+            playback.duration = 0.3
+            player.put(self.frame(1000, 4800), 0.3, playback, source='voice')
+            playback.finish_synthesis()
+            # In the middle of the frame
+            time.sleep(0.05)
+            start = time.monotonic()
+            player.cancel()
+            elapsed = time.monotonic() - start
+        self.assertLess(elapsed, 0.05)
+        self.assertLess(written_time(ao.return_value.write), 0.15)
+        ao.return_value.flush.assert_called_once()
+
+    @patch.object(pulse, 'pa_simple_free')
+    @patch.object(pulse, 'pa_simple_get_latency', return_value=0)
+    @patch.object(pulse, 'pa_simple_write')
+    @patch.object(pulse, 'pa_simple_new')
+    def test_mixed_blocks_in_bytes(self, pa_simple_new, pa_simple_write, *args):
+        u"""Do all the bytes of the mixed blocks reach PulseAudio?"""
+        with AudioPlayer({'latency': 0.05}) as player:
+            player.set_gain('voice', 0.5)
+            voice = Playback()
+            voice.duration = 0.1
+            with player._condition:
+                player.put(self.frame(2000), 0.1, voice, source='voice')
+                earcon = player.play(bytes(self.frame(1000, 800)))
+            voice.finish_synthesis()
+            drained = [playback.drained.wait(1.0) for playback in (voice, earcon)]
+        self.assertEqual(drained, [True, True])
+        pcm = b''.join(bytes(call[0][1])[:call[0][2]] for call in pa_simple_write.call_args_list)
+        samples = numpy.frombuffer(pcm, numpy.int16)
+        self.assertEqual(len(pcm), 3200)
+        self.assertTrue((samples[:800] == 2000).all())
+        self.assertTrue((samples[800:] == 1000).all())
+
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_cancel_one_source(self, ao):
+        u"""Does the cancel of a source ramp it out without flushing the others?"""
+        start = time.monotonic()
+        # Audio output which plays in real time
+        ao.return_value.latency.side_effect = lambda: max(
+            written_time(ao.return_value.write) - (time.monotonic() - start), 0.0)
+        ao.return_value.realtime = True
+        ao.return_value.buffer_time = 0.05
+        with AudioPlayer(fade_time=0.005) as player:
+            voice = Playback()
+            earcon = player.play(bytes(self.frame(1000, 4800)))
+            for _ in range(3):
+                voice.duration += 0.1
+                player.put(self.frame(1000), 0.1, voice, source='voice')
+            voice.finish_synthesis()
+            time.sleep(0.05)
+            player.cancel(playback=earcon)
+            drained = voice.drained.wait(1.0)
+        self.assertTrue(earcon.canceled)
+        self.assertTrue(drained)
+        ao.return_value.flush.assert_not_called()
+
+
+class TestFramePool(unittest.TestCase):
+    def test_recycle(self):
+        u"""Is a released buffer handed out again?"""
+        pool = FramePool(4, count=1)
+        buf = pool.acquire()
+        self.assertEqual(len(buf), 4)
+        other = pool.acquire()
+        self.assertIsNot(buf, other)
+        self.assertEqual(pool.size, 2)
+        pool.release(memoryview(buf)[:2])
+        self.assertIs(pool.acquire(), buf)
+
+    def test_release_foreign_frame(self):
+        u"""Are frames which do not come from the pool ignored?"""
+        pool = FramePool(4, count=1)
+        pool.release(memoryview(bytearray(4)))
+        pool.release(b'1234')
+        pool.acquire()
+        pool.acquire()
+        self.assertEqual(pool.size, 2)
+
+
+class TestProsody(unittest.TestCase):
+    def test_override(self):
+        u"""Are only the valid values of a request applied over the defaults?"""
+        defaults = Prosody(pitch=120, volume=200)
+        self.assertEqual(defaults.override(speed=150, volume=100),
+                         Prosody(120, 150, 100, -1))
+        self.assertEqual(defaults.override(pitch=10, pause=70000), defaults)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_cache_by_prosody(self, ao, vtlib):
+        u"""Is each prosody of a sentence synthesized once without reloading the engine?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        cache = VoiceTextCache(1024 * 1024)
+        test_path = os.path.join(os.path.dirname(__file__), 'license')
+        with VoiceTextSpeaker(path=test_path, voice='bridget', cache=cache) as speaker:
+            loads = instance.VT_LOADTTS.call_count
+            for prosody in (Prosody(), Prosody(speed=200), Prosody()):
+                speaker.synthesize(u"1", **prosody._asdict())
+        self.assertEqual(instance.VT_LOADTTS.call_count, loads)
+        self.assertEqual(cache.stats['misses'], 2)
+        self.assertEqual(cache.stats['hits'], 1)
+
+
+class TestVoiceTextCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.test_path = os.path.join(os.path.dirname(__file__), 'license')
+
+    def setUp(self):
+        self.cache_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_path)
+
+    def test_lru_eviction(self):
+        u"""Are the least recently used utterances evicted when the budget is exceeded?"""
+        cache = VoiceTextCache(max_bytes=10)
+        cache.put('a', b'1234')
+        cache.put('b', b'1234')
+        self.assertEqual(cache.get('a'), b'1234')
+        cache.put('c', b'1234')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'1234')
+        self.assertEqual(cache.get('c'), b'1234')
+        self.assertEqual(cache.stats['hits'], 3)
+        self.assertEqual(cache.stats['misses'], 1)
+        self.assertEqual(cache.stats['evictions'], 1)
+        self.assertEqual(cache.stats['bytes'], 8)
+
+    def test_disk_tier(self):
+        u"""Are utterances restored from the disk tier by another cache?"""
+        key = VoiceTextCache.make_key('bridget', 'eng', u"test")
+        VoiceTextCache(max_bytes=0, path=self.cache_path).put(key, b'\x01\x02')
+        cache = VoiceTextCache(path=self.cache_path)
+        self.assertEqual(bytes(cache.get(key)), b'\x01\x02')
+        self.assertIsNone(cache.get(VoiceTextCache.make_key('bridget', 'eng', u"test", pitch=100)))
+
+    def test_disk_eviction(self):
+        u"""Are the least recently used files removed beyond max_disk_bytes?"""
+        keys = [VoiceTextCache.make_key('bridget', 'eng', sentence) for sentence in u"abcd"]
+        cache = VoiceTextCache(max_bytes=0, path=self.cache_path, max_disk_bytes=300)
+        for index, key in enumerate(keys[:3]):
+            cache.put(key, b'\x00' * 100)
+            # Distinct mtimes, whatever the resolution of the file system
+            os.utime(cache._filename(key), (index, index))
+        # Used again, so that the next file is the oldest
+        self.assertIsNotNone(cache.get(keys[0]))
+        cache.put(keys[3], b'\x00' * 100)
+        self.assertEqual(len(os.listdir(self.cache_path)), 3)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[2]))
+        self.assertIsNotNone(cache.get(keys[3]))
+        self.assertEqual(cache.stats['disk_evictions'], 1)
+
+    def test_encoded_cache(self):
+        u"""Are the utterances stored in A-law and decoded on get?"""
+        key = VoiceTextCache.make_key('bridget', 'eng', u"test")
+        VoiceTextCache(path=self.cache_path, encoding=codec.ENCODING_ALAW).put(key, b'\x00\x00' * 4)
+        cache = VoiceTextCache(path=self.cache_path, encoding=codec.ENCODING_ALAW)
+        self.assertEqual(bytes(cache.get(key)), b'\x08\x00' * 4)
+        self.assertEqual(cache.stats['bytes'], 4)
+        self.assertIsNone(VoiceTextCache(path=self.cache_path).get(key))
+
+    def test_pinned_entries(self):
+        u"""Are pinned utterances kept in PCM regardless of the LRU budget?"""
+        cache = VoiceTextCache(max_bytes=0, encoding=codec.ENCODING_MULAW)
+        key = VoiceTextCache.make_key('bridget', 'eng', u"stop")
+        cache.put(key, b'\x01\x02')
+        self.assertIsNone(cache.get(key))
+        cache.pin(key, b'\x01\x02')
+        cache.clear()
+        self.assertEqual(bytes(cache.get(key)), b'\x01\x02')
+        self.assertEqual(cache.stats['pinned_bytes'], 2)
+        self.assertTrue(cache.unpin(key))
+        self.assertFalse(cache.unpin(key))
+        self.assertIsNone(cache.get(key))
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_speak_pinned_phrase(self, ao, vtlib):
+        u"""Is a pinned phrase spoken without VoiceText until it is unpinned?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        cache = VoiceTextCache(max_bytes=0)
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget', cache=cache) as speaker:
+            duration = speaker.pin(u"Stop. Now.", speed=150)
+            pinned = instance.VT_TextToBuffer.call_count
+            speaker.pin(u"Stop. Now.", speed=150)
+            speaker.speak(u"Stop. Now.", speed=150)
+            spoken = instance.VT_TextToBuffer.call_count
+            unpinned = speaker.unpin(u"Stop. Now.", speed=150)
+            speaker.speak(u"Stop. Now.", speed=150)
+        self.assertGreater(duration, 0.0)
+        self.assertEqual(spoken, pinned)
+        self.assertTrue(unpinned)
+        self.assertGreater(instance.VT_TextToBuffer.call_count, spoken)
+        self.assertEqual(cache.stats['pinned'], 0)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_speak_from_cache(self, ao, vtlib):
+        u"""Does the second utterance of a sentence bypass VoiceText?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        instance.VT_TextToBuffer.side_effect = TextToBuffer()
+        ao.return_value.latency.return_value = 0.0
+        cache = VoiceTextCache(path=self.cache_path)
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget', cache=cache) as speaker:
+            first = speaker.speak(u"123")
+            call_count = instance.VT_TextToBuffer.call_count
+            second = speaker.speak(u"123")
+            time.sleep(0.1)
+        # Assert outside of the with statement, VoiceTextSpeaker swallows exceptions
+        self.assertAlmostEqual(first, 0.3)
+        self.assertAlmostEqual(second, 0.3)
+        self.assertEqual(instance.VT_TextToBuffer.call_count, call_count)
+        self.assertAlmostEqual(written_time(ao.return_value.write), 0.6)
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 1)
+
+    @patch('tmc_talk_hoya_py.voicetext.VoiceTextLibrary')
+    @patch('tmc_talk_hoya_py.voicetext.AudioOut', **AUDIO_OUT)
+    def test_cache_by_sentence(self, ao, vtlib):
+        u"""Is every sentence of a text synthesized once and cached on its own?"""
+        instance = vtlib.return_value
+        instance.VT_LOADTTS.return_value = 0
+        text_to_buffer = ConcurrentTextToBuffer()
+        instance.VT_TextToBuffer.side_effect = text_to_buffer
+        cache = VoiceTextCache()
+        with VoiceTextSpeaker(path=self.test_path, voice='bridget', cache=cache) as speaker:
+            frames = speaker.synthesize(u"1234. 12!")
+            texts = [c[0][1] for c in instance.VT_TextToBuffer.call_args_list[1:]]
+            again = speaker.synthesize(u"12! 1234.")
+        self.assertEqual(len(frames), 8)
+        self.assertEqual(texts, [b"1234."] * 5 + [b"12!"] * 3)
+        # Encoded once for each sentence
+        self.assertEqual(len(set(id(text) for text in texts)), 2)
+        self.assertEqual(len(again), 8)
+        self.assertEqual(instance.VT_TextToBuffer.call_count, 9)
+        self.assertEqual(cache.stats['entries'], 2)
+        self.assertEqual(cache.stats['hits'], 2)
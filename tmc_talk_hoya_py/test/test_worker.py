@@ -0,0 +1,112 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import time
+import unittest
+
+from tmc_talk_hoya_py import (
+    FramePool,
+    VoiceTextRuntimeError
+)
+from tmc_talk_hoya_py.worker import VoiceTextProcess
+
+
+class FakeVoiceText(object):
+    u"""Runs in the worker instead of VoiceText, every character is a frame of its code"""
+
+    frame_size = 320
+    language = 'eng'
+
+    def __init__(self, path, voice, iotype):
+        if voice == 'missing':
+            raise VoiceTextRuntimeError("Voice is not found")
+
+    def to_buffer(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1, pool=None, **kwargs):
+        for char in msg:
+            if char == '!':
+                # A crash of libvt
+                os._exit(3)
+            if char == '?':
+                raise VoiceTextRuntimeError("VT_TextToBuffer failed. ret=-8")
+            if char == '.':
+                time.sleep(0.05)
+            buf = pool.acquire()
+            length = 160 if char == '-' else len(buf)
+            memoryview(buf).cast('B')[:length] = bytes([ord(char)]) * length
+            yield memoryview(buf)[:length], length / 32000.0
+
+
+class TestVoiceTextProcess(unittest.TestCase):
+    def setUp(self):
+        self.vt = VoiceTextProcess(voice='fake', slots=2, factory=FakeVoiceText)
+
+    def tearDown(self):
+        self.vt.close()
+
+    def test_frames_through_ring(self):
+        u"""Are the frames passed through a ring smaller than the utterance?"""
+        self.assertEqual(self.vt.frame_size, 320)
+        pool = FramePool(self.vt.frame_size)
+        frames = []
+        for frame, duration in self.vt.to_buffer(u"abc-d", pool=pool):
+            frames.append((bytes(frame), duration))
+            pool.release(frame)
+        self.assertEqual([data[:1] for data, _ in frames], [b'a', b'b', b'c', b'-', b'd'])
+        self.assertEqual([len(data) for data, _ in frames], [320, 320, 320, 160, 320])
+        self.assertAlmostEqual(sum(duration for _, duration in frames), 0.045)
+        self.assertNotEqual(self.vt.pid, os.getpid())
+
+    def test_cancel(self):
+        u"""Does the worker go on with the next request after a cancel?"""
+        frames = self.vt.to_buffer(u"a.........")
+        next(frames)
+        frames.close()
+        self.assertEqual([bytes(frame[:1]) for frame, _ in self.vt.to_buffer(u"xy")],
+                         [b'x', b'y'])
+
+    def test_error(self):
+        self.assertRaises(VoiceTextRuntimeError, lambda: list(self.vt.to_buffer(u"a?")))
+        self.assertEqual(len(list(self.vt.to_buffer(u"ab"))), 2)
+
+    def test_restart_on_crash(self):
+        u"""Is a crashed worker restarted and the request in progress failed?"""
+        pid = self.vt.pid
+        self.assertRaises(VoiceTextRuntimeError, lambda: list(self.vt.to_buffer(u"a!")))
+        for _ in range(100):
+            if self.vt.restarts:
+                break
+            time.sleep(0.05)
+        self.assertEqual(self.vt.restarts, 1)
+        self.assertNotEqual(self.vt.pid, pid)
+        self.assertEqual(len(list(self.vt.to_buffer(u"ab"))), 2)
+
+    def test_failed_start(self):
+        self.assertRaises(VoiceTextRuntimeError,
+                          lambda: VoiceTextProcess(voice='missing', factory=FakeVoiceText))
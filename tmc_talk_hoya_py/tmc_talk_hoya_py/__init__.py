@@ -27,16 +27,56 @@ DAMAGE.
 '''
 # -*- coding: utf-8 -*-
 
+from .audio import (
+    AudioOutError,
+    AudioSink,
+    FileDescriptorOut,
+    FileOut,
+    NullOut,
+    TopicOut
+)
 from .voicetext import (
+    AUDIO_BACKENDS,
+    AudioOut,
+    AudioPlayer,
+    find_voice,
+    FramePool,
+    open_audio_out,
+    Playback,
+    Prosody,
+    PROSODY_RANGES,
+    Synthesis,
     VoiceText,
+    VoiceTextCache,
+    VoiceTextChannelPool,
     VoiceTextLibvtNotFound,
     VoiceTextLicenseNotFound,
     VoiceTextRuntimeError,
     VoiceTextSpeaker
 )
+from .sentence import split_sentences
 
 __all__ = [
+    'AUDIO_BACKENDS',
+    'AudioOut',
+    'AudioOutError',
+    'AudioPlayer',
+    'AudioSink',
+    'FileDescriptorOut',
+    'FileOut',
+    'find_voice',
+    'FramePool',
+    'NullOut',
+    'open_audio_out',
+    'Playback',
+    'Prosody',
+    'PROSODY_RANGES',
+    'split_sentences',
+    'Synthesis',
+    'TopicOut',
     'VoiceText',
+    'VoiceTextCache',
+    'VoiceTextChannelPool',
     'VoiceTextLibvtNotFound',
     'VoiceTextLicenseNotFound',
     'VoiceTextRuntimeError',
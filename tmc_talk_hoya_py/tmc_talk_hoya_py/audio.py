@@ -0,0 +1,350 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+# -*- coding: utf-8 -*-
+u"""Audio outputs other than PulseAudio
+
+Every output plays S16LE like AudioOut, 16kHz mono unless the rate and the
+channels are given, and declares realtime, whether a write is paced by the
+playback, and buffer_time, the seconds of audio it buffers ahead of the
+playback.
+"""
+import fcntl
+import io
+import os
+import stat
+import struct
+import time
+import wave
+
+from tmc_talk_hoya_py import codec
+
+# OSS ioctls, see sys/soundcard.h
+SNDCTL_DSP_RESET = 0x5000
+SNDCTL_DSP_SYNC = 0x5001
+SNDCTL_DSP_SPEED = 0xC0045002
+SNDCTL_DSP_SETFMT = 0xC0045005
+SNDCTL_DSP_CHANNELS = 0xC0045006
+SNDCTL_DSP_SETFRAGMENT = 0xC004500A
+SNDCTL_DSP_GETODELAY = 0x80045017
+AFMT_S16_LE = 0x00000010
+
+
+class AudioOutError(RuntimeError):
+    pass
+
+
+class AudioSink(object):
+    u"""Base of the audio outputs
+
+    latency() returns the seconds of audio written but not played yet, or
+    None if it is unknown.
+    """
+
+    realtime = True
+
+    def __init__(self, buffer_time=0.0, rate=16000, channels=1):
+        self._buffer_time = buffer_time
+        self._rate = rate
+        self._channels = channels
+        self._bytes_per_second = rate * channels * 2
+        self._written = 0
+
+    @property
+    def buffer_time(self):
+        return self._buffer_time
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def channels(self):
+        return self._channels
+
+    @property
+    def write_size(self):
+        u"""Bytes of audio to write at once, None for short blocks
+
+        A realtime output which is flushed on cancel is written in short
+        blocks, so that a cancel does not wait for a whole frame.
+        """
+        return None
+
+    @property
+    def written(self):
+        u"""Seconds of audio written to the output"""
+        return self._written / float(self._bytes_per_second)
+
+    def position(self):
+        u"""Seconds of audio played from the output, None if it is unknown"""
+        latency = self.latency()
+        if latency is None:
+            return None
+        return max(self.written - latency, 0.0)
+
+    def latency(self):
+        return 0.0
+
+    def drain(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def write(self, buf):
+        self._written += memoryview(buf).nbytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return True
+
+
+class PlayoutClock(object):
+    u"""Estimates the latency of an output which plays from the first write in real time"""
+
+    def __init__(self, bytes_per_second=32000):
+        self._end = 0.0
+        self._bytes_per_second = float(bytes_per_second)
+
+    def latency(self):
+        return max(self._end - time.monotonic(), 0.0)
+
+    def played(self, size):
+        self._end = max(self._end, time.monotonic()) + size / self._bytes_per_second
+
+    def wait(self, latency):
+        u"""Block until at most latency seconds are buffered"""
+        wait = self.latency() - latency
+        if wait > 0.0:
+            time.sleep(wait)
+
+    def reset(self):
+        self._end = 0.0
+
+
+class FileDescriptorOut(AudioSink):
+    u"""Writes to an OSS device or to the standard input of a player
+
+    path is opened unless a file descriptor fd is given.  An OSS device is
+    configured for S16LE at rate and channels with fragments of about
+    latency / 2 seconds and reports its delay.  For other files, e.g. a pipe to
+    "aplay -t raw -f S16_LE -r 16000 -c 1", the delay is estimated from the
+    time elapsed since the first write and a flush only forgets it.
+    """
+
+    def __init__(self, path='/dev/dsp', latency=0.05, fd=None, rate=16000, channels=1):
+        super(FileDescriptorOut, self).__init__(max(latency, 0.0), rate, channels)
+        self._owns_fd = fd is None
+        try:
+            self._fd = os.open(path, os.O_WRONLY) if fd is None else fd
+        except OSError as err:
+            raise AudioOutError("Failed to open " + path + ": " + str(err))
+        self._clock = PlayoutClock(self._bytes_per_second)
+        self._oss = stat.S_ISCHR(os.fstat(self._fd).st_mode) and self._setup_oss()
+
+    def _setup_oss(self):
+        fragment = max(int(self._buffer_time * self._bytes_per_second / 2), 16)
+        try:
+            # 2 fragments of 2^n bytes, which has to be set first
+            self._ioctl(SNDCTL_DSP_SETFRAGMENT, (2 << 16) | (fragment.bit_length() - 1))
+            self._ioctl(SNDCTL_DSP_SETFMT, AFMT_S16_LE)
+            self._ioctl(SNDCTL_DSP_CHANNELS, self._channels)
+            self._ioctl(SNDCTL_DSP_SPEED, self._rate)
+        except OSError:
+            return False
+        return True
+
+    def _ioctl(self, request, value=0):
+        return struct.unpack('i', fcntl.ioctl(self._fd, request, struct.pack('i', value)))[0]
+
+    def latency(self):
+        if self._oss:
+            try:
+                return self._ioctl(SNDCTL_DSP_GETODELAY) / float(self._bytes_per_second)
+            except OSError:
+                return None
+        return self._clock.latency()
+
+    def drain(self):
+        if self._oss:
+            self._ioctl(SNDCTL_DSP_SYNC)
+        else:
+            time.sleep(self._clock.latency())
+
+    def flush(self):
+        if self._oss:
+            self._ioctl(SNDCTL_DSP_RESET)
+        self._clock.reset()
+
+    def write(self, buf):
+        view = memoryview(buf).cast('B')
+        size = view.nbytes
+        while view:
+            view = view[os.write(self._fd, view):]
+        self._clock.played(size)
+        self._written += size
+
+    def __exit__(self, *args):
+        if self._owns_fd:
+            os.close(self._fd)
+        return True
+
+
+class FileOut(AudioSink):
+    u"""Writes the audio to a WAV file, or to a raw PCM file unless path ends with .wav
+
+    The file is written as fast as the audio is queued, without buffering.
+    """
+
+    realtime = False
+
+    def __init__(self, path, wav=None, rate=16000, channels=1):
+        super(FileOut, self).__init__(rate=rate, channels=channels)
+        if wav is None:
+            wav = path.lower().endswith('.wav')
+        try:
+            if wav:
+                self._file = wave.open(path, 'wb')
+                self._file.setnchannels(channels)
+                self._file.setsampwidth(2)
+                self._file.setframerate(rate)
+            else:
+                self._file = open(path, 'wb')
+        except OSError as err:
+            raise AudioOutError("Failed to open " + path + ": " + str(err))
+        self._write = self._file.writeframes if wav else self._file.write
+
+    @property
+    def write_size(self):
+        return io.DEFAULT_BUFFER_SIZE
+
+    def write(self, buf):
+        view = memoryview(buf).cast('B')
+        self._write(view)
+        self._written += view.nbytes
+
+    def __exit__(self, *args):
+        self._file.close()
+        return True
+
+
+class NullOut(AudioSink):
+    u"""Discards the audio
+
+    With realtime, a write blocks while more than latency seconds are
+    buffered, as if the audio were played, which is what a benchmark of the
+    scheduling needs.  Otherwise the audio is discarded immediately.
+    """
+
+    def __init__(self, latency=0.05, realtime=False, rate=16000, channels=1):
+        super(NullOut, self).__init__(max(latency, 0.0) if realtime else 0.0, rate, channels)
+        self.realtime = realtime
+        self._clock = PlayoutClock(self._bytes_per_second)
+
+    @property
+    def write_size(self):
+        if not self.realtime:
+            return io.DEFAULT_BUFFER_SIZE
+        # The buffer, in whole samples
+        return max(int(self._buffer_time * self._rate), 1) * self._channels * 2
+
+    def latency(self):
+        return self._clock.latency() if self.realtime else 0.0
+
+    def drain(self):
+        time.sleep(self.latency())
+
+    def flush(self):
+        self._clock.reset()
+
+    def write(self, buf):
+        if self.realtime:
+            self._clock.wait(self._buffer_time)
+            self._clock.played(memoryview(buf).nbytes)
+        self._written += memoryview(buf).nbytes
+
+
+class TopicOut(AudioSink):
+    u"""Publishes the audio in chunks of at most chunk_size bytes of PCM
+
+    publish(seq, data, flush) sends a chunk, data being a memoryview of
+    bytes in encoding of codec, and a flush is sent as an empty chunk.  Every
+    chunk is decoded on its own, see codec.Encoder.encode_chunk.  The
+    remote player is assumed to play in real time from the first chunk, so a
+    write blocks while more than latency seconds are published ahead of it.
+    """
+
+    def __init__(self, publish, chunk_size=3200, latency=0.2,
+                 encoding=codec.ENCODING_S16LE):
+        super(TopicOut, self).__init__(max(latency, 0.0))
+        self._publish = publish
+        # Whole samples, and whole ADPCM bytes
+        self._chunk_size = max(chunk_size - chunk_size % 4, 4)
+        self._clock = PlayoutClock()
+        self._seq = 0
+        self._encoder = codec.Encoder(encoding)
+
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+
+    @property
+    def write_size(self):
+        return self._chunk_size
+
+    @property
+    def encoding(self):
+        return self._encoder.encoding
+
+    def latency(self):
+        return self._clock.latency()
+
+    def drain(self):
+        time.sleep(self._clock.latency())
+
+    def flush(self):
+        self._send(memoryview(b''), True)
+        self._clock.reset()
+        self._encoder.reset()
+
+    def write(self, buf):
+        self._clock.wait(self._buffer_time)
+        view = memoryview(buf).cast('B')
+        for offset in range(0, len(view), self._chunk_size):
+            chunk = view[offset:offset + self._chunk_size]
+            if self._encoder.encoding != codec.ENCODING_S16LE:
+                chunk = memoryview(self._encoder.encode_chunk(chunk))
+            self._send(chunk, False)
+        self._clock.played(len(view))
+        self._written += len(view)
+
+    def _send(self, data, flush):
+        self._publish(self._seq, data, flush)
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
@@ -0,0 +1,250 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+# -*- coding: utf-8 -*-
+u"""Batch rendering of sentences to audio files
+
+The manifest is a JSONL file with one object per line, or a CSV file with a
+header line, with the following fields.  Only sentence is required.
+
+    sentence  text to synthesize
+    voice     VoiceText voice, e.g. haruka or julie (default: haruka)
+    output    output filename, relative to the output directory
+              (default: content hash and the extension of the format)
+    format    one of FORMATS, e.g. s16pcm_wave (default: s16pcm_wave)
+    pitch, speed, volume, pause
+              prosody given to VT_TextToFile (default: -1)
+
+Outputs whose content hash, stored next to them with the .sha1 suffix,
+matches the manifest entry are skipped.  Invalid rows are reported with
+their line number and counted as failed, the others are rendered.
+"""
+import argparse
+import collections
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from .voicetext import (
+    VoiceText,
+    VoiceTextRuntimeError
+)
+
+FORMATS = {
+    name[len('VT_FILE_API_FMT_'):].lower(): value
+    for name, value in vars(VoiceText).items()
+    if name.startswith('VT_FILE_API_FMT_')
+}
+
+_EXTENSIONS = {
+    VoiceText.VT_FILE_API_FMT_S16PCM: '.pcm',
+    VoiceText.VT_FILE_API_FMT_ALAW: '.alaw',
+    VoiceText.VT_FILE_API_FMT_MULAW: '.ulaw',
+    VoiceText.VT_FILE_API_FMT_DADPCM: '.vox',
+    VoiceText.VT_FILE_API_FMT_S16PCM_WAVE: '.wav',
+    VoiceText.VT_FILE_API_FMT_U08PCM_WAVE: '.wav',
+    VoiceText.VT_FILE_API_FMT_ALAW_WAVE: '.wav',
+    VoiceText.VT_FILE_API_FMT_MULAW_WAVE: '.wav',
+    VoiceText.VT_FILE_API_FMT_MULAW_AU: '.au',
+}
+
+RenderJob = collections.namedtuple(
+    'RenderJob',
+    ['sentence', 'voice', 'output', 'format', 'pitch', 'speed', 'volume', 'pause'])
+
+
+def make_job(sentence, voice='haruka', output=None, format='s16pcm_wave',
+             pitch=-1, speed=-1, volume=-1, pause=-1):
+    if format not in FORMATS:
+        raise ValueError('Unknown format {0}, use one of {1}'.format(
+            format, ', '.join(sorted(FORMATS))))
+    job = RenderJob(sentence, voice, output, FORMATS[format],
+                    int(pitch), int(speed), int(volume), int(pause))
+    if not output:
+        job = job._replace(output=content_hash(job) + _EXTENSIONS[job.format])
+    return job
+
+
+def content_hash(job):
+    u"""Hash of everything that affects the rendered audio of job"""
+    content = [job.sentence, job.voice, job.format,
+               job.pitch, job.speed, job.volume, job.pause]
+    return hashlib.sha1(json.dumps(content).encode('utf-8')).hexdigest()
+
+
+def _make_row_job(row):
+    if not isinstance(row, dict):
+        raise ValueError('A row must be an object')
+    unknown = [str(key) for key in row if key not in RenderJob._fields]
+    if unknown:
+        # CSV cells without a header have the key None
+        raise ValueError('Unknown field {0}'.format(', '.join(unknown)))
+    if not row.get('sentence'):
+        raise ValueError('sentence is required')
+    # Empty CSV cells take the default value
+    return make_job(**{key: value for key, value in row.items() if value not in (None, '')})
+
+
+def load_manifest(filename, on_error=None):
+    u"""Read the RenderJobs of a JSONL or CSV manifest
+
+    Invalid rows are skipped and on_error(line, message) is called with
+    their line number, or ValueError is raised if on_error is None.
+    """
+    jobs = []
+    with open(filename, newline='', encoding='utf-8') as f:
+        if filename.endswith('.csv'):
+            reader = csv.DictReader(f)
+            rows = ((reader.line_num, row) for row in reader)
+        else:
+            rows = ((line, text) for line, text in enumerate(f, 1) if text.strip())
+        for line, row in rows:
+            try:
+                if not isinstance(row, dict):
+                    row = json.loads(row)
+                jobs.append(_make_row_job(row))
+            except (TypeError, ValueError) as err:
+                if on_error is None:
+                    raise ValueError('{0}:{1}: {2}'.format(filename, line, err))
+                on_error(line, str(err))
+    return jobs
+
+
+_engines = {}
+_options = {}
+
+
+def _init_worker(path, iotype):
+    _options['path'] = path
+    _options['iotype'] = iotype
+    _engines.clear()
+
+
+def _render(job, output_dir):
+    filename = os.path.join(output_dir, job.output)
+    digest = content_hash(job)
+    try:
+        with open(filename + '.sha1') as f:
+            if os.path.exists(filename) and f.read().strip() == digest:
+                return job, 'skipped', 0
+    except OSError:
+        pass
+    try:
+        vt = _engines.get(job.voice)
+        if vt is None:
+            # Every process loads each voice once
+            vt = VoiceText(_options['path'], voice=job.voice, iotype=_options['iotype'])
+            _engines[job.voice] = vt
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        tmp = '{0}.{1}.tmp'.format(filename, os.getpid())
+        try:
+            if not vt.to_file(job.sentence, tmp, format=job.format,
+                              pitch=job.pitch, speed=job.speed,
+                              volume=job.volume, pause=job.pause):
+                return job, 'empty sentence', 0
+            os.replace(tmp, filename)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with open(filename + '.sha1', 'w') as f:
+            f.write(digest + '\n')
+        return job, 'rendered', os.path.getsize(filename)
+    except (VoiceTextRuntimeError, UnicodeEncodeError, OSError) as err:
+        return job, str(err), 0
+
+
+def render(jobs, output_dir='.', path='/opt/tmc/vt', iotype='RAMIO',
+           processes=None, on_result=None):
+    u"""Render jobs in processes worker processes and return the statistics
+
+    processes=None uses one process per CPU and processes=0 renders in the
+    calling process.  on_result(job, status) is called for every job.
+    """
+    stats = {'rendered': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+    start = time.monotonic()
+    args = [(job, output_dir) for job in jobs]
+    if processes == 0:
+        _init_worker(path, iotype)
+        results = (_render(*arg) for arg in args)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, (path, iotype))
+        results = pool.imap_unordered(_render_args, args)
+    try:
+        for job, status, size in results:
+            if status in stats:
+                stats[status] += 1
+            else:
+                stats['failed'] += 1
+            stats['bytes'] += size
+            if on_result is not None:
+                on_result(job, status)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    stats['seconds'] = time.monotonic() - start
+    stats['jobs_per_second'] = len(args) / stats['seconds'] if stats['seconds'] > 0.0 else 0.0
+    return stats
+
+
+def _render_args(args):
+    return _render(*args)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Render the sentences of a manifest to audio files.')
+    parser.add_argument('manifest', help='JSONL or CSV manifest')
+    parser.add_argument('-o', '--output-dir', default='.', help='directory of the outputs')
+    parser.add_argument('--path', default='/opt/tmc/vt', help='root path of VoiceText')
+    parser.add_argument('--iotype', default='RAMIO', help='IO type of the VoiceText library')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    options = parser.parse_args(args)
+
+    def report(job, status):
+        if status not in ('rendered', 'skipped'):
+            print('{0}: {1}'.format(job.output, status), file=sys.stderr)
+
+    def report_row(line, message):
+        print('{0}:{1}: {2}'.format(options.manifest, line, message), file=sys.stderr)
+        invalid.append(line)
+
+    invalid = []
+    stats = render(load_manifest(options.manifest, on_error=report_row),
+                   output_dir=options.output_dir, path=options.path, iotype=options.iotype,
+                   processes=options.jobs, on_result=report)
+    stats['failed'] += len(invalid)
+    print('rendered {rendered}, skipped {skipped}, failed {failed} in {seconds:.2f} s '
+          '({jobs_per_second:.1f} sentences/s, {bytes} bytes)'.format(**stats))
+    return 1 if stats['failed'] else 0
@@ -0,0 +1,125 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+# -*- coding: utf-8 -*-
+u"""Capture of the talk requests received by the node, to replay them offline
+
+Every request is a line of JSON with the seconds since the start of the
+capture, its kind (TOPIC or ACTION) and the fields of its Voice.  Files
+whose name ends with .gz are compressed.
+"""
+import gzip
+import json
+import threading
+import time
+
+TOPIC = 'topic'
+ACTION = 'action'
+
+# Fields of tmc_voice_msgs/Voice, deadline is in seconds
+VOICE_FIELDS = ('sentence', 'language', 'interrupting', 'queueing', 'priority',
+                'deadline', 'pitch', 'speed', 'volume', 'pause')
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def voice_to_dict(data):
+    u"""Fields of a Voice message as JSON values"""
+    fields = {}
+    for name in VOICE_FIELDS:
+        value = getattr(data, name)
+        if name == 'deadline':
+            value = value.sec + value.nanosec * 1e-9
+        fields[name] = value
+    return fields
+
+
+def dict_to_voice(fields, voice_type):
+    u"""Voice message of voice_type from fields, missing ones keep their defaults"""
+    data = voice_type()
+    for name in VOICE_FIELDS:
+        if name not in fields:
+            continue
+        if name == 'deadline':
+            nanoseconds = int(round(fields[name] * 1e9))
+            data.deadline.sec, data.deadline.nanosec = divmod(nanoseconds, 1000000000)
+        else:
+            setattr(data, name, fields[name])
+    return data
+
+
+class TrafficRecorder(object):
+    u"""Writes the talk requests with their time of arrival to path
+
+    The file is overwritten, and flushed after every request so that a
+    capture survives a crash of the node.
+    """
+
+    def __init__(self, path):
+        self._file = _open(path, 'w')
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def count(self):
+        return self._count
+
+    def record(self, kind, data):
+        entry = {'time': round(time.monotonic() - self._start, 6),
+                 'kind': kind,
+                 'data': voice_to_dict(data)}
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + '\n')
+            self._file.flush()
+            self._count += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_traffic(path):
+    u"""Return the requests of a capture as dicts of time, kind and data, by time"""
+    with _open(path, 'r') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return sorted(entries, key=lambda entry: entry['time'])
@@ -0,0 +1,289 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+# -*- coding: utf-8 -*-
+u"""Compression of 16kHz mono S16LE PCM for the cache and the audio stream
+
+A-law and mu-law (G.711) halve the size and are converted with lookup tables
+on whole frames.  IMA ADPCM quarters it, but every sample depends on the
+previous one, so it is converted by audioop when the interpreter still has
+it and sample by sample otherwise.  The values of the encodings are those of
+tmc_voice_msgs/AudioChunk.
+"""
+import struct
+import warnings
+
+import numpy
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        import audioop
+except ImportError:
+    # Removed in Python 3.13
+    audioop = None
+
+ENCODING_S16LE = 0
+ENCODING_ALAW = 1
+ENCODING_MULAW = 2
+ENCODING_IMA_ADPCM = 3
+
+# State of the decoder at the head of an IMA ADPCM chunk, as in the blocks of
+# IMA ADPCM WAV files: the predicted sample, the step index and a zero byte
+ADPCM_HEADER = struct.Struct('<hBx')
+
+# Names of the encodings in the node parameters
+ENCODINGS = {
+    's16le': ENCODING_S16LE,
+    'alaw': ENCODING_ALAW,
+    'mulaw': ENCODING_MULAW,
+    'adpcm': ENCODING_IMA_ADPCM,
+}
+
+_INDEX_TABLE = (-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8)
+_STEPSIZE_TABLE = (
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41,
+    45, 50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190,
+    209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724,
+    796, 876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272,
+    2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132,
+    7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500,
+    20350, 22385, 24623, 27086, 29794, 32767)
+
+
+def bytes_per_second(encoding):
+    if encoding == ENCODING_S16LE:
+        return 32000
+    elif encoding == ENCODING_IMA_ADPCM:
+        return 8000
+    return 16000
+
+
+def _alaw_tables():
+    # ITU-T G.711 as in the reference implementation of Sun Microsystems
+    samples = numpy.arange(-32768, 32768, dtype=numpy.int32) >> 3
+    mask = numpy.where(samples >= 0, 0xD5, 0x55)
+    samples = numpy.where(samples >= 0, samples, -samples - 1)
+    segment = numpy.searchsorted(
+        numpy.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF]), samples)
+    mantissa = numpy.where(segment < 2, samples >> 1, samples >> numpy.minimum(segment, 7)) & 0xF
+    alaw = numpy.where(segment >= 8, 0x7F, (numpy.minimum(segment, 7) << 4) | mantissa) ^ mask
+
+    codes = numpy.arange(256, dtype=numpy.int32) ^ 0x55
+    segment = (codes & 0x70) >> 4
+    linear = ((codes & 0xF) << 4) + numpy.where(segment == 0, 8, 0x108)
+    linear = numpy.where(segment > 1, linear << numpy.maximum(segment - 1, 0), linear)
+    linear = numpy.where(codes & 0x80, linear, -linear)
+    return _encode_table(alaw), linear.astype('<i2')
+
+
+def _mulaw_tables():
+    samples = numpy.arange(-32768, 32768, dtype=numpy.int32) >> 2
+    mask = numpy.where(samples < 0, 0x7F, 0xFF)
+    samples = numpy.minimum(numpy.abs(samples), 8159) + 0x21
+    segment = numpy.searchsorted(
+        numpy.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF]), samples)
+    mantissa = (samples >> (numpy.minimum(segment, 7) + 1)) & 0xF
+    mulaw = numpy.where(segment >= 8, 0x7F, (numpy.minimum(segment, 7) << 4) | mantissa) ^ mask
+
+    codes = ~numpy.arange(256, dtype=numpy.int32) & 0xFF
+    linear = (((codes & 0xF) << 3) + 0x84) << ((codes & 0x70) >> 4)
+    linear = numpy.where(codes & 0x80, 0x84 - linear, linear - 0x84)
+    return _encode_table(mulaw), linear.astype('<i2')
+
+
+def _encode_table(codes):
+    u"""Index the codes of the samples from -32768 by the samples as uint16"""
+    return numpy.roll(codes.astype(numpy.uint8), -32768)
+
+
+_TABLES = {
+    ENCODING_ALAW: _alaw_tables(),
+    ENCODING_MULAW: _mulaw_tables(),
+}
+
+
+def _samples(pcm):
+    return numpy.frombuffer(pcm, dtype='<u2')
+
+
+def _lin2adpcm(pcm, state):
+    if audioop is not None:
+        return audioop.lin2adpcm(pcm, 2, state)
+    valpred, index = state or (0, 0)
+    step = _STEPSIZE_TABLE[index]
+    out = bytearray()
+    high = None
+    for value in numpy.frombuffer(pcm, dtype='<i2').tolist():
+        diff = value - valpred
+        sign = 8 if diff < 0 else 0
+        diff = abs(diff)
+        delta = 0
+        vpdiff = step >> 3
+        if diff >= step:
+            delta = 4
+            diff -= step
+            vpdiff += step
+        step >>= 1
+        if diff >= step:
+            delta |= 2
+            diff -= step
+            vpdiff += step
+        step >>= 1
+        if diff >= step:
+            delta |= 1
+            vpdiff += step
+        valpred = valpred - vpdiff if sign else valpred + vpdiff
+        valpred = min(max(valpred, -32768), 32767)
+        delta |= sign
+        index = min(max(index + _INDEX_TABLE[delta], 0), 88)
+        step = _STEPSIZE_TABLE[index]
+        if high is None:
+            high = delta << 4
+        else:
+            out.append(high | delta)
+            high = None
+    return bytes(out), (valpred, index)
+
+
+def _adpcm2lin(data, state):
+    if audioop is not None:
+        return audioop.adpcm2lin(data, 2, state)
+    valpred, index = state or (0, 0)
+    step = _STEPSIZE_TABLE[index]
+    out = numpy.empty(len(data) * 2, dtype='<i2')
+    position = 0
+    for byte in data:
+        for delta in (byte >> 4, byte & 0xF):
+            index = min(max(index + _INDEX_TABLE[delta], 0), 88)
+            vpdiff = step >> 3
+            if delta & 4:
+                vpdiff += step
+            if delta & 2:
+                vpdiff += step >> 1
+            if delta & 1:
+                vpdiff += step >> 2
+            valpred = valpred - vpdiff if delta & 8 else valpred + vpdiff
+            valpred = min(max(valpred, -32768), 32767)
+            step = _STEPSIZE_TABLE[index]
+            out[position] = valpred
+            position += 1
+    return out.tobytes(), (valpred, index)
+
+
+class Encoder(object):
+    u"""Encodes the frames of a stream of S16LE PCM
+
+    An ADPCM byte holds 2 samples, so an odd sample waits for the next
+    frame, or is padded with silence by flush.
+    """
+
+    def __init__(self, encoding=ENCODING_S16LE):
+        if encoding not in ENCODINGS.values():
+            raise ValueError("Unknown encoding: " + str(encoding))
+        self._encoding = encoding
+        self.reset()
+
+    @property
+    def encoding(self):
+        return self._encoding
+
+    def reset(self):
+        self._state = None
+        self._pending = b''
+
+    def encode(self, pcm):
+        if self._encoding == ENCODING_S16LE:
+            return bytes(pcm)
+        elif self._encoding == ENCODING_IMA_ADPCM:
+            pcm = self._pending + memoryview(pcm).cast('B')
+            self._pending = pcm[len(pcm) & ~3:]
+            data, self._state = _lin2adpcm(pcm[:len(pcm) & ~3], self._state)
+            return data
+        return _TABLES[self._encoding][0][_samples(pcm)].tobytes()
+
+    def encode_chunk(self, pcm):
+        u"""Encode pcm as a chunk of a stream which Decoder.decode_chunk decodes on its own
+
+        An IMA ADPCM chunk starts with ADPCM_HEADER, so that the chunks
+        which follow a lost one are decoded correctly.
+        """
+        if self._encoding != ENCODING_IMA_ADPCM:
+            return self.encode(pcm)
+        header = ADPCM_HEADER.pack(*(self._state or (0, 0)))
+        return header + self.encode(pcm)
+
+    def flush(self):
+        u"""Encode the pending sample, if any"""
+        if not self._pending:
+            return b''
+        return self.encode(b'\x00\x00')
+
+
+class Decoder(object):
+    u"""Decodes the frames of a stream encoded by Encoder to S16LE PCM"""
+
+    def __init__(self, encoding=ENCODING_S16LE):
+        if encoding not in ENCODINGS.values():
+            raise ValueError("Unknown encoding: " + str(encoding))
+        self._encoding = encoding
+        self.reset()
+
+    @property
+    def encoding(self):
+        return self._encoding
+
+    def reset(self):
+        self._state = None
+
+    def decode(self, data):
+        if self._encoding == ENCODING_S16LE:
+            return bytes(data)
+        elif self._encoding == ENCODING_IMA_ADPCM:
+            pcm, self._state = _adpcm2lin(bytes(data), self._state)
+            return pcm
+        return _TABLES[self._encoding][1][numpy.frombuffer(data, dtype=numpy.uint8)].tobytes()
+
+    def decode_chunk(self, data):
+        u"""Decode a chunk encoded by Encoder.encode_chunk"""
+        if self._encoding != ENCODING_IMA_ADPCM:
+            return self.decode(data)
+        if len(data) < ADPCM_HEADER.size:
+            raise ValueError("IMA ADPCM chunk without header")
+        self._state = ADPCM_HEADER.unpack_from(data)
+        return self.decode(memoryview(data)[ADPCM_HEADER.size:])
+
+
+def encode(pcm, encoding):
+    u"""Encode a whole utterance"""
+    encoder = Encoder(encoding)
+    return encoder.encode(pcm) + encoder.flush()
+
+
+def decode(data, encoding):
+    u"""Decode a whole utterance"""
+    return Decoder(encoding).decode(data)
@@ -0,0 +1,209 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+# -*- coding: utf-8 -*-
+u"""Post-processing of the 16kHz mono S16LE frames before they are written
+
+AudioProcessor applies a gain and short fade ramps at the start of an
+utterance and on cancel, and converts the frames to the rate and the
+channels of the output, so that a device can be driven at its native rate
+without a resampling by PulseAudio.  Without conversion, the frames are
+processed in place when their buffer is writable.
+"""
+import math
+
+import numpy
+
+SAMPLE_RATE = 16000
+
+
+def lowpass_filter(up, down, taps_per_phase=16):
+    u"""Kaiser windowed sinc for a rate change of up / down, with a gain of up"""
+    length = taps_per_phase * up
+    # Relative to the Nyquist frequency of the upsampled signal
+    cutoff = 0.95 / max(up, down)
+    n = numpy.arange(length) - (length - 1) / 2.0
+    taps = numpy.sinc(cutoff * n) * numpy.kaiser(length, 8.0)
+    return taps * (up / taps.sum())
+
+
+class Resampler(object):
+    u"""Polyphase resampler of a stream of float frames from rate_in to rate_out
+
+    Only the taps of the phase of every output sample are computed, and the
+    last input samples are kept for the next frame.
+    """
+
+    def __init__(self, rate_in, rate_out, taps_per_phase=16):
+        divisor = math.gcd(rate_in, rate_out)
+        self._up = rate_out // divisor
+        self._down = rate_in // divisor
+        self._taps = taps_per_phase
+        # phases[p, k] is applied to x[t // up - k] for the upsampled index t
+        self._phases = lowpass_filter(
+            self._up, self._down, taps_per_phase).reshape(taps_per_phase, self._up).T
+        self.reset()
+
+    @property
+    def taps(self):
+        return self._taps
+
+    def reset(self, history=None):
+        u"""Forget the stream, or continue it after the input samples of history"""
+        self._history = numpy.zeros(self._taps - 1, numpy.float32)
+        if history is not None and len(history):
+            history = history[-len(self._history):]
+            self._history[len(self._history) - len(history):] = history
+        self._t = 0
+
+    def process(self, x):
+        buf = numpy.concatenate((self._history, x))
+        end = len(x) * self._up
+        t = numpy.arange(self._t, end, self._down)
+        indices = (t // self._up + self._taps - 1)[:, None] - numpy.arange(self._taps)
+        y = numpy.einsum('ij,ij->i', buf[indices], self._phases[t % self._up])
+        self._t += len(t) * self._down - end
+        self._history = buf[len(buf) - len(self._history):]
+        return y
+
+
+class AudioProcessor(object):
+    u"""Gain, fade ramps and conversion to rate and channels of the frames
+
+    gain can be changed at any time.  fade_time is the length of the ramps
+    in seconds, 0 to disable them.  The last history_time seconds of the
+    input are kept to fade out from the position of the playback on cancel.
+    """
+
+    def __init__(self, rate=SAMPLE_RATE, channels=1, gain=1.0, fade_time=0.0,
+                 history_time=0.0):
+        self.gain = gain
+        self._rate = rate
+        self._channels = channels
+        self._fade = int(max(fade_time, 0.0) * SAMPLE_RATE)
+        self._resampler = None
+        if rate != SAMPLE_RATE:
+            self._resampler = Resampler(SAMPLE_RATE, rate)
+        self._tail = numpy.zeros(int(max(history_time, 0.0) * SAMPLE_RATE) if self._fade else 0,
+                                 numpy.int16)
+        self._tail_end = 0
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def channels(self):
+        return self._channels
+
+    @property
+    def fades(self):
+        u"""Whether the playback is faded out on cancel"""
+        return len(self._tail) > 0
+
+    @property
+    def converts(self):
+        return self._resampler is not None or self._channels != 1
+
+    def process(self, frame, fade_in=False):
+        u"""Return frame processed for the output, which is frame itself if it is writable"""
+        fade = self._fade if fade_in else 0
+        if self.fades:
+            self._remember(numpy.frombuffer(frame, numpy.int16))
+        if self.gain == 1.0 and not fade and not self.converts:
+            return frame
+        readonly = memoryview(frame).readonly
+        samples = numpy.frombuffer(frame, numpy.int16)
+        x = samples.astype(numpy.float32)
+        if self.gain != 1.0:
+            x *= self.gain
+        if fade:
+            ramp = numpy.linspace(0.0, 1.0, min(fade, len(x)), endpoint=False)
+            x[:len(ramp)] *= ramp
+        if self.converts:
+            return self._convert(x)
+        if readonly:
+            return _to_pcm(x)
+        samples[:] = numpy.clip(numpy.rint(x, out=x), -32768, 32767, out=x)
+        return frame
+
+    def fade_out(self, unplayed):
+        u"""Return the audio after unplayed seconds from the end, ramped down to silence
+
+        Written after a flush, it ends what was being played without a
+        click.  None if unplayed is unknown or nothing is left to fade out.
+        """
+        if not self.fades or unplayed is None:
+            return None
+        offset = min(int(round(unplayed * SAMPLE_RATE)), len(self._tail), self._tail_end)
+        count = min(self._fade, offset)
+        if count == 0:
+            return None
+        x = self._recall(offset, count).astype(numpy.float32)
+        x *= numpy.linspace(1.0, 0.0, count) * self.gain
+        if self._resampler is not None:
+            # Continue the stream at the position of the playback
+            history = self._recall(offset + self._resampler.taps - 1, self._resampler.taps - 1)
+            self._resampler.reset(history.astype(numpy.float32) * self.gain)
+        self._tail_end -= offset
+        self._remember(_to_pcm(x.copy()))
+        if self.converts:
+            return self._convert(x)
+        return _to_pcm(x)
+
+    def reset(self):
+        u"""Forget the stream, e.g. after a flush without fade out"""
+        if self._resampler is not None:
+            self._resampler.reset()
+        self._tail_end = 0
+
+    def _convert(self, x):
+        if self._resampler is not None:
+            x = self._resampler.process(x)
+        pcm = _to_pcm(x)
+        if self._channels != 1:
+            pcm = numpy.repeat(pcm, self._channels)
+        return pcm
+
+    def _remember(self, samples):
+        size = len(self._tail)
+        samples = samples[len(samples) - min(len(samples), size):]
+        start = self._tail_end % size
+        first = min(len(samples), size - start)
+        self._tail[start:start + first] = samples[:first]
+        self._tail[:len(samples) - first] = samples[first:]
+        self._tail_end += len(samples)
+
+    def _recall(self, offset, count):
+        u"""count input samples from offset samples before the end"""
+        offset = min(offset, len(self._tail), self._tail_end)
+        indices = (self._tail_end - offset + numpy.arange(min(count, offset))) % len(self._tail)
+        return self._tail[indices]
+
+
+def _to_pcm(x):
+    return numpy.clip(numpy.rint(x, out=x), -32768, 32767, out=x).astype(numpy.int16)
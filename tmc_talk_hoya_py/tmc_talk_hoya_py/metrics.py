@@ -0,0 +1,158 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+# -*- coding: utf-8 -*-
+import bisect
+import threading
+import time
+
+
+class Trace(object):
+    u"""Timestamps of the stages of an utterance
+
+    The hooks of the pipeline record the first time of every stage, except
+    LAST_WRITTEN which is updated on every frame.  Times are time.monotonic().
+    """
+
+    RECEIVED = 'received'
+    STARTED = 'started'
+    ENCODED = 'encoded'
+    SYNTHESIZED = 'synthesized'
+    WRITTEN = 'written'
+    LAST_WRITTEN = 'last_written'
+    DRAINED = 'drained'
+
+    def __init__(self):
+        self.times = {self.RECEIVED: time.monotonic()}
+
+    def mark(self, stage):
+        if stage not in self.times:
+            self.times[stage] = time.monotonic()
+
+    def written(self):
+        now = time.monotonic()
+        if self.WRITTEN not in self.times:
+            self.times[self.WRITTEN] = now
+        self.times[self.LAST_WRITTEN] = now
+
+    def interval(self, start, end):
+        u"""Seconds from start to end, or None if a stage is not reached"""
+        if start not in self.times or end not in self.times:
+            return None
+        return self.times[end] - self.times[start]
+
+
+class LatencyHistogram(object):
+    u"""Counts of latencies in buckets bounded by BOUNDS seconds"""
+
+    BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+              1.0, 2.0, 5.0, 10.0, 20.0, 60.0)
+
+    def __init__(self, bounds=BOUNDS):
+        self._bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def bounds(self):
+        return self._bounds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        u"""Upper bound of the bucket of the q-quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self._bounds, self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class LatencyMetrics(object):
+    u"""Latency histograms of the intervals between the stages of Traces
+
+    The queueing delay, from the reception to the start by the scheduler, is
+    also recorded by priority to check the latency of every class.
+    """
+
+    INTERVALS = (
+        # Scheduler queue and engine loading
+        ('queueing', Trace.RECEIVED, Trace.ENCODED),
+        # libvt until the first frame
+        ('synthesis', Trace.ENCODED, Trace.SYNTHESIZED),
+        # Python queue until the writer thread
+        ('playback_queue', Trace.SYNTHESIZED, Trace.WRITTEN),
+        ('first_sound', Trace.RECEIVED, Trace.WRITTEN),
+        ('writing', Trace.WRITTEN, Trace.LAST_WRITTEN),
+        # PulseAudio buffer
+        ('drain', Trace.LAST_WRITTEN, Trace.DRAINED),
+        ('total', Trace.RECEIVED, Trace.DRAINED),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = dict(
+            (name, LatencyHistogram()) for name, _, _ in self.INTERVALS)
+
+    @property
+    def histograms(self):
+        return self._histograms
+
+    def add(self, trace, priority=None):
+        with self._lock:
+            for name, start, end in self.INTERVALS:
+                value = trace.interval(start, end)
+                if value is not None:
+                    self._histograms[name].add(value)
+            value = trace.interval(Trace.RECEIVED, Trace.STARTED)
+            if priority is not None and value is not None:
+                name = f'queueing_delay_priority_{priority}'
+                self._histograms.setdefault(name, LatencyHistogram()).add(value)
+
+    def summary(self):
+        u"""Return {interval: {count, mean, p50, p90, p99, max}}"""
+        with self._lock:
+            return dict(
+                (name, {'count': histogram.count,
+                        'mean': histogram.mean,
+                        'p50': histogram.quantile(0.5),
+                        'p90': histogram.quantile(0.9),
+                        'p99': histogram.quantile(0.99),
+                        'max': histogram.max})
+                for name, histogram in self._histograms.items())
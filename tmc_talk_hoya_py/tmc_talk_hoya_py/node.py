@@ -26,8 +26,17 @@ OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
 DAMAGE.
 '''
 # -*- coding: utf-8 -*-
+import resource
 import threading
+import time
+import wave
 
+from diagnostic_msgs.msg import (
+    DiagnosticArray,
+    DiagnosticStatus,
+    KeyValue
+)
+from rcl_interfaces.msg import SetParametersResult
 import rclpy
 from rclpy.action import (
     ActionServer,
@@ -38,63 +47,107 @@ from rclpy.callback_groups import ReentrantCallbackGroup
 from rclpy.duration import Duration
 from rclpy.executors import MultiThreadedExecutor
 from rclpy.node import Node
+from rclpy.parameter import Parameter
 from rclpy.qos import (
     QoSDurabilityPolicy,
     QoSProfile,
+    QoSReliabilityPolicy,
 )
+from rclpy.task import Future
 from std_msgs.msg import String
 
 from tmc_voice_msgs.action import TalkRequest
-from tmc_voice_msgs.msg import Voice
+from tmc_voice_msgs.msg import (
+    AudioChunk,
+    Voice
+)
+from tmc_voice_msgs.srv import PinPhrase
+import yaml
 
+from . import codec
+from .audio import AudioOutError
+from .capture import (
+    ACTION,
+    TOPIC,
+    TrafficRecorder
+)
+from .metrics import (
+    LatencyMetrics,
+    Trace
+)
+from .scheduler import (
+    Utterance,
+    UtteranceScheduler
+)
 from .voicetext import (
+    AUDIO_BACKENDS,
+    AudioPlayer,
+    find_voice,
+    is_valid_prosody,
+    Playback,
+    Prosody,
+    PROSODY_RANGES,
+    VoiceTextCache,
     VoiceTextRuntimeError,
     VoiceTextSpeaker
 )
 
 
 class VoiceTextNode(Node):
+    # Seconds before the load of an engine which failed is tried again
+    LOAD_RETRY_TIME = 10.0
+
     def __init__(self):
+        start = time.monotonic()
         super().__init__('text_to_speech')
 
-        self._pitch = self._get_voicetext_param('pitch', 50, 200)
-        self._speed = self._get_voicetext_param('speed', 50, 400)
-        self._volume = self._get_voicetext_param('volume', 0, 500)
-        self._pause = self._get_voicetext_param('pause', 0, 65535)
+        # Defaults of the requests, which can be changed with set_parameters
+        self._prosody = Prosody(**{
+            name: self._get_voicetext_param(name, *PROSODY_RANGES[name])
+            for name in PROSODY_RANGES})
+        self.add_on_set_parameters_callback(self._on_set_parameters)
 
-        root_path = self._get_root_path()
-        jpn_voice = self._get_voices('jpn_voice', ['haruka'])
-        for voice in jpn_voice:
-            try:
-                self._vt_jpn = VoiceTextSpeaker(path=root_path + '/vt', voice=voice)
-                self.get_logger().info(f'Voicetext {voice} is ready')
-                break
-            except VoiceTextRuntimeError as err:
-                self.get_logger().info(str(err))
-                self._vt_jpn = None
+        self._cache = self._get_cache()
+        self._recorder = self._get_recorder()
 
-        eng_voice = self._get_voices('eng_voice', ['julie'])
-        for voice in eng_voice:
-            try:
-                self._vt_eng = VoiceTextSpeaker(path=root_path + '/vt', voice=voice)
-                self.get_logger().info(f'Voicetext {voice} is ready')
-                break
-            except VoiceTextRuntimeError as err:
-                self.get_logger().info(str(err))
-                self._vt_eng = None
+        # Both languages and the earcon are mixed on the same stream
+        self._player = self._get_player()
+        self._earcon = self._get_earcon()
+        self.declare_parameter('synthesis_channels', 2)
+        self._channels = self.get_parameter('synthesis_channels').get_parameter_value().integer_value
+        # libvt in a worker process, restarted if it crashes
+        self.declare_parameter('synthesis_process', False)
+        self._isolated = self.get_parameter('synthesis_process').get_parameter_value().bool_value
+        self._vt_path = self._get_root_path() + '/vt'
+        # The engines are loaded on first use
+        self._voices = {
+            Voice.JAPANESE: self._find_voice('jpn_voice', ['haruka']),
+            Voice.ENGLISH: self._find_voice('eng_voice', ['julie']),
+        }
+        self._speakers = {}
+        self._speakers_lock = threading.Lock()
+        # One lock per language, held while its engine is loaded
+        self._load_locks = {}
+        # Time of the last failed load of each language
+        self._load_failures = {}
 
-        self._is_speaking = False
-        self._end_time = None
-        self._lock = threading.Lock()
+        queue_size = self._get_queue_size()
+        self._scheduler = UtteranceScheduler(
+            self._synthesize, self._play, self._stop,
+            max_queue=queue_size,
+            on_start=self._on_start,
+            on_idle=self._on_idle,
+            on_finish=self._on_finish,
+            on_progress=self._on_progress,
+            output_latency=self._player.buffer_time)
 
-        self._subscriber = self.create_subscription(Voice, 'talk_request', self._subscriber_callback, 1)
+        self._subscriber = self.create_subscription(
+            Voice, 'talk_request', self._subscriber_callback, max(queue_size, 1))
         self._publisher = self.create_publisher(
             String, 'talking_sentence',
             QoSProfile(depth=1, durability=QoSDurabilityPolicy.RMW_QOS_POLICY_DURABILITY_TRANSIENT_LOCAL))
         self._publisher.publish(String())
 
-        self._timer = self.create_timer(0.1, self._run)
-
         self._action_server = ActionServer(
             self,
             TalkRequest,
@@ -103,7 +156,34 @@ class VoiceTextNode(Node):
             goal_callback=self._goal_callback,
             cancel_callback=self._preempt_callback,
             callback_group=ReentrantCallbackGroup())
-        self._goal_handle = None
+
+        # Latency histograms, a period of 0 disables the instrumentation
+        self.declare_parameter('metrics_period', 10.0)
+        metrics_period = self.get_parameter('metrics_period').get_parameter_value().double_value
+        self._metrics = None
+        if metrics_period > 0.0:
+            self._metrics = LatencyMetrics()
+            self._metrics_publisher = self.create_publisher(DiagnosticArray, '/diagnostics', 1)
+            self._metrics_timer = self.create_timer(metrics_period, self._publish_metrics)
+
+        # Phrases synthesized in advance and pinned in memory, see _load_manifest
+        self._pin_service = self.create_service(
+            PinPhrase, 'pin_phrase', self._pin_phrase_callback,
+            callback_group=ReentrantCallbackGroup())
+        self.declare_parameter('phrase_manifest', '')
+        manifest = self.get_parameter('phrase_manifest').get_parameter_value().string_value
+        if manifest:
+            thread = threading.Thread(target=self._pin_manifest, args=(manifest,))
+            thread.daemon = True
+            thread.start()
+
+        self.get_logger().info(
+            f'Started in {time.monotonic() - start:.3f} s, max RSS {_max_rss_mib():.1f} MiB')
+        self.declare_parameter('warm_up', False)
+        if self.get_parameter('warm_up').get_parameter_value().bool_value:
+            thread = threading.Thread(target=self._warm_up)
+            thread.daemon = True
+            thread.start()
 
     def _get_voicetext_param(self, name, min_value, max_value):
         self.declare_parameter(name, -1)
@@ -113,125 +193,453 @@ class VoiceTextNode(Node):
         else:
             return -1
 
+    def _on_set_parameters(self, parameters):
+        prosody = {}
+        gain = None
+        for parameter in parameters:
+            if parameter.name == 'audio_gain':
+                if parameter.type_ != Parameter.Type.DOUBLE or parameter.value < 0.0:
+                    return SetParametersResult(
+                        successful=False, reason='audio_gain must be a non-negative double')
+                gain = parameter.value
+                continue
+            if parameter.name not in PROSODY_RANGES:
+                continue
+            if parameter.type_ != Parameter.Type.INTEGER:
+                return SetParametersResult(
+                    successful=False, reason=f'{parameter.name} must be an integer')
+            if not is_valid_prosody(parameter.name, parameter.value):
+                min_value, max_value = PROSODY_RANGES[parameter.name]
+                return SetParametersResult(
+                    successful=False,
+                    reason=f'{parameter.name} must be -1 or in [{min_value}, {max_value}]')
+            prosody[parameter.name] = parameter.value
+        # Takes effect from the next request, no engine is reloaded
+        self._prosody = self._prosody._replace(**prosody)
+        if gain is not None and hasattr(self, '_player'):
+            # From the next frame, without synthesis
+            self._player.gain = gain
+        return SetParametersResult(successful=True)
+
+    def _request_prosody(self, data):
+        for name in PROSODY_RANGES:
+            value = getattr(data, name)
+            if not is_valid_prosody(name, value):
+                self.get_logger().warn(f'{name} {value} of the request is out of range, ignored')
+        return self._prosody.override(data.pitch, data.speed, data.volume, data.pause)
+
     def _get_root_path(self):
         self.declare_parameter('root_path', '/opt/tmc')
         return self.get_parameter('root_path').get_parameter_value().string_value
 
+    def _get_cache(self):
+        self.declare_parameter('cache_size', 32 * 1024 * 1024)
+        self.declare_parameter('cache_path', '')
+        size = self.get_parameter('cache_size').get_parameter_value().integer_value
+        path = self.get_parameter('cache_path').get_parameter_value().string_value
+        if size <= 0 and not path:
+            # Only keeps the pinned phrases
+            return VoiceTextCache(max_bytes=0)
+        encoding = self._get_encoding('cache_encoding')
+        # 0 or less keeps the files without limit
+        self.declare_parameter('cache_disk_size', 256 * 1024 * 1024)
+        disk_size = self.get_parameter('cache_disk_size').get_parameter_value().integer_value
+        return VoiceTextCache(max_bytes=max(size, 0), path=path or None, encoding=encoding,
+                              max_disk_bytes=disk_size if disk_size > 0 else None)
+
+    def _get_recorder(self):
+        u"""Capture of the requests for test/replay_traffic.py, None if disabled"""
+        self.declare_parameter('capture_path', '')
+        path = self.get_parameter('capture_path').get_parameter_value().string_value
+        if not path:
+            return None
+        try:
+            recorder = TrafficRecorder(path)
+        except OSError as err:
+            self.get_logger().error(f'Failed to open the capture {path}: {err}')
+            return None
+        self.get_logger().info(f'Talk requests are captured to {path}')
+        return recorder
+
+    def _get_encoding(self, name):
+        self.declare_parameter(name, 's16le')
+        value = self.get_parameter(name).get_parameter_value().string_value
+        if value not in codec.ENCODINGS:
+            self.get_logger().error(f'Unknown {name} {value}, use s16le')
+            value = 's16le'
+        return codec.ENCODINGS[value]
+
+    def _get_queue_size(self):
+        self.declare_parameter('queue_size', 10)
+        return self.get_parameter('queue_size').get_parameter_value().integer_value
+
+    def _get_audio_options(self):
+        self.declare_parameter('audio_backend', 'pulse')
+        self.declare_parameter('audio_device', '')
+        self.declare_parameter('audio_latency', 0.05)
+        backend = self.get_parameter('audio_backend').get_parameter_value().string_value
+        device = self.get_parameter('audio_device').get_parameter_value().string_value
+        latency = self.get_parameter('audio_latency').get_parameter_value().double_value
+        pulse_options = {'latency': latency}
+        for name in ('tlength', 'prebuf', 'minreq'):
+            self.declare_parameter('audio_' + name, -1)
+            pulse_options[name] = self.get_parameter('audio_' + name).get_parameter_value().integer_value
+        if backend not in AUDIO_BACKENDS:
+            self.get_logger().error(f'Unknown audio backend {backend}, use pulse')
+            backend = 'pulse'
+        if backend == 'pulse':
+            options = pulse_options
+        elif backend == 'fd':
+            options = {'path': device or '/dev/dsp', 'latency': latency}
+        elif backend == 'file':
+            options = {'path': device or 'text_to_speech.wav'}
+        elif backend == 'topic':
+            # Played by audio_player nodes, possibly on other robots
+            self.declare_parameter('audio_chunk_size', 3200)
+            chunk_size = self.get_parameter('audio_chunk_size').get_parameter_value().integer_value
+            self._audio_publisher = self.create_publisher(
+                AudioChunk, device or 'talk_audio',
+                QoSProfile(depth=100, reliability=QoSReliabilityPolicy.RELIABLE))
+            self._audio_encoding = self._get_encoding('audio_encoding')
+            options = {'publish': self._publish_audio, 'chunk_size': chunk_size, 'latency': latency,
+                       'encoding': self._audio_encoding}
+        else:
+            options = {'latency': latency, 'realtime': True}
+        if backend != 'topic':
+            # The native format of the device, converted by the AudioPlayer
+            self.declare_parameter('audio_rate', 16000)
+            self.declare_parameter('audio_channels', 1)
+            options['rate'] = self.get_parameter('audio_rate').get_parameter_value().integer_value
+            options['channels'] = self.get_parameter('audio_channels').get_parameter_value().integer_value
+        options['backend'] = backend
+        return options
+
+    def _get_player(self):
+        options = self._get_audio_options()
+        self.declare_parameter('audio_gain', 1.0)
+        self.declare_parameter('audio_fade_time', 0.005)
+        gain = self.get_parameter('audio_gain').get_parameter_value().double_value
+        fade_time = self.get_parameter('audio_fade_time').get_parameter_value().double_value
+        max_queue_bytes = self._get_playback_queue_bytes()
+        try:
+            player = AudioPlayer(options, gain, fade_time, max_queue_bytes=max_queue_bytes)
+        except AudioOutError as err:
+            # Keep serving the requests without a sound server
+            self.get_logger().error(f'{err}, the audio is discarded')
+            options = {'backend': 'null', 'latency': 0.05, 'realtime': True}
+            player = AudioPlayer(options, gain, fade_time, max_queue_bytes=max_queue_bytes)
+        self.get_logger().info(
+            f'Audio backend {options["backend"]}, buffer {player.buffer_time:.3f} s, '
+            f'realtime {player.realtime}, rate {options.get("rate", 16000)} Hz, '
+            f'{options.get("channels", 1)} channels')
+        return player
+
+    def _get_playback_queue_bytes(self):
+        u"""Bytes of frames a speaker queues ahead of the playback, None for no limit"""
+        self.declare_parameter('playback_queue_time', 2.0)
+        self.declare_parameter('playback_queue_bytes', 0)
+        limits = [
+            int(self.get_parameter('playback_queue_time').get_parameter_value().double_value * 32000),
+            self.get_parameter('playback_queue_bytes').get_parameter_value().integer_value]
+        limits = [limit for limit in limits if limit > 0]
+        return min(limits) if limits else None
+
+    def _get_earcon(self):
+        self.declare_parameter('earcon', '')
+        self.declare_parameter('earcon_gain', 1.0)
+        path = self.get_parameter('earcon').get_parameter_value().string_value
+        gain = self.get_parameter('earcon_gain').get_parameter_value().double_value
+        if not path:
+            return None
+        try:
+            with wave.open(path) as wav:
+                if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) != (16000, 1, 2):
+                    self.get_logger().error(f'Earcon {path} is not 16kHz mono 16 bit, ignored')
+                    return None
+                pcm = wav.readframes(wav.getnframes())
+        except (OSError, EOFError, wave.Error) as err:
+            self.get_logger().error(f'Failed to read the earcon {path}: {err}')
+            return None
+        self._player.set_gain(AudioPlayer.EARCON, gain)
+        return pcm
+
+    def _publish_audio(self, seq, data, flush):
+        msg = AudioChunk()
+        msg.header.stamp = self.get_clock().now().to_msg()
+        msg.seq = seq
+        msg.sample_rate = 16000
+        msg.channels = 1
+        msg.encoding = self._audio_encoding
+        msg.flush = flush
+        # uint8[] is an array.array, which is assigned without conversion
+        msg.data.frombytes(data)
+        self._audio_publisher.publish(msg)
+
     def _get_voices(self, name, default_voices):
         self.declare_parameter(name, default_voices)
         return self.get_parameter(name).get_parameter_value().string_array_value
 
+    def _find_voice(self, name, default_voices):
+        for voice in self._get_voices(name, default_voices):
+            try:
+                find_voice(self._vt_path, voice)
+                self.get_logger().info(f'Voicetext {voice} is found')
+                return voice
+            except VoiceTextRuntimeError as err:
+                self.get_logger().info(str(err))
+        return None
+
+    def _load_manifest(self, path):
+        u"""Read the Voice messages of a YAML list of phrases
+
+        - sentence: Emergency stop.
+          language: english  # or japanese, the default
+          speed: 120         # pitch, speed, volume and pause are optional
+        """
+        with open(path) as f:
+            phrases = yaml.safe_load(f) or []
+        languages = {'japanese': Voice.JAPANESE, 'english': Voice.ENGLISH}
+        voices = []
+        for phrase in phrases:
+            data = Voice()
+            data.sentence = str(phrase['sentence'])
+            language = phrase.get('language', Voice.JAPANESE)
+            data.language = languages.get(language, language)
+            for name in PROSODY_RANGES:
+                setattr(data, name, int(phrase.get(name, -1)))
+            voices.append(data)
+        return voices
+
+    def _pin_manifest(self, path):
+        start = time.monotonic()
+        try:
+            phrases = self._load_manifest(path)
+        except (OSError, KeyError, TypeError, ValueError, AttributeError, yaml.YAMLError) as err:
+            self.get_logger().error(f'Failed to read the phrase manifest {path}: {err}')
+            return
+        pinned = 0
+        for data in phrases:
+            success, message = self._pin(data)
+            if success:
+                pinned += 1
+            else:
+                self.get_logger().error(f'Failed to pin "{data.sentence}": {message}')
+        self.get_logger().info(
+            f'{pinned} phrases pinned in {time.monotonic() - start:.3f} s')
+
+    def _pin(self, data, evict=False):
+        vt = self._get_speaker(data)
+        if vt is None:
+            return False, 'The voice of the language is not available'
+        prosody = self._request_prosody(data)._asdict()
+        if evict:
+            if vt.unpin(data.sentence, **prosody):
+                return True, ''
+            return False, 'The phrase is not pinned'
+        try:
+            duration = vt.pin(data.sentence, **prosody)
+        except VoiceTextRuntimeError as err:
+            return False, str(err)
+        return True, f'{duration:.3f} s pinned'
+
+    def _pin_phrase_callback(self, request, response):
+        response.success, response.message = self._pin(request.data, request.evict)
+        return response
+
+    def _warm_up(self):
+        for language in self._voices:
+            self._load_speaker(language)
+
     def __enter__(self):
-        if self._vt_jpn is not None:
-            self._vt_jpn.__enter__()
-        if self._vt_eng is not None:
-            self._vt_eng.__enter__()
+        self._player.__enter__()
         return self
 
     def __exit__(self, *args):
-        if self._vt_jpn is not None:
-            self._vt_jpn.__exit__(*args)
-        if self._vt_eng is not None:
-            self._vt_eng.__exit__(*args)
+        if self._cache is not None:
+            self.get_logger().info(f'Voicetext cache: {self._cache.stats}')
+        if self._recorder is not None:
+            self.get_logger().info(f'{self._recorder.count} talk requests captured')
+            self._recorder.close()
+        self._scheduler.close()
+        with self._speakers_lock:
+            for vt in self._speakers.values():
+                vt.__exit__(*args)
+        self._player.__exit__(*args)
         return True
 
+    def _max_wait(self, data):
+        max_wait = Duration.from_msg(data.deadline).nanoseconds / 1e9
+        return max_wait if max_wait > 0.0 else None
+
     def _subscriber_callback(self, data):
-        with self._lock:
-            if self._is_speaking:
-                self._is_speaking = False
-                self._cancel_talking()
-                if self._goal_handle is not None:
-                    self._goal_handle = None
-            self._speak_sentence(data)
+        if self._recorder is not None:
+            self._recorder.record(TOPIC, data)
+        utterance = Utterance(data, trace=self._trace(), prosody=self._request_prosody(data),
+                              max_wait=self._max_wait(data))
+        if not self._scheduler.submit(utterance):
+            self.get_logger().warn(f'Talk request is dropped: {data.sentence}')
 
     async def _execute_callback(self, goal_handle):
-        with self._lock:
-            if self._is_speaking:
-                self._is_speaking = False
-                self._cancel_talking()
-
-            self._speak_sentence(goal_handle.request.data)
-            if not self._is_speaking:
-                goal_handle.abort()
-                return TalkRequest.Result()
-
-        self._goal_handle = goal_handle
-
-        rate = self.create_rate(20.0)
-        while self._is_speaking and self._goal_handle is not None:
-            rate.sleep()
-        if self._goal_handle is None and goal_handle.is_cancel_requested:
+        data = goal_handle.request.data
+        utterance = Utterance(data, goal_handle, self._trace(), self._request_prosody(data),
+                              self._max_wait(data))
+        # Await instead of blocking a thread of the executor on utterance.done
+        future = Future(executor=self.executor)
+        utterance.add_done_callback(lambda finished: future.set_result(finished.state))
+        self._scheduler.submit(utterance)
+
+        await future
+        if utterance.state == Utterance.SUCCEEDED:
+            goal_handle.succeed()
+        elif utterance.state == Utterance.CANCELED and goal_handle.is_cancel_requested:
             goal_handle.canceled()
-        elif self._goal_handle is None and not goal_handle.is_cancel_requested:
-            goal_handle.abort()
         else:
-            self._goal_handle = None
+            goal_handle.abort()
         return TalkRequest.Result()
 
     def _goal_callback(self, goal_request):
+        if self._recorder is not None:
+            self._recorder.record(ACTION, goal_request.data)
         return GoalResponse.ACCEPT
 
     def _preempt_callback(self, goal_handle):
-        with self._lock:
-            self._is_speaking = False
-            self._cancel_talking()
-            self._goal_handle = None
+        for utterance in self._scheduler.utterances:
+            if utterance.goal_handle is goal_handle:
+                self._scheduler.cancel(utterance)
         return CancelResponse.ACCEPT
 
-    def _speak_sentence(self, data):
-        duration = self._send_sentence_to_speaker(data)
-        if duration > 0.0:
-            msg = String()
-            msg.data = data.sentence
-            self._publisher.publish(msg)
-            self._end_time = self.get_clock().now() + Duration(seconds=duration)
-            self._is_speaking = True
-        else:
-            self._end_time = None
-            self._is_speaking = False
+    def _on_start(self, utterance):
+        if utterance.trace is not None:
+            utterance.trace.mark(Trace.STARTED)
+        if self._earcon is not None:
+            # Mixed with the beginning of the utterance
+            self._player.play(self._earcon)
+        msg = String()
+        msg.data = utterance.data.sentence
+        self._publisher.publish(msg)
+
+    def _on_idle(self):
+        self._publisher.publish(String())
 
-    def _send_sentence_to_speaker(self, data):
-        if data.language == Voice.JAPANESE:
-            if self._vt_jpn is None:
+    def _on_finish(self, utterance):
+        if utterance.playback is not None and utterance.playback.error is not None:
+            self.get_logger().error(str(utterance.playback.error))
+        if self._metrics is not None and utterance.trace is not None:
+            self._metrics.add(utterance.trace, utterance.priority)
+
+    def _trace(self):
+        return None if self._metrics is None else Trace()
+
+    def _publish_metrics(self):
+        status = DiagnosticStatus()
+        status.level = DiagnosticStatus.OK
+        status.name = f'{self.get_name()}: latency'
+        status.message = 'Latency in seconds of the talk requests'
+        for name, summary in self._metrics.summary().items():
+            for key, value in summary.items():
+                status.values.append(KeyValue(key=f'{name} {key}', value=f'{value:g}'))
+        for key, value in self._player.stats.items():
+            status.values.append(KeyValue(key=f'playback_queue {key}', value=str(value)))
+        msg = DiagnosticArray()
+        msg.header.stamp = self.get_clock().now().to_msg()
+        msg.status.append(status)
+        self._metrics_publisher.publish(msg)
+
+    def _get_speaker(self, data):
+        if data.language not in self._voices:
+            self.get_logger().error("Requested language is not supported.")
+            return None
+        vt = self._load_speaker(data.language)
+        if vt is None:
+            if data.language == Voice.JAPANESE:
                 self.get_logger().warn("Japanese license is not available.")
-                return 0.0
             else:
-                vt = self._vt_jpn
-        elif data.language == Voice.ENGLISH:
-            if self._vt_eng is None:
                 self.get_logger().warn("English license is not available.")
-                return 0.0
-            else:
-                vt = self._vt_eng
-        else:
-            self.get_logger().error("Requested language is not supported.")
-            return 0.0
+        return vt
+
+    def _load_speaker(self, language):
+        voice = self._voices[language]
+        if voice is None:
+            return None
+        with self._speakers_lock:
+            vt = self._speakers.get(language)
+            if vt is not None:
+                return vt
+            lock = self._load_locks.setdefault(language, threading.Lock())
+        # The requests of the other languages are served during the load
+        with lock:
+            with self._speakers_lock:
+                vt = self._speakers.get(language)
+                failed = self._load_failures.get(language)
+            if vt is not None:
+                return vt
+            start = time.monotonic()
+            if failed is not None and start - failed < self.LOAD_RETRY_TIME:
+                return None
+            try:
+                vt = VoiceTextSpeaker(
+                    path=self._vt_path, voice=voice, cache=self._cache,
+                    channels=self._channels, player=self._player,
+                    isolated=self._isolated)
+            except VoiceTextRuntimeError as err:
+                self.get_logger().error(
+                    f'{err}, retried in {self.LOAD_RETRY_TIME:.0f} s')
+                with self._speakers_lock:
+                    self._load_failures[language] = time.monotonic()
+                return None
+            self.get_logger().info(
+                f'Voicetext {voice} is ready in {time.monotonic() - start:.3f} s, '
+                f'max RSS {_max_rss_mib():.1f} MiB')
+            with self._speakers_lock:
+                self._speakers[language] = vt
+                self._load_failures.pop(language, None)
+            return vt
+
+    def _synthesize(self, utterance):
+        vt = self._get_speaker(utterance.data)
+        if vt is None:
+            return []
         try:
-            duration = vt.speak(data.sentence,
-                                pitch=self._pitch,
-                                speed=self._speed,
-                                volume=self._volume,
-                                pause=self._pause)
-            self._cancel_talking = vt.cancel
-            return duration
+            # The sentences beyond the playback queue are streamed by _play
+            return vt.synthesize(utterance.data.sentence,
+                                 trace=utterance.trace,
+                                 max_bytes=self._player.max_queue_bytes,
+                                 **utterance.prosody._asdict())
         except Exception as err:
             self.get_logger().error(str(err))
-            return 0.0
-
-    def _run(self):
-        if self._is_speaking:
-            remaining = self._end_time - self.get_clock().now()
-            if remaining.nanoseconds < 0:
-                if self._goal_handle is not None:
-                    self._goal_handle.succeed()
-                self._publisher.publish(String())
-                self._end_time = None
-                self._is_speaking = False
-            else:
-                if self._goal_handle is not None:
-                    feedback = TalkRequest.Feedback()
-                    feedback.remaining_time = remaining.to_msg()
-                    self._goal_handle.publish_feedback(feedback)
+            return []
+
+    def _play(self, utterance, on_event):
+        vt = self._get_speaker(utterance.data)
+        if vt is None:
+            playback = Playback(on_event)
+            playback.finish_synthesis()
+            return playback
+        if utterance.frames is not None:
+            return vt.play(utterance.frames, on_event=on_event, trace=utterance.trace)
+        return vt.speak_stream(utterance.data.sentence,
+                               on_event=on_event,
+                               trace=utterance.trace,
+                               **utterance.prosody._asdict())
+
+    def _stop(self, utterance):
+        vt = self._get_speaker(utterance.data)
+        if vt is not None:
+            vt.cancel()
+
+    def _on_progress(self, utterance):
+        for goal in self._scheduler.utterances:
+            if goal.goal_handle is None:
+                continue
+            remaining = self._scheduler.remaining_time(goal)
+            if remaining is not None:
+                feedback = TalkRequest.Feedback()
+                feedback.remaining_time = Duration(seconds=remaining).to_msg()
+                goal.goal_handle.publish_feedback(feedback)
+
+
+def _max_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
 
 
 def main(args=None):
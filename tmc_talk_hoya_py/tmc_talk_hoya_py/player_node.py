@@ -0,0 +1,130 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+# -*- coding: utf-8 -*-
+import rclpy
+from rclpy.node import Node
+from rclpy.qos import (
+    QoSProfile,
+    QoSReliabilityPolicy,
+)
+
+from tmc_voice_msgs.msg import AudioChunk
+
+from . import codec
+from .audio import AudioOutError
+from .voicetext import AudioPlayer
+
+
+class AudioStreamPlayerNode(Node):
+    u"""Plays the audio stream published by text_to_speech with audio_backend:=topic
+
+    audio_latency is the jitter buffer of the output.  The node needs
+    neither VoiceText nor its license.
+    """
+
+    def __init__(self):
+        super().__init__('audio_player')
+        self.declare_parameter('audio_backend', 'pulse')
+        self.declare_parameter('audio_device', '')
+        self.declare_parameter('audio_latency', 0.2)
+        backend = self.get_parameter('audio_backend').get_parameter_value().string_value
+        device = self.get_parameter('audio_device').get_parameter_value().string_value
+        latency = self.get_parameter('audio_latency').get_parameter_value().double_value
+        self._player = self._get_player(backend, device, latency)
+        self._next_seq = None
+        self._decoder = codec.Decoder()
+        self._subscriber = self.create_subscription(
+            AudioChunk, 'talk_audio', self._chunk_callback,
+            QoSProfile(depth=100, reliability=QoSReliabilityPolicy.RELIABLE))
+
+    def _get_player(self, backend, device, latency):
+        try:
+            if backend == 'fd':
+                options = {'path': device or '/dev/dsp', 'latency': latency}
+            elif backend == 'file':
+                if not device:
+                    raise AudioOutError('audio_device must be the path of the file backend')
+                options = {'path': device}
+            elif backend == 'null':
+                options = {'latency': latency, 'realtime': True}
+            else:
+                options = {'latency': latency}
+            options['backend'] = backend
+            return AudioPlayer(options)
+        except (AudioOutError, ValueError) as err:
+            # Keep receiving the stream without a sound server
+            self.get_logger().error(f'{err}, the audio is discarded')
+            return AudioPlayer({'backend': 'null', 'latency': latency, 'realtime': True})
+
+    def __enter__(self):
+        self._player.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        self._player.__exit__(*args)
+        return True
+
+    def _chunk_callback(self, msg):
+        if self._next_seq is not None and msg.seq != self._next_seq:
+            lost = (msg.seq - self._next_seq) & 0xFFFFFFFF
+            self.get_logger().warn(f'{lost} audio chunks are lost')
+            # The next chunk carries the state of the decoder
+            self._decoder.reset()
+        self._next_seq = (msg.seq + 1) & 0xFFFFFFFF
+        if msg.flush:
+            self._player.cancel()
+            self._decoder.reset()
+            return
+        if (msg.encoding not in codec.ENCODINGS.values() or msg.sample_rate != 16000
+                or msg.channels != 1):
+            self.get_logger().error(
+                f'Unsupported audio: encoding {msg.encoding}, {msg.sample_rate} Hz, '
+                f'{msg.channels} channels')
+            return
+        if msg.encoding == codec.ENCODING_S16LE:
+            pcm = msg.data
+        else:
+            if msg.encoding != self._decoder.encoding:
+                self._decoder = codec.Decoder(msg.encoding)
+            try:
+                pcm = self._decoder.decode_chunk(msg.data)
+            except ValueError as err:
+                self.get_logger().error(str(err))
+                return
+        self._player.put(pcm, len(pcm) / 32000.0)
+
+
+def main(args=None):
+    rclpy.init(args=args)
+    with AudioStreamPlayerNode() as node:
+        try:
+            rclpy.spin(node)
+        except Exception as err:
+            node.get_logger().error(str(err))
+        rclpy.try_shutdown()
+        node.destroy_node()
@@ -56,10 +56,14 @@ PA_STREAM_PLAYBACK = 1
 PA_STREAM_RECORD = 2
 PA_STREAM_UPLOAD = 3
 
+# Let the server choose the value of a pa_buffer_attr field
+PA_BUFFER_ATTR_DEFAULT = 0xFFFFFFFF
+
 STRING = ctypes.c_char_p
 pa_channel_position_t = ctypes.c_int
 pa_sample_format_t = ctypes.c_int
 pa_stream_direction_t = ctypes.c_int
+pa_usec_t = ctypes.c_uint64
 
 
 class pa_simple(ctypes.Structure):
@@ -126,3 +130,24 @@ pa_simple_write.argtypes = [
     ctypes.c_size_t,
     ctypes.POINTER(ctypes.c_int)
 ]
+
+pa_simple_drain = _lib.pa_simple_drain
+pa_simple_drain.restype = ctypes.c_int
+pa_simple_drain.argtypes = [
+    ctypes.POINTER(pa_simple),
+    ctypes.POINTER(ctypes.c_int)
+]
+
+pa_simple_get_latency = _lib.pa_simple_get_latency
+pa_simple_get_latency.restype = pa_usec_t
+pa_simple_get_latency.argtypes = [
+    ctypes.POINTER(pa_simple),
+    ctypes.POINTER(ctypes.c_int)
+]
+
+pa_simple_flush = _lib.pa_simple_flush
+pa_simple_flush.restype = ctypes.c_int
+pa_simple_flush.argtypes = [
+    ctypes.POINTER(pa_simple),
+    ctypes.POINTER(ctypes.c_int)
+]
@@ -0,0 +1,416 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+# -*- coding: utf-8 -*-
+import functools
+import heapq
+import itertools
+import queue as Queue
+import threading
+import time
+
+from .voicetext import (
+    Playback,
+    Prosody
+)
+
+
+class Utterance(object):
+    u"""A talk request handled by UtteranceScheduler
+
+    prosody is resolved when the request is received and kept with it, so
+    that the frames synthesized in advance match the ones which would be
+    streamed, whatever parameters are changed in between.
+    max_wait is the seconds the utterance may stay pending before it is
+    dropped, None waits indefinitely.
+    """
+
+    PENDING = 0
+    ACTIVE = 1
+    SUCCEEDED = 2
+    CANCELED = 3   # Canceled by the requester
+    PREEMPTED = 4  # Interrupted or discarded by another request
+    DROPPED = 5    # Rejected because the queue is full or the deadline passed
+    ABORTED = 6    # Nothing could be spoken
+
+    def __init__(self, data, goal_handle=None, trace=None, prosody=None, max_wait=None):
+        self.data = data
+        self.received = time.monotonic()
+        self.deadline = None if max_wait is None else self.received + max_wait
+        self.prosody = Prosody() if prosody is None else prosody
+        self.goal_handle = goal_handle
+        self.trace = trace
+        self.state = self.PENDING
+        self.frames = None
+        self.duration = None
+        self.playback = None
+        self.start_time = None
+        self.done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add_done_callback(self, callback):
+        u"""Call callback(utterance) once it is finished, which may be right now"""
+        with self._lock:
+            if not self.done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _set_done(self):
+        with self._lock:
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    @property
+    def interrupting(self):
+        return self.data.interrupting
+
+    @property
+    def queueing(self):
+        return self.data.queueing
+
+    @property
+    def priority(self):
+        return self.data.priority
+
+    @property
+    def queueing_delay(self):
+        u"""Seconds from the reception to the start, None if not started"""
+        if self.start_time is None:
+            return None
+        return self.start_time - self.received
+
+
+class UtteranceScheduler(object):
+    u"""Bounded priority queue of utterances that honors Voice.priority,
+    Voice.interrupting and Voice.queueing
+
+    An utterance of higher priority than the current one preempts it and is
+    spoken immediately, the queued ones keep waiting.  An utterance of lower
+    priority waits until all the utterances of higher priority are spoken,
+    or until its deadline passes.  Between utterances of the same priority:
+
+    queueing      The utterance is spoken after the current and already queued
+                  ones.
+    interrupting  The current utterance is preempted and the new one is
+                  spoken immediately. Queued utterances are kept.
+    neither       The current and the queued utterances of the same priority
+                  are preempted.
+
+    A pending utterance is dropped if max_queue utterances are waiting,
+    unless one of lower priority can be dropped instead.
+
+    The utterance of highest priority in the queue is synthesized in the
+    background while the current one is playing, so that it can start without
+    a gap.  The others do not hold frames until they reach the head.  An
+    utterance which starts before its pre-synthesis is finished is streamed
+    and the frames of the pre-synthesis are dropped.
+
+    synthesize(utterance) returns the frames of utterance.
+    play(utterance, on_event) starts playing utterance.frames, or streams the
+    sentence if it has not been synthesized yet, and returns a Playback which
+    reports its events to on_event.  The next utterance starts when the
+    playback is drained, on a thread of the scheduler rather than on the
+    thread which reports the events, which is usually the writer thread of
+    the audio output.  stop(utterance) stops the playback of utterance.
+    synthesize should report its own errors and return no frames instead.
+    output_latency is the seconds from the first write to the first sound,
+    see AudioPlayer.buffer_time.
+    """
+
+    def __init__(self, synthesize, play, stop, max_queue=10,
+                 on_start=None, on_idle=None, on_finish=None, on_progress=None,
+                 output_latency=0.0):
+        self._synthesize = synthesize
+        self._play = play
+        self._stop = stop
+        self._max_queue = max_queue
+        self._on_start = on_start
+        self._on_idle = on_idle
+        self._on_finish = on_finish
+        self._on_progress = on_progress
+        self._output_latency = output_latency
+        self._active = None
+        # Utterances claimed by a pre-synthesis, under the lock
+        self._presynthesizing = set()
+        # Heap of (-priority, sequence, utterance), first in first out by priority
+        self._pending = []
+        self._sequence = itertools.count()
+        # (deadline, threading.Timer) armed for the earliest pending deadline
+        self._expiry = None
+        self._lock = threading.RLock()
+        self._synthesis_lock = threading.Lock()
+        # Playback events, handled in order by the event thread
+        self._events = Queue.Queue()
+        self._event_thread = threading.Thread(target=self._handle_events)
+        self._event_thread.daemon = True
+        self._event_thread.start()
+
+    def close(self):
+        u"""Stop the event thread and the deadline timer"""
+        self._events.put(None)
+        self._event_thread.join()
+        with self._lock:
+            if self._expiry is not None:
+                self._expiry[1].cancel()
+                self._expiry = None
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def utterances(self):
+        u"""Snapshot of the active and pending utterances in playing order"""
+        with self._lock:
+            active = [self._active] if self._active is not None else []
+            return active + self._pending_utterances()
+
+    def submit(self, utterance):
+        u"""Schedule utterance, return False if it was dropped"""
+        with self._lock:
+            self._expire()
+            active = self._active
+            if active is not None and (
+                    utterance.priority < active.priority or
+                    (utterance.priority == active.priority and utterance.queueing)):
+                return self._enqueue(utterance)
+            if not utterance.interrupting:
+                self._discard([pending for pending in self._pending_utterances()
+                               if pending.priority == utterance.priority],
+                              Utterance.PREEMPTED)
+            if self._active is not None:
+                self._stop(self._active)
+                self._finish(self._active, Utterance.PREEMPTED)
+                self._active = None
+            try:
+                self._start(utterance)
+            finally:
+                if self._active is None:
+                    self._start_next()
+            return True
+
+    def cancel(self, utterance):
+        u"""Cancel a pending or active utterance at the request of its sender"""
+        with self._lock:
+            if utterance is self._active:
+                self._stop(utterance)
+                self._finish(utterance, Utterance.CANCELED)
+                self._active = None
+                self._start_next()
+            elif utterance in self._pending_utterances():
+                self._discard([utterance], Utterance.CANCELED)
+                self._prepare_next()
+
+    def expire(self):
+        u"""Drop the pending utterances whose deadline has passed
+
+        Called by a timer at the earliest deadline, which is armed only
+        while an utterance with a deadline is pending.
+        """
+        with self._lock:
+            if self._expire():
+                self._prepare_next()
+            self._schedule_expiry()
+
+    def remaining_time(self, utterance):
+        u"""Seconds of audio to be played until utterance finishes
+
+        None if utterance is not scheduled. Pending utterances count for the
+        frames synthesized in advance only.
+        """
+        with self._lock:
+            if self._active is None:
+                return None
+            playback = self._active.playback
+            remaining = self._output_latency
+            if playback is not None:
+                remaining = max(playback.duration - playback.played, 0.0)
+                if not playback.started.is_set():
+                    # The audio output has not played the first frame yet
+                    remaining += self._output_latency
+            if utterance is self._active:
+                return remaining
+            for pending in self._pending_utterances():
+                remaining += pending.duration or 0.0
+                if pending is utterance:
+                    return remaining
+            return None
+
+    def _start(self, utterance):
+        # Streamed rather than waiting for the pre-synthesis, which drops its frames
+        self._presynthesizing.discard(utterance)
+        if utterance.frames is not None and not utterance.frames:
+            self._finish(utterance, Utterance.ABORTED)
+            return
+        utterance.state = Utterance.ACTIVE
+        utterance.start_time = time.monotonic()
+        self._active = utterance
+        if self._on_start is not None:
+            self._on_start(utterance)
+        # The playback may be drained before play returns
+        playback = self._play(
+            utterance, functools.partial(self._on_playback_event, utterance))
+        if self._active is utterance:
+            utterance.playback = playback
+            self._prepare_next()
+
+    def _start_next(self):
+        self._expire()
+        while self._active is None and self._pending:
+            self._start(heapq.heappop(self._pending)[2])
+        self._schedule_expiry()
+        if self._active is None and self._on_idle is not None:
+            self._on_idle()
+
+    def _pending_utterances(self):
+        return [utterance for _, _, utterance in sorted(self._pending)]
+
+    def _enqueue(self, utterance):
+        if len(self._pending) >= self._max_queue:
+            # The last one of the lowest priority, if any is queued
+            lowest = max(self._pending)[2] if self._pending else None
+            if lowest is None or lowest.priority >= utterance.priority:
+                self._finish(utterance, Utterance.DROPPED)
+                return False
+            self._discard([lowest], Utterance.DROPPED)
+        heapq.heappush(self._pending, (-utterance.priority, next(self._sequence), utterance))
+        self._schedule_expiry()
+        self._prepare_next()
+        return True
+
+    def _discard(self, utterances, state):
+        if not utterances:
+            return
+        self._pending = [entry for entry in self._pending if entry[2] not in utterances]
+        heapq.heapify(self._pending)
+        for utterance in utterances:
+            self._finish(utterance, state)
+        self._schedule_expiry()
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [utterance for _, _, utterance in self._pending
+                   if utterance.deadline is not None and utterance.deadline <= now]
+        self._discard(expired, Utterance.DROPPED)
+        return expired
+
+    def _schedule_expiry(self):
+        deadlines = [utterance.deadline for _, _, utterance in self._pending
+                     if utterance.deadline is not None]
+        deadline = min(deadlines) if deadlines else None
+        if self._expiry is not None:
+            timer = self._expiry[1]
+            if (self._expiry[0] == deadline and timer.is_alive() and
+                    timer is not threading.current_thread()):
+                return
+            timer.cancel()
+            self._expiry = None
+        if deadline is not None:
+            timer = threading.Timer(max(deadline - time.monotonic(), 0.0), self.expire)
+            timer.daemon = True
+            timer.start()
+            self._expiry = (deadline, timer)
+
+    def _finish(self, utterance, state):
+        self._presynthesizing.discard(utterance)
+        utterance.state = state
+        utterance.frames = None
+        if self._on_finish is not None:
+            self._on_finish(utterance)
+        utterance._set_done()
+
+    def _on_playback_event(self, utterance, playback, event):
+        if event == Playback.CANCELED:
+            # Raised by stop() while the speaker is locked, the scheduler has
+            # finished the utterance already
+            return
+        # The writer thread must not wait for a synthesis or the load of an engine
+        self._events.put((utterance, playback, event))
+
+    def _handle_events(self):
+        while True:
+            item = self._events.get(True)
+            try:
+                if item is None:
+                    break
+                self._handle_event(*item)
+            finally:
+                self._events.task_done()
+
+    def _handle_event(self, utterance, playback, event):
+        with self._lock:
+            if utterance is not self._active:
+                return
+            if event == Playback.DRAINED:
+                utterance.playback = playback
+                if playback.error is None and playback.duration > 0.0:
+                    self._finish(utterance, Utterance.SUCCEEDED)
+                else:
+                    # Nothing, or only the beginning, could be spoken
+                    self._finish(utterance, Utterance.ABORTED)
+                self._active = None
+                self._start_next()
+            elif self._on_progress is not None:
+                self._on_progress(utterance)
+
+    def _synthesize_frames(self, utterance):
+        with self._synthesis_lock:
+            with self._lock:
+                if utterance not in self._presynthesizing:
+                    return
+            frames = None
+            try:
+                frames = self._synthesize(utterance)
+            finally:
+                with self._lock:
+                    claimed = utterance in self._presynthesizing
+                    self._presynthesizing.discard(utterance)
+                    # Dropped if the utterance started or was displaced meanwhile
+                    if (frames is not None and claimed and
+                            self._pending and self._pending[0][2] is utterance):
+                        utterance.duration = sum(len(frame) for frame in frames) / 32000.0
+                        utterance.frames = frames
+
+    def _prepare_next(self):
+        if self._active is None or not self._pending:
+            return
+        utterance = self._pending[0][2]
+        for _, _, pending in self._pending[1:]:
+            # Displaced by an utterance of higher priority, synthesized again
+            # (or read from the cache) when it reaches the head
+            pending.frames = None
+        if utterance.frames is None and utterance not in self._presynthesizing:
+            # Claimed before the thread starts, so that _start streams the
+            # utterance instead of synthesizing it a second time
+            self._presynthesizing.add(utterance)
+            thread = threading.Thread(target=self._synthesize_frames, args=(utterance,))
+            thread.daemon = True
+            thread.start()
@@ -0,0 +1,64 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+# -*- coding: utf-8 -*-
+import re
+
+# A sentence ends with a Japanese or an English terminator followed by
+# closing brackets or quotes, or a paragraph ends with a blank line.
+# A period ends a sentence only before a space so that "3.14" or "Mr. Smith"
+# is kept.
+_CLOSING = u'」』）〕】》〉)\\]"\'”’'
+_TITLES = u''.join(u'(?<!\\b{0})'.format(title) for title in ('Mr', 'Mrs', 'Ms', 'Dr', 'St'))
+_SENTENCE = re.compile(
+    u'.*?(?:[。．！？]+[{0}]*|[!?]+[{0}]*|{1}\\.+[{0}]*(?=\\s)|\\n[ \\t]*\\n|$)'.format(
+        _CLOSING, _TITLES),
+    re.DOTALL)
+_BREAKS = u'、，,;； 　'
+
+
+def split_sentences(text, max_length=200):
+    u"""Split text into sentences to be synthesized one by one
+
+    A sentence longer than max_length characters is split further after the
+    last comma or space before the limit, so that the first sentence of any
+    text is synthesized in a bounded time.
+    """
+    sentences = []
+    for match in _SENTENCE.finditer(text):
+        sentence = match.group().strip()
+        while len(sentence) > max_length:
+            cut = max(sentence.rfind(c, 0, max_length) for c in _BREAKS)
+            if cut <= 0:
+                cut = max_length - 1
+            head = sentence[:cut + 1].strip()
+            if head:
+                sentences.append(head)
+            sentence = sentence[cut + 1:].strip()
+        if sentence:
+            sentences.append(sentence)
+    return sentences
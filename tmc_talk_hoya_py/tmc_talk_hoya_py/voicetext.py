@@ -26,15 +26,42 @@ OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
 DAMAGE.
 '''
 # -*- coding: utf-8 -*-
-import copy
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
 import ctypes
 import glob
+import hashlib
+import itertools
+import mmap
 import os
 
 import queue as Queue
 import threading
 
-import tmc_talk_hoya_py.pulse as pulse
+import numpy
+
+from tmc_talk_hoya_py import codec
+from tmc_talk_hoya_py.audio import (
+    AudioOutError,
+    AudioSink,
+    FileDescriptorOut,
+    FileOut,
+    NullOut,
+    TopicOut
+)
+from tmc_talk_hoya_py.dsp import (
+    AudioProcessor,
+    SAMPLE_RATE
+)
+from tmc_talk_hoya_py.metrics import Trace
+try:
+    import tmc_talk_hoya_py.pulse as pulse
+except OSError:
+    # No PulseAudio on this host, the other audio backends still work
+    pulse = None
+from tmc_talk_hoya_py.sentence import split_sentences
 
 
 class VoiceTextRuntimeError(RuntimeError):
@@ -67,14 +94,35 @@ class VoiceTextLibrary(object):
         return self._lang
 
 
-class AudioOut(object):
-    u"""Cut out so that MOCK testing is easy"""
+class AudioOut(AudioSink):
+    u"""Cut out so that MOCK testing is easy
 
-    def __init__(self):
+    latency is the target latency in seconds.  tlength, prebuf and minreq
+    are the pa_buffer_attr fields in bytes and take precedence over latency.
+    Negative values let PulseAudio choose, which buffers about 2 seconds.
+    rate and channels should be those of the device, so that PulseAudio
+    does not resample.
+    """
+
+    def __init__(self, latency=-1.0, tlength=-1, prebuf=-1, minreq=-1,
+                 rate=16000, channels=1):
+        if pulse is None:
+            raise AudioOutError("libpulse-simple is not found")
+        bytes_per_second = rate * channels * 2
+        if tlength < 0 and latency >= 0.0:
+            tlength = int(latency * bytes_per_second)
+        super(AudioOut, self).__init__(
+            tlength / float(bytes_per_second) if tlength >= 0 else 2.0, rate, channels)
+        attr = pulse.pa_buffer_attr()
+        attr.maxlength = pulse.PA_BUFFER_ATTR_DEFAULT
+        attr.tlength = tlength if tlength >= 0 else pulse.PA_BUFFER_ATTR_DEFAULT
+        attr.prebuf = prebuf if prebuf >= 0 else pulse.PA_BUFFER_ATTR_DEFAULT
+        attr.minreq = minreq if minreq >= 0 else pulse.PA_BUFFER_ATTR_DEFAULT
+        attr.fragsize = pulse.PA_BUFFER_ATTR_DEFAULT
         ss = pulse.pa_sample_spec()
         ss.format = pulse.PA_SAMPLE_S16LE
-        ss.channels = 1
-        ss.rate = 16000
+        ss.channels = channels
+        ss.rate = rate
         name = b"VoiceTextSpeaker"
         stream_name = b"Voice"
         self._pulse = pulse.pa_simple_new(
@@ -85,21 +133,118 @@ class AudioOut(object):
             stream_name,         # Description of our stream.
             ss,                  # Our sample format.
             None,                # Use default channel map
-            None,                # Use default buffering attributes.
+            attr,                # Our buffering attributes.
             None,                # Ignore error code.
         )
+        if not self._pulse:
+            raise AudioOutError("Failed to connect to PulseAudio")
 
-    def write(self, buf):
-        pulse.pa_simple_write(self._pulse, buf, len(buf), None)
+    def latency(self):
+        u"""Seconds of audio written but not played yet, None if it is unknown"""
+        error = ctypes.c_int(0)
+        usec = pulse.pa_simple_get_latency(self._pulse, ctypes.byref(error))
+        if error.value != 0:
+            return None
+        return usec / 1000000.0
 
-    def __enter__(self):
-        return self
+    def drain(self):
+        u"""Block until all audio written to the stream is played"""
+        pulse.pa_simple_drain(self._pulse, None)
+
+    def flush(self):
+        u"""Discard the audio written to the stream but not played yet"""
+        pulse.pa_simple_flush(self._pulse, None)
+
+    def write(self, buf):
+        # In bytes, buf may be an array of int16 samples
+        view = memoryview(buf).cast('B')
+        if not isinstance(buf, ctypes.Array):
+            if view.readonly:
+                buf = (ctypes.c_byte * view.nbytes).from_buffer_copy(view)
+            else:
+                buf = (ctypes.c_byte * view.nbytes).from_buffer(view)
+        pulse.pa_simple_write(self._pulse, buf, view.nbytes, None)
+        self._written += view.nbytes
 
     def __exit__(self, *args):
         pulse.pa_simple_free(self._pulse)
         return True
 
 
+AUDIO_BACKENDS = ('pulse', 'fd', 'file', 'null', 'topic')
+
+
+def open_audio_out(backend='pulse', **options):
+    u"""Open an audio output of AUDIO_BACKENDS with its options
+
+    pulse  AudioOut(latency, tlength, prebuf, minreq, rate, channels)
+    fd     FileDescriptorOut(path, latency, fd, rate, channels)
+    file   FileOut(path, wav, rate, channels)
+    null   NullOut(latency, realtime, rate, channels)
+    topic  TopicOut(publish, chunk_size, latency, encoding), 16kHz mono only
+    """
+    if backend == 'pulse':
+        return AudioOut(**options)
+    elif backend == 'fd':
+        return FileDescriptorOut(**options)
+    elif backend == 'file':
+        return FileOut(**options)
+    elif backend == 'null':
+        return NullOut(**options)
+    elif backend == 'topic':
+        return TopicOut(**options)
+    raise ValueError("Unknown audio backend: " + str(backend))
+
+
+def find_voice(path='/opt/tmc/vt', voice='haruka', iotype='RAMIO'):
+    u"""Return the root path and the library of voice without loading it"""
+    root_path = os.path.join(path, voice, 'M16')
+    license_path = root_path + '/data-common/verify/verification.txt'
+    if not os.path.exists(license_path):
+        raise VoiceTextLicenseNotFound(
+            "Voice text license " + license_path + " is not found.")
+    libs = glob.glob(os.path.join(
+        root_path, 'bin', iotype, 'LINUX64_GLIBC3', 'libvt_*.so'))
+    if not libs or len(libs) > 1:
+        raise VoiceTextLibvtNotFound(
+            "Proper voice text library for " + voice + " is not found. :" + str(libs))
+    return root_path, libs[0]
+
+
+# Valid ranges of the prosody parameters, -1 is the default of the voice
+PROSODY_RANGES = collections.OrderedDict([
+    ('pitch', (50, 200)),
+    ('speed', (50, 400)),
+    ('volume', (0, 500)),
+    ('pause', (0, 65535)),
+])
+
+
+def is_valid_prosody(name, value):
+    u"""Whether value is -1 or in the range of the prosody parameter name"""
+    min_value, max_value = PROSODY_RANGES[name]
+    return value == -1 or min_value <= value <= max_value
+
+
+class Prosody(collections.namedtuple('Prosody', list(PROSODY_RANGES))):
+    u"""Pitch, speed, volume and pause of an utterance, -1 for the default of the voice
+
+    The fields are the keyword arguments of the synthesis methods of
+    VoiceTextSpeaker, so that vt.synthesize(msg, **prosody._asdict()) works.
+    """
+    __slots__ = ()
+
+    def __new__(cls, pitch=-1, speed=-1, volume=-1, pause=-1):
+        return super(Prosody, cls).__new__(cls, pitch, speed, volume, pause)
+
+    def override(self, pitch=-1, speed=-1, volume=-1, pause=-1):
+        u"""Return a copy with the given values, except for -1 and invalid ones"""
+        values = dict(pitch=pitch, speed=speed, volume=volume, pause=pause)
+        return self._replace(**{
+            name: value for name, value in values.items()
+            if value != -1 and is_valid_prosody(name, value)})
+
+
 class VoiceText(object):
     VT_BUFFER_API_FMT_S16PCM = 0
     VT_FILE_API_FMT_S16PCM = 0       # 16bits Linear PCM
@@ -114,17 +259,8 @@ class VoiceText(object):
     VT_FILE_API_FMT_MULAW_AU = 9     # 8bits Mu-law PCM SUN AU
 
     def __init__(self, path='/opt/tmc/vt', voice='haruka', iotype='RAMIO'):
-        root_path = os.path.join(path, voice, 'M16')
-        license_path = root_path + '/data-common/verify/verification.txt'
-        if not os.path.exists(license_path):
-            raise VoiceTextLicenseNotFound(
-                "Voice text license " + license_path + " is not found.")
-        libs = glob.glob(os.path.join(
-            root_path, 'bin', iotype, 'LINUX64_GLIBC3', 'libvt_*.so'))
-        if not libs or len(libs) > 1:
-            raise VoiceTextLibvtNotFound(
-                "Proper voice text library for " + voice + " is not found. :" + str(libs))
-        lib_path = libs[0]
+        root_path, lib_path = find_voice(path, voice, iotype)
+        self._voice = voice
         self._libvt = VoiceTextLibrary(lib_path)
         ret = self._libvt.VT_LOADTTS(None, -1, root_path.encode(), None)
         if not ret == 0:
@@ -137,6 +273,21 @@ class VoiceText(object):
             ctypes.byref(slen),
             -1, 0, -1, -1, -1, -1, -1, -1, -1)
         self._buf = (ctypes.c_byte * slen.value)()
+        # Output buffer of each thread ID
+        self._bufs = {0: self._buf}
+
+    @property
+    def voice(self):
+        return self._voice
+
+    @property
+    def language(self):
+        return self._libvt.language
+
+    @property
+    def frame_size(self):
+        u"""Maximum size in bytes of a frame returned by to_buffer"""
+        return len(self._buf)
 
     def encode_message(self, msg):
         if self._libvt.language == 'jpn':
@@ -144,26 +295,72 @@ class VoiceText(object):
         else:
             return msg.encode('cp1252')
 
-    def to_buffer(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1):
+    def to_buffer(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1,
+                  pool=None, thread_id=0, trace=None,
+                  encoding=codec.ENCODING_S16LE):
+        u"""Synthesize msg and yield (frame, duration) for each frame
+
+        Without pool, every frame is a view of a buffer of thread_id which is
+        overwritten by the next frame.  With a FramePool, every frame is
+        synthesized into a buffer of the pool and yielded as a memoryview,
+        which the caller has to give back with pool.release.  With another
+        encoding of codec, the frames are encoded into new bytes, as libvt
+        only synthesizes S16LE into a buffer.
+
+        Sentences can be synthesized concurrently with distinct thread_id,
+        see VoiceTextChannelPool.  A Trace records the encoding and the first
+        frame.
+        """
+        if pool is None:
+            out = self._bufs.get(thread_id)
+            if out is None:
+                out = self._bufs.setdefault(
+                    thread_id, (ctypes.c_byte * len(self._buf))())
+        # If you can't encode, UNICODEENCODEERROR is thrown here
+        text = self.encode_message(msg)
+        if trace is not None:
+            trace.mark(Trace.ENCODED)
+        encoder = None
+        if encoding != codec.ENCODING_S16LE:
+            encoder = codec.Encoder(encoding)
         slen = ctypes.c_int(0)
         flag = 0
         while True:
-            # If you can't encode, UNICODEENCODEERROR is thrown here
-            ret = self._libvt.VT_TextToBuffer(
-                self.VT_BUFFER_API_FMT_S16PCM,
-                self.encode_message(msg),
-                self._buf,
-                ctypes.byref(slen),
-                flag, 0, -1, pitch, speed, volume, pause, -1, -1)
+            buf = out if pool is None else pool.acquire()
+            try:
+                ret = self._libvt.VT_TextToBuffer(
+                    self.VT_BUFFER_API_FMT_S16PCM,
+                    text,
+                    buf,
+                    ctypes.byref(slen),
+                    flag, thread_id, -1, pitch, speed, volume, pause, -1, -1)
+            except Exception:
+                if pool is not None:
+                    pool.release_buffer(buf)
+                raise
             flag = 1
             if ret >= 0:
-                yield ((ctypes.c_byte * slen.value).from_address(
-                    ctypes.addressof(self._buf)), slen.value / 32000.0)
+                if trace is not None:
+                    trace.mark(Trace.SYNTHESIZED)
+                if encoder is not None:
+                    data = encoder.encode(memoryview(buf)[:slen.value])
+                    if ret == 1:
+                        data += encoder.flush()
+                    if pool is not None:
+                        pool.release_buffer(buf)
+                    yield data, slen.value / 32000.0
+                elif pool is None:
+                    yield ((ctypes.c_byte * slen.value).from_address(
+                        ctypes.addressof(buf)), slen.value / 32000.0)
+                else:
+                    yield memoryview(buf)[:slen.value], slen.value / 32000.0
                 if ret == 1:
                     break
-            elif ret == -4:  # When the character length is 0
+            elif pool is not None:
+                pool.release_buffer(buf)
+            if ret == -4:  # When the character length is 0
                 break
-            else:
+            elif ret < 0:
                 # [-1] When using the non-supported audio format
                 # [-2] If you fail to secure a channel memory
                 # [-3] When the text character string is NULL POINTER
@@ -200,13 +397,468 @@ class VoiceText(object):
                 "VT_TextToFile failed. ret={0}".format(ret))
 
 
-class VoiceTextSpeaker(object):
-    def __init__(self, path='/opt/tmc/vt', voice='haruka', iotype='RAMIO'):
-        self._vt_lib = VoiceText(path, voice=voice, iotype=iotype)
-        self._audio_out = AudioOut()
-        self._queue = Queue.Queue()
+class VoiceTextChannelPool(object):
+    u"""Thread IDs of a VoiceText to synthesize sentences concurrently
+
+    Every synthesis holds its own thread ID and output buffer of the engine,
+    so that up to channels sentences are rendered in parallel, e.g. from a
+    concurrent.futures.ThreadPoolExecutor.  libvt is called without the GIL.
+    """
+
+    def __init__(self, vt, channels=2):
+        self._vt = vt
+        self._channels = channels
+        self._free = Queue.Queue()
+        for thread_id in range(channels):
+            self._free.put(thread_id)
+
+    @property
+    def voice_text(self):
+        return self._vt
+
+    @property
+    def channels(self):
+        return self._channels
+
+    @contextlib.contextmanager
+    def channel(self):
+        u"""Hold a free thread ID, waiting for one if all are in use"""
+        thread_id = self._free.get(True)
+        try:
+            yield thread_id
+        finally:
+            self._free.put(thread_id)
+
+    def synthesize(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1):
+        u"""Synthesize msg on a free channel and return the PCM as bytes"""
+        with self.channel() as thread_id:
+            return b''.join(bytes(buf) for buf, _ in self._vt.to_buffer(
+                msg, pitch=pitch, speed=speed, volume=volume, pause=pause,
+                thread_id=thread_id))
+
+
+class VoiceTextCache(object):
+    u"""Cache of synthesized 16kHz mono S16LE PCM
+
+    Utterances are kept in memory in LRU order up to max_bytes.  If path is
+    given, every utterance is also stored there as a raw file, which is
+    memory mapped when it is requested again, e.g. after a restart.  The
+    files are kept up to max_disk_bytes, the least recently used ones by
+    mtime being removed, or without limit if max_disk_bytes is None.
+    With an encoding of codec, the utterances are stored compressed and
+    decoded by get.
+
+    Pinned utterances are kept as PCM apart from the LRU entries, whatever
+    max_bytes and the encoding are, until they are unpinned.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, path=None,
+                 encoding=codec.ENCODING_S16LE, max_disk_bytes=256 * 1024 * 1024):
+        self._max_bytes = max_bytes
+        self._path = path
+        self._max_disk_bytes = max_disk_bytes
+        self._encoding = encoding
+        self._extension = {codec.ENCODING_S16LE: '.pcm',
+                           codec.ENCODING_ALAW: '.alaw',
+                           codec.ENCODING_MULAW: '.mulaw',
+                           codec.ENCODING_IMA_ADPCM: '.adpcm'}[encoding]
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._pinned = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+        # Bytes of the files, counted on the first store
+        self._disk_size = None
+        self._disk_evictions = 0
+        self._disk_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(voice, language, sentence,
+                 pitch=-1, speed=-1, volume=-1, pause=-1):
+        return (voice, language, sentence, pitch, speed, volume, pause)
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'evictions': self._evictions,
+                    'disk_evictions': self._disk_evictions,
+                    'entries': len(self._entries),
+                    'bytes': self._size,
+                    'pinned': len(self._pinned),
+                    'pinned_bytes': sum(len(pcm) for pcm in self._pinned.values())}
+
+    @property
+    def encoding(self):
+        return self._encoding
+
+    def get(self, key):
+        u"""Return the PCM of key as a buffer object, or None if not cached"""
+        with self._lock:
+            pcm = self._pinned.get(key)
+            if pcm is not None:
+                self._hits += 1
+                return pcm
+            pcm = self._entries.get(key)
+            if pcm is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._decode(pcm)
+        pcm = self._load(key)
+        with self._lock:
+            if pcm is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._insert(key, pcm)
+        return self._decode(pcm)
+
+    def put(self, key, pcm):
+        if self._max_bytes <= 0 and self._path is None:
+            return
+        if self._encoding == codec.ENCODING_S16LE:
+            pcm = bytes(pcm)
+        else:
+            pcm = codec.encode(pcm, self._encoding)
+        with self._lock:
+            self._insert(key, pcm)
+        self._store(key, pcm)
+
+    def pin(self, key, pcm):
+        u"""Keep the PCM of key in memory until unpin"""
+        pcm = bytes(pcm)
+        with self._lock:
+            self._pinned[key] = pcm
+
+    def unpin(self, key):
+        u"""Evict a pinned key, return whether it was pinned"""
+        with self._lock:
+            return self._pinned.pop(key, None) is not None
+
+    def is_pinned(self, key):
+        with self._lock:
+            return key in self._pinned
+
+    def clear(self):
+        u"""Clear the LRU entries, the pinned ones are kept"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _insert(self, key, pcm):
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        if len(pcm) > self._max_bytes:
+            return
+        self._entries[key] = pcm
+        self._size += len(pcm)
+        while self._size > self._max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._evictions += 1
+
+    def _decode(self, data):
+        if self._encoding == codec.ENCODING_S16LE:
+            return data
+        return codec.decode(data, self._encoding)
+
+    def _filename(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self._path, digest + self._extension)
+
+    def _load(self, key):
+        if self._path is None:
+            return None
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                pcm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # The mtime orders the files for the eviction
+            os.utime(filename)
+            return pcm
+        except (OSError, ValueError):
+            # Not stored yet, or an empty file which cannot be mapped
+            return None
+
+    def _store(self, key, pcm):
+        if self._path is None:
+            return
+        filename = self._filename(key)
+        # Write to a temporary file so that a reader never maps a partial file
+        tmp = '{0}.{1}.tmp'.format(filename, threading.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(pcm)
+        os.replace(tmp, filename)
+        if self._max_disk_bytes is not None:
+            with self._disk_lock:
+                if self._disk_size is None:
+                    self._disk_size = sum(size for _, _, size in self._disk_files())
+                else:
+                    self._disk_size += len(pcm)
+                if self._disk_size > self._max_disk_bytes:
+                    self._evict_disk(filename)
+
+    def _disk_files(self):
+        u"""(mtime, filename, size) of the stored files"""
+        files = []
+        for entry in os.scandir(self._path):
+            if entry.name.endswith(self._extension):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, entry.path, stat.st_size))
+        return files
+
+    def _evict_disk(self, keep):
+        files = self._disk_files()
+        self._disk_size = sum(size for _, _, size in files)
+        for _, filename, size in sorted(files):
+            if self._disk_size <= self._max_disk_bytes:
+                break
+            if filename == keep:
+                continue
+            try:
+                # Mapped files stay readable until they are unmapped
+                os.remove(filename)
+            except OSError:
+                continue
+            self._disk_size -= size
+            with self._lock:
+                self._disk_evictions += 1
+
+
+class FramePool(object):
+    u"""Frame buffers recycled between the synthesis and the writer threads
+
+    A buffer is allocated only when all of the buffers are in use, so that
+    no allocation happens once the pool has grown to the number of frames
+    in flight.
+    """
+
+    def __init__(self, frame_size, count=16):
+        self._frame_size = frame_size
+        self._buffers = {}
+        self._free = Queue.LifoQueue()
+        for _ in range(count):
+            self._free.put(self._allocate())
+
+    @property
+    def size(self):
+        return len(self._buffers)
+
+    def acquire(self):
+        try:
+            return self._free.get(False)
+        except Queue.Empty:
+            return self._allocate()
+
+    def release(self, frame):
+        u"""Give back the buffer of a frame, frames of other origins are ignored"""
+        if isinstance(frame, memoryview):
+            self.release_buffer(frame.obj)
+
+    def release_buffer(self, buf):
+        if self._buffers.get(id(buf)) is buf:
+            self._free.put(buf)
+
+    def _allocate(self):
+        buf = (ctypes.c_byte * self._frame_size)()
+        self._buffers[id(buf)] = buf
+        return buf
+
+
+class Playback(object):
+    u"""Progress of an utterance queued on VoiceTextSpeaker
+
+    duration is the length in seconds of the frames queued so far, which is
+    final once synthesized is set, and played is the length of the frames
+    written to the audio output.  on_event(playback, event) is called from
+    the writer thread with STARTED on the first frame, FRAME_PLAYED on every
+    frame and DRAINED after the last frame.  A canceled playback raises
+    CANCELED, from the thread which cancels it, and no more events.  The
+    optional Trace records the writes and the drain.
+    """
+
+    STARTED = 0
+    FRAME_PLAYED = 1
+    DRAINED = 2
+    CANCELED = 3
+
+    def __init__(self, on_event=None, trace=None):
+        self.duration = 0.0
+        self.played = 0.0
+        self.error = None
+        self.canceled = False
+        self.first_frame = threading.Event()
+        self.synthesized = threading.Event()
+        self.started = threading.Event()
+        self.drained = threading.Event()
+        self.trace = trace
+        self._on_event = on_event
+        self._lock = threading.Lock()
+
+    def frame_played(self, duration):
+        with self._lock:
+            if self.canceled:
+                return
+            started = not self.started.is_set()
+            self.started.set()
+            self.played += duration
+            drained = self._drain()
+        if started:
+            self._notify(self.STARTED)
+        self._notify(self.FRAME_PLAYED)
+        if drained:
+            self._notify(self.DRAINED)
+
+    def cancel(self):
+        with self._lock:
+            if self.canceled:
+                return
+            self.canceled = True
+            drained = self.drained.is_set()
+        if not drained:
+            self._notify(self.CANCELED)
+
+    def finish_synthesis(self):
+        with self._lock:
+            self.synthesized.set()
+            drained = self._drain()
+        if drained:
+            self._notify(self.DRAINED)
+
+    def _drain(self):
+        if (self.canceled or self.drained.is_set() or not self.synthesized.is_set()
+                or self.played < self.duration):
+            return False
+        self.drained.set()
+        if self.trace is not None:
+            self.trace.mark(Trace.DRAINED)
+        return True
+
+    def _notify(self, event):
+        if self._on_event is not None:
+            self._on_event(self, event)
+
+
+class PlaybackEvents(object):
+    u"""Async iterator over the events of a playback until it is drained or canceled
+
+    Returned by VoiceTextSpeaker.speak_events.  Cancelling the task which
+    waits for the next event cancels the playback.
+    """
+
+    def __init__(self, speaker, loop):
+        self.playback = None
+        self._speaker = speaker
+        self._loop = loop
+        self._events = asyncio.Queue()
+        self._done = False
+
+    def on_event(self, playback, event):
+        try:
+            self._loop.call_soon_threadsafe(self._events.put_nowait, event)
+        except RuntimeError:
+            # The event loop is closed
+            pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+        try:
+            event = await self._events.get()
+        except asyncio.CancelledError:
+            self._speaker.cancel(self.playback)
+            raise
+        self._done = event in (Playback.DRAINED, Playback.CANCELED)
+        return event
+
+
+class _Source(object):
+    u"""Frames queued on an AudioPlayer by one producer
+
+    Every frame is [buf, duration, playback, pool, fade_in], fade_in being
+    set on the first frame of a playback.  offset is the number of bytes of
+    the first frame which are mixed already, and size the number of bytes
+    of the queued frames.
+    """
+
+    def __init__(self, gain=1.0):
+        self.frames = collections.deque()
+        self.offset = 0
+        self.size = 0
+        self.gain = gain
+        self.playback = None
+
+
+class AudioPlayer(object):
+    u"""Mixer thread which plays the frames of any number of sources on one AudioOut
+
+    Several VoiceTextSpeakers can share a player, and thus a single stream.
+    Frames are queued with the FramePool they come from, which identifies
+    the speaker as a source, and gets the buffer back once it is written.
+    Frames of other producers, e.g. earcons, are queued with a source key.
+    audio_options, including the backend, are passed to open_audio_out.
+
+    While a single source plays at its own gain, its frames are written as
+    they are.  Otherwise the sources are summed with their gains and
+    clipped in blocks of block_time seconds.
+
+    The output goes through an AudioProcessor, which converts it to the
+    rate and the channels of audio_options and applies gain.  With a
+    fade_time, every playback is ramped in, and a cancel ramps out the
+    canceled source, or the output when nothing else is played.
+
+    With max_queue_bytes, wait_for_space blocks the producer of a source
+    while that many bytes of its frames wait to be mixed, so that the
+    synthesis stays a bounded time ahead of the playback.
+
+    The output is written in chunks of its write_size, e.g. the messages of
+    a TopicOut.  A realtime output which is flushed on cancel is written in
+    chunks of block_time seconds, below its buffer, so that a cancel waits
+    for a chunk rather than a whole frame.
+    """
+
+    EARCON = 'earcon'
+
+    def __init__(self, audio_options=None, gain=1.0, fade_time=0.0, block_time=0.02,
+                 max_queue_bytes=None):
+        audio_options = audio_options or {}
+        self._audio_out = open_audio_out(**audio_options)
+        self._processor = AudioProcessor(
+            audio_options.get('rate', SAMPLE_RATE), audio_options.get('channels', 1),
+            gain, fade_time,
+            self._audio_out.buffer_time + fade_time if self._audio_out.realtime else 0.0)
+        self._fade = int(max(fade_time, 0.0) * SAMPLE_RATE)
+        self._block = max(int(block_time * SAMPLE_RATE), 1)
+        self._chunk = self._audio_out.write_size
+        if self._chunk is None:
+            self._chunk = max(int(block_time * audio_options.get('rate', SAMPLE_RATE)), 1) * \
+                audio_options.get('channels', 1) * 2
+        # Serializes the writes and the flush on cancel
+        self._write_lock = threading.Lock()
+        # Counts the flushes, which abort the frame being written
+        self._flushes = 0
+        # Guards the sources and the frames written but not played yet
+        self._condition = threading.Condition()
+        self._sources = collections.OrderedDict()
+        self._gains = {}
+        self._max_queue_bytes = max_queue_bytes
+        self._queued_bytes = 0
+        self._peak_bytes = 0
+        # (seconds written at the end of the frame, duration, playback)
+        self._unplayed = collections.deque()
         self._thread = threading.Thread(target=self._write)
-        self._thread.setDaemon(True)
+        self._thread.daemon = True
         self._finish = False
         self._thread.start()
 
@@ -215,30 +867,630 @@ class VoiceTextSpeaker(object):
         return self
 
     def __exit__(self, *args):
-        self._finish = True
-        self._queue.put((None, None))
+        with self._condition:
+            self._finish = True
+            self._condition.notify_all()
         self._thread.join()
         self._audio_out.__exit__()
         return True
 
-    def speak(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1):
+    @property
+    def realtime(self):
+        u"""Whether the audio is written as fast as it is played"""
+        return self._audio_out.realtime
+
+    @property
+    def buffer_time(self):
+        u"""Seconds of audio the output buffers ahead of the playback"""
+        return self._audio_out.buffer_time
+
+    @property
+    def gain(self):
+        return self._processor.gain
+
+    @gain.setter
+    def gain(self, gain):
+        u"""Change the gain from the next frame, without synthesis"""
+        self._processor.gain = gain
+
+    @property
+    def queued(self):
+        u"""Number of frames waiting to be mixed"""
+        with self._condition:
+            return sum(len(source.frames) for source in self._sources.values())
+
+    @property
+    def stats(self):
+        u"""Depth of the queue in frames and bytes, and the peak of the bytes"""
+        with self._condition:
+            return {'frames': sum(len(source.frames) for source in self._sources.values()),
+                    'bytes': self._queued_bytes,
+                    'peak_bytes': self._peak_bytes,
+                    'max_bytes': self._max_queue_bytes or 0}
+
+    def set_gain(self, source, gain):
+        u"""Change the gain of a source, a FramePool or a source key, from the next block"""
+        with self._condition:
+            self._gains[source] = gain
+            if source in self._sources:
+                self._sources[source].gain = gain
+
+    def put(self, buf, duration, playback=None, pool=None, source=None):
+        key = pool if source is None else source
+        with self._condition:
+            queued = self._sources.get(key)
+            if queued is None:
+                queued = self._sources[key] = _Source(self._gains.get(key, 1.0))
+            fade_in = playback is not None and playback is not queued.playback
+            queued.playback = playback
+            queued.frames.append([buf, duration, playback, pool, fade_in])
+            size = memoryview(buf).nbytes
+            queued.size += size
+            self._queued_bytes += size
+            self._peak_bytes = max(self._peak_bytes, self._queued_bytes)
+            self._condition.notify_all()
+
+    @property
+    def max_queue_bytes(self):
+        return self._max_queue_bytes
+
+    def has_space(self, source):
+        u"""Whether a frame of source can be put without waiting, see wait_for_space"""
+        if not self._max_queue_bytes:
+            return True
+        with self._condition:
+            return self._has_space(source)
+
+    def wait_for_space(self, source, playback=None):
+        u"""Block while max_queue_bytes of the frames of source wait to be mixed
+
+        Returns as soon as frames are mixed, playback is canceled or the
+        player is closed.  source is the FramePool or the key given to put.
+        """
+        if not self._max_queue_bytes:
+            return
+        with self._condition:
+            while not self._finish and (playback is None or not playback.canceled):
+                if self._has_space(source):
+                    return
+                self._condition.wait()
+
+    def _has_space(self, source):
+        queued = self._sources.get(source)
+        return queued is None or queued.size < self._max_queue_bytes
+
+    def play(self, pcm, source=EARCON, on_event=None):
+        u"""Mix 16kHz mono S16LE pcm, e.g. an earcon, with the other sources
+
+        Returns a Playback, which cancel(playback=) stops.
+        """
+        playback = Playback(on_event)
+        playback.duration = len(pcm) / 32000.0
+        self.put(pcm, playback.duration, playback, source=source)
+        playback.finish_synthesis()
+        return playback
+
+    def cancel(self, pool=None, playback=None):
+        u"""Discard the frames of pool and of playback, or all frames if both are None
+
+        The audio buffered by the output is flushed too, unless only a
+        playback which is not being played is canceled, or other sources
+        are still played.
+        """
+        faded = []
+        playing = (playback is None
+                   or (playback.started.is_set() and not playback.drained.is_set()))
+        with self._condition:
+            for key, source in list(self._sources.items()):
+                kept = collections.deque()
+                removed = []
+                for item in source.frames:
+                    _, _, owned, owner, _ = item
+                    if ((pool is not None and owner is not pool)
+                            or (playback is not None and owned is not playback)):
+                        kept.append(item)
+                    else:
+                        removed.append(item)
+                if not removed:
+                    continue
+                if removed[0] is source.frames[0]:
+                    faded.append((key, self._fade_out(removed, source.offset)))
+                    source.offset = 0
+                source.frames = kept
+                if not kept:
+                    del self._sources[key]
+                for buf, _, owned, owner, _ in removed:
+                    self._dequeued(source, buf)
+                    if owner is not None:
+                        owner.release(buf)
+                    if owned is not None:
+                        owned.cancel()
+            if playback is not None:
+                playback.cancel()
+            # Wake up the producers of the canceled frames
+            self._condition.notify_all()
+            others = bool(self._sources) or any(
+                not owned.canceled for _, _, owned in self._unplayed)
+            if others:
+                # The output goes on, ramp out the canceled source instead of a flush
+                for key, frame in faded:
+                    if frame is not None:
+                        self.put(frame, len(frame) / 32000.0, source=key)
+                return
+        if not playing:
+            return
+        # Silence what PulseAudio has buffered, after the chunk being written
+        self._flushes += 1
+        with self._write_lock:
+            unplayed = self._audio_out.latency() if self._processor.fades else None
+            self._audio_out.flush()
+            tail = self._processor.fade_out(unplayed)
+            if tail is not None:
+                self._audio_out.write(tail)
+
+    def _fade_out(self, frames, offset):
+        u"""Return the next fade_time of frames from offset ramped down, None without fade"""
+        if not self._fade:
+            return None
+        pcm = bytearray()
+        for buf, _, _, _, _ in frames:
+            view = memoryview(buf).cast('B')[offset:]
+            pcm += view[:self._fade * 2 - len(pcm)]
+            offset = 0
+            if len(pcm) >= self._fade * 2:
+                break
+        samples = numpy.frombuffer(pcm, numpy.int16)
+        if not len(samples):
+            return None
+        ramp = numpy.linspace(1.0, 0.0, len(samples), dtype=numpy.float32)
+        return (samples * ramp).astype(numpy.int16).tobytes()
+
+    def _dequeued(self, source, buf):
+        size = memoryview(buf).nbytes
+        source.size -= size
+        self._queued_bytes -= size
+
+    def _mix(self):
+        u"""Take the next block to write, called with the condition held
+
+        Returns the buffer, its duration, the frames which are written
+        completely with it and whether the buffer is the frame itself.
+        """
+        if len(self._sources) == 1:
+            key, source = next(iter(self._sources.items()))
+            if source.gain == 1.0 and source.offset == 0:
+                item = source.frames.popleft()
+                self._dequeued(source, item[0])
+                if not source.frames:
+                    del self._sources[key]
+                return item[0], item[1], [item], True
+        block = numpy.zeros(self._block, numpy.float32)
+        length = 0
+        written = []
+        for key, source in list(self._sources.items()):
+            position = 0
+            while source.frames and position < len(block):
+                item = source.frames[0]
+                buf, _, _, _, fade_in = item
+                start = source.offset // 2
+                samples = numpy.frombuffer(buf, numpy.int16)[start:start + len(block) - position]
+                chunk = samples.astype(numpy.float32)
+                chunk *= source.gain
+                if fade_in and start < self._fade:
+                    ramp = numpy.linspace(0.0, 1.0, self._fade, endpoint=False, dtype=numpy.float32)
+                    count = min(len(chunk), self._fade - start)
+                    chunk[:count] *= ramp[start:start + count]
+                block[position:position + len(chunk)] += chunk
+                position += len(chunk)
+                source.offset += len(chunk) * 2
+                if source.offset >= len(memoryview(buf).cast('B')):
+                    source.frames.popleft()
+                    self._dequeued(source, buf)
+                    source.offset = 0
+                    written.append(item)
+            length = max(length, position)
+            if not source.frames:
+                del self._sources[key]
+        block = numpy.clip(block[:length], -32768, 32767).astype(numpy.int16)
+        return block, length / float(SAMPLE_RATE), written, False
+
+    def _write(self):
+        written = 0.0
+        while True:
+            timeout = None
+            with self._condition:
+                unplayed = bool(self._unplayed)
+            if unplayed:
+                latency = self._audio_out.latency()
+                if latency is None and not self._sources:
+                    # The position is unknown, wait until everything is played
+                    self._audio_out.drain()
+                    latency = 0.0
+                if latency is not None:
+                    played = written - latency
+                    finished = []
+                    with self._condition:
+                        while self._unplayed and self._unplayed[0][0] <= played:
+                            finished.append(self._unplayed.popleft())
+                        if self._unplayed:
+                            timeout = max(self._unplayed[0][0] - played, 0.001)
+                    # Outside of the condition, the events may cancel playbacks
+                    for _, duration, playback in finished:
+                        playback.frame_played(duration)
+            with self._condition:
+                if not self._sources and not self._finish:
+                    self._condition.wait(timeout)
+                if self._finish:
+                    break
+                if not self._sources:
+                    continue
+                buf, duration, frames, single = self._mix()
+                if self._max_queue_bytes:
+                    self._condition.notify_all()
+            flushes = self._flushes
+            pcm = None
+            size = 0
+            while True:
+                with self._write_lock:
+                    # Stop at a frame canceled or flushed while waiting for the lock
+                    canceled = (self._flushes != flushes or
+                                (single and frames[0][2] is not None and frames[0][2].canceled))
+                    if canceled:
+                        break
+                    if pcm is None:
+                        pcm = memoryview(
+                            self._processor.process(buf, single and frames[0][4])).cast('B')
+                        total = len(pcm)
+                    chunk = pcm[size:size + self._chunk]
+                    self._audio_out.write(chunk)
+                    size += len(chunk)
+                    if size >= total:
+                        break
+            if not canceled:
+                for _, _, playback, _, _ in frames:
+                    if playback is not None and playback.trace is not None:
+                        playback.trace.written()
+            del pcm
+            for frame, _, _, pool, _ in frames:
+                if pool is not None:
+                    pool.release(frame)
+            if canceled:
+                if size:
+                    # Until the flush
+                    written += duration * size / total
+                continue
+            written += duration
+            with self._condition:
+                for _, frame_duration, playback, _, _ in frames:
+                    if playback is not None and not playback.canceled:
+                        self._unplayed.append((written, frame_duration, playback))
+
+
+class Synthesis(list):
+    u"""Frames returned by VoiceTextSpeaker.synthesize
+
+    sentences are those left beyond max_bytes, which VoiceTextSpeaker.play
+    streams after the frames with prosody.
+    """
+
+    def __init__(self, frames=(), sentences=(), prosody=None):
+        super(Synthesis, self).__init__(frames)
+        self.sentences = list(sentences)
+        self.prosody = Prosody() if prosody is None else prosody
+
+
+class VoiceTextSpeaker(object):
+    u"""Speaks with a VoiceText
+
+    The speaker plays on its own AudioPlayer, created with audio_options,
+    unless a shared player is given.  With isolated, VoiceText runs in a
+    worker process, see VoiceTextProcess.  The synthesis pauses while
+    max_queue_bytes of frames wait in the player, see
+    AudioPlayer.wait_for_space, so that the memory does not depend on the
+    length of the text but on max_queue_bytes and on the longest sentence,
+    see split_sentences.  The pause happens between sentences, as a
+    VoiceText channel is held during a sentence.
+    """
+
+    def __init__(self, path='/opt/tmc/vt', voice='haruka', iotype='RAMIO',
+                 cache=None, audio_options=None, channels=2, player=None,
+                 isolated=False, max_queue_bytes=None):
+        if isolated:
+            from tmc_talk_hoya_py.worker import VoiceTextProcess
+            self._vt_lib = VoiceTextProcess(path, voice=voice, iotype=iotype)
+        else:
+            self._vt_lib = VoiceText(path, voice=voice, iotype=iotype)
+        self._channels = VoiceTextChannelPool(self._vt_lib, channels)
+        self._cache = cache
+        self._pool = FramePool(self._vt_lib.frame_size)
+        self._owns_player = player is None
+        if player is None:
+            player = AudioPlayer(audio_options, max_queue_bytes=max_queue_bytes)
+        self._player = player
+        self._gain = 1.0
+        self._stream_lock = threading.Lock()
+        self._streaming = None
+        self._jobs = Queue.Queue()
+        self._stream_thread = threading.Thread(target=self._synthesize_stream)
+        self._stream_thread.daemon = True
+        self._stream_thread.start()
+        # Runs synthesize_async off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=channels)
+
+    def __enter__(self):
+        if self._owns_player:
+            self._player.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        self.cancel()
+        self._jobs.put((None, None))
+        self._stream_thread.join()
+        self._executor.shutdown(wait=False)
+        if self._owns_player:
+            self._player.__exit__()
+        if hasattr(self._vt_lib, 'close'):
+            self._vt_lib.close()
+        return True
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def gain(self):
+        return self._gain
+
+    @gain.setter
+    def gain(self, gain):
+        u"""Gain of the speaker in the mixer of its player, from the next block"""
+        self._gain = gain
+        self._player.set_gain(self._pool, gain)
+
+    @property
+    def voice_text(self):
+        return self._vt_lib
+
+    def speak(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1, trace=None):
         total = 0.0
-        for buf, duration in self._vt_lib.to_buffer(msg,
-                                                    pitch=pitch,
-                                                    speed=speed,
-                                                    volume=volume,
-                                                    pause=pause):
-            self._queue.put((copy.deepcopy(buf), duration), False)
+        for frame in self._synthesize_sentences(split_sentences(msg), pitch, speed, volume,
+                                                pause, self._pool, trace, hold=True):
+            duration = len(frame) / 32000.0
+            self._player.wait_for_space(self._pool)
+            self._player.put(frame, duration, pool=self._pool)
             total = total + duration
         return total
 
-    def cancel(self):
-        while not self._queue.empty():
-            self._queue.get(False)
+    def speak_stream(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1,
+                     on_event=None, trace=None):
+        u"""Speak msg without waiting for the synthesis
 
-    def _write(self):
+        The synthesis runs on a dedicated thread and every frame is queued for
+        playback as soon as it is synthesized. Returns a Playback.
+        """
+        playback = Playback(on_event, trace)
+        self._jobs.put((playback, ([], split_sentences(msg), Prosody(pitch, speed, volume, pause))))
+        return playback
+
+    def speak_events(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1, trace=None):
+        u"""Speak msg from a coroutine and return a PlaybackEvents
+
+        The synthesis and the writes run on the threads of the speaker and
+        of its player, so the event loop is never blocked.
+        """
+        events = PlaybackEvents(self, asyncio.get_running_loop())
+        events.playback = self.speak_stream(msg, pitch, speed, volume, pause,
+                                            on_event=events.on_event, trace=trace)
+        return events
+
+    async def speak_async(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1,
+                          trace=None):
+        u"""Speak msg and return the Playback once it is drained or canceled
+
+        Raises the error of the synthesis, if any.  Cancelling the task
+        cancels the playback.
+        """
+        events = self.speak_events(msg, pitch, speed, volume, pause, trace)
+        async for _ in events:
+            pass
+        if events.playback.error is not None:
+            raise events.playback.error
+        return events.playback
+
+    async def synthesize_async(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1,
+                               trace=None):
+        u"""synthesize on an executor of the speaker"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.synthesize, msg, pitch, speed, volume, pause, trace)
+
+    def synthesize(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1, trace=None,
+                   max_bytes=None):
+        u"""Synthesize msg without playing it and return a Synthesis, the list of frames
+
+        With max_bytes, the synthesis stops after the sentence which reaches
+        max_bytes and the other sentences are left to play, so that the
+        frames synthesized in advance do not depend on the length of msg.
+        """
+        sentences = split_sentences(msg)
+        synthesis = Synthesis(prosody=Prosody(pitch, speed, volume, pause))
+        size = 0
+        for index, sentence in enumerate(sentences):
+            if max_bytes is not None and size >= max_bytes:
+                synthesis.sentences = sentences[index:]
+                break
+            for frame in self._synthesize_sentences([sentence], pitch, speed, volume, pause,
+                                                    trace=trace):
+                synthesis.append(frame)
+                size += len(frame)
+        return synthesis
+
+    def play(self, frames, on_event=None, trace=None):
+        u"""Play frames returned by synthesize and return a Playback
+
+        The frames are queued by the synthesis thread as the player has space
+        for them, followed by the sentences left by synthesize.
+        """
+        playback = Playback(on_event, trace)
+        if isinstance(frames, Synthesis):
+            job = (list(frames), frames.sentences, frames.prosody)
+        else:
+            job = (list(frames), [], Prosody())
+        self._jobs.put((playback, job))
+        return playback
+
+    def cancel(self, playback=None):
+        u"""Cancel playback, or all utterances of the speaker if it is None"""
+        with self._stream_lock:
+            if playback is not None:
+                if playback is not self._streaming:
+                    # Skipped by the synthesis thread if it is still queued
+                    playback.synthesized.set()
+                self._player.cancel(self._pool, playback)
+                return
+            while not self._jobs.empty():
+                playback, _ = self._jobs.get(False)
+                if playback is None:
+                    # Keep the request to finish the synthesis thread
+                    self._jobs.put((None, None))
+                    break
+                playback.cancel()
+                playback.synthesized.set()
+            if self._streaming is not None:
+                self._streaming.cancel()
+            self._player.cancel(self._pool)
+
+    def _queue_frame(self, playback, frame):
+        with self._stream_lock:
+            if playback.canceled:
+                return False
+            duration = len(frame) / 32000.0
+            self._player.put(frame, duration, playback, self._pool)
+            playback.duration += duration
+        playback.first_frame.set()
+        return True
+
+    def _synthesize_stream(self):
         while True:
-            buf, duration = self._queue.get(True)
-            if self._finish:
+            playback, args = self._jobs.get(True)
+            if playback is None:
                 break
-            self._audio_out.write(buf)
+            with self._stream_lock:
+                if playback.canceled:
+                    continue
+                self._streaming = playback
+            try:
+                self._stream(playback, *args)
+            except Exception as err:
+                playback.error = err
+            finally:
+                with self._stream_lock:
+                    self._streaming = None
+                playback.finish_synthesis()
+
+    def _stream(self, playback, frames, sentences, prosody):
+        synthesized = self._synthesize_sentences(sentences, *prosody, pool=self._pool,
+                                                 trace=playback.trace, playback=playback,
+                                                 hold=True)
+        for frame in itertools.chain(frames, synthesized):
+            # Outside of the stream lock, which cancel takes
+            self._player.wait_for_space(self._pool, playback)
+            if not self._queue_frame(playback, frame):
+                self._pool.release(frame)
+                return
+
+    def _synthesize_sentences(self, sentences, pitch, speed, volume, pause, pool=None,
+                              trace=None, playback=None, hold=False):
+        u"""Yield the frames of sentences one by one
+
+        Every sentence is encoded once and cached on its own.  The frames are
+        played while the next sentence is synthesized, so that the first sound
+        does not depend on the length of the text.  Without pool, the frames
+        are copied to bytes.
+
+        With hold, the frames synthesized while the queue of the speaker in
+        the player is full are held as bytes until the end of the sentence,
+        so that the caller waits for space once the VoiceText channel is
+        released.  The synthesis stops once playback is canceled.
+        """
+        for sentence in sentences:
+            if playback is not None and playback.canceled:
+                return
+            key = self._cache_key(sentence, pitch, speed, volume, pause)
+            if key is not None:
+                pcm = self._cache.get(key)
+                if pcm is not None:
+                    if trace is not None:
+                        trace.mark(Trace.ENCODED)
+                        trace.mark(Trace.SYNTHESIZED)
+                    for frame in self._split(pcm):
+                        yield frame
+                    continue
+            pcm = bytearray()
+            held = []
+            with self._channels.channel() as thread_id:
+                for buf, _ in self._vt_lib.to_buffer(sentence,
+                                                     pitch=pitch,
+                                                     speed=speed,
+                                                     volume=volume,
+                                                     pause=pause,
+                                                     pool=pool,
+                                                     thread_id=thread_id,
+                                                     trace=trace):
+                    if pool is None:
+                        buf = bytes(buf)
+                    if key is not None:
+                        pcm += buf
+                    if hold and (held or not self._player.has_space(self._pool)):
+                        held.append(bytes(buf))
+                        if pool is not None:
+                            pool.release(buf)
+                        if playback is not None and playback.canceled:
+                            return
+                    else:
+                        yield buf
+            if key is not None and pcm:
+                self._cache.put(key, pcm)
+            for frame in held:
+                yield frame
+
+    def pin(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1):
+        u"""Synthesize msg and pin it in the cache, return its duration in seconds
+
+        The sentences are pinned one by one, as they are looked up by speak.
+        Those pinned already are not synthesized again.
+        """
+        if self._cache is None:
+            raise VoiceTextRuntimeError("A cache is required to pin phrases")
+        size = 0
+        for sentence in split_sentences(msg):
+            key = self._cache_key(sentence, pitch, speed, volume, pause)
+            pcm = self._cache.get(key) if self._cache.is_pinned(key) else None
+            if pcm is None:
+                pcm = self._channels.synthesize(sentence, pitch, speed, volume, pause)
+                self._cache.pin(key, pcm)
+            size += len(pcm)
+        return size / 32000.0
+
+    def unpin(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1):
+        u"""Evict the sentences of msg pinned by pin, return whether any was pinned"""
+        if self._cache is None:
+            return False
+        unpinned = False
+        for sentence in split_sentences(msg):
+            key = self._cache_key(sentence, pitch, speed, volume, pause)
+            unpinned = self._cache.unpin(key) or unpinned
+        return unpinned
+
+    def _cache_key(self, msg, pitch, speed, volume, pause):
+        if self._cache is None:
+            return None
+        return VoiceTextCache.make_key(
+            self._vt_lib.voice, self._vt_lib.language, msg,
+            pitch, speed, volume, pause)
+
+    def _split(self, pcm):
+        u"""Split cached PCM into frames of the same size as to_buffer"""
+        view = memoryview(pcm)
+        frame_size = self._vt_lib.frame_size or len(view)
+        return [view[offset:offset + frame_size]
+                for offset in range(0, len(view), frame_size)]
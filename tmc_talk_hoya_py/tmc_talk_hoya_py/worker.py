@@ -0,0 +1,368 @@
+'''
+Copyright (c) 2024 TOYOTA MOTOR CORPORATION
+All rights reserved.
+Redistribution and use in source and binary forms, with or without
+modification, are permitted (subject to the limitations in the disclaimer
+below) provided that the following conditions are met:
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the copyright holder nor the names of its contributors may be used
+  to endorse or promote products derived from this software without specific
+  prior written permission.
+NO EXPRESS OR IMPLIED LICENSES TO ANY PARTY'S PATENT RIGHTS ARE GRANTED BY THIS
+LICENSE. THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+DAMAGE.
+'''
+# -*- coding: utf-8 -*-
+u"""VoiceText in a child process
+
+VoiceTextProcess has the synthesis interface of VoiceText, but libvt runs
+in a worker process, so that a long VT_TextToBuffer does not hold the
+interpreter of the node and a crash of the library does not take the node
+down.  libvt synthesizes straight into the slots of a ring buffer in shared
+memory, which the parent copies into the buffers of its FramePool; the PCM
+is never pickled.  Requests and cancels go through a pipe.  The worker is
+restarted if it dies, and the requests in progress fail with a
+VoiceTextRuntimeError.
+"""
+import collections
+import ctypes
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+import queue as Queue
+import struct
+import threading
+
+from tmc_talk_hoya_py import codec
+from tmc_talk_hoya_py.metrics import Trace
+from tmc_talk_hoya_py.voicetext import (
+    VoiceText,
+    VoiceTextRuntimeError
+)
+
+# request ID, status and length of the data of a slot
+_HEADER = struct.Struct('<iii')
+_SLOT_HEADER_SIZE = 16
+_FRAME = 0
+_END = 1
+_ERROR = 2
+
+
+class _RingWriter(object):
+    u"""Slots of the ring buffer, handed to VoiceText.to_buffer as its pool"""
+
+    def __init__(self, shm, slots, frame_size, spaces, items):
+        self._shm = shm
+        self._slot_size = _SLOT_HEADER_SIZE + frame_size
+        self._arrays = [
+            (ctypes.c_byte * frame_size).from_buffer(
+                shm.buf, index * self._slot_size + _SLOT_HEADER_SIZE)
+            for index in range(slots)]
+        self._spaces = spaces
+        self._items = items
+        self._index = 0
+        self._held = False
+
+    def acquire(self):
+        if not self._held:
+            self._spaces.acquire()
+            self._held = True
+        return self._arrays[self._index]
+
+    def release_buffer(self, buf):
+        # The slot is kept for the next acquire
+        pass
+
+    def commit(self, request_id, status, data=b''):
+        buf = self.acquire()
+        if status != _FRAME:
+            ctypes.memmove(buf, data, len(data))
+        _HEADER.pack_into(self._shm.buf, self._index * self._slot_size,
+                          request_id, status, len(data))
+        self._held = False
+        self._index = (self._index + 1) % len(self._arrays)
+        self._items.release()
+
+
+def _serve(factory, path, voice, iotype, conn, spaces, items, slots):
+    u"""Main of the worker process"""
+    try:
+        vt = factory(path, voice=voice, iotype=iotype)
+    except Exception as err:
+        conn.send(('error', str(err)))
+        return
+    conn.send(('ready', vt.frame_size, vt.language))
+    _, name = conn.recv()
+    shm = shared_memory.SharedMemory(name=name)
+    ring = _RingWriter(shm, slots, vt.frame_size, spaces, items)
+    pending = collections.deque()
+    canceled = set()
+
+    def receive():
+        message = conn.recv()
+        if message[0] == 'synthesize':
+            pending.append(message[1:])
+        elif message[0] == 'cancel':
+            canceled.add(message[1])
+        return message[0] != 'stop'
+
+    running = True
+    while running:
+        if not pending:
+            running = receive()
+            continue
+        request_id, msg, pitch, speed, volume, pause = pending.popleft()
+        try:
+            for frame, _ in vt.to_buffer(msg, pitch=pitch, speed=speed, volume=volume,
+                                         pause=pause, pool=ring):
+                while running and conn.poll():
+                    running = receive()
+                if not running or request_id in canceled:
+                    break
+                ring.commit(request_id, _FRAME, frame)
+        except Exception as err:
+            ring.commit(request_id, _ERROR, str(err).encode('utf-8')[:vt.frame_size])
+        else:
+            ring.commit(request_id, _END)
+        canceled.discard(request_id)
+
+
+class _Request(object):
+    def __init__(self, pool):
+        self.pool = pool
+        self.frames = Queue.Queue()
+
+
+class VoiceTextProcess(object):
+    u"""VoiceText running in a worker process
+
+    factory(path, voice=, iotype=) creates the VoiceText in the worker, it
+    has to be picklable.  slots is the number of frames of the ring buffer.
+    The requests are synthesized one after the other by the worker, the
+    thread_id of to_buffer is ignored.
+    """
+
+    def __init__(self, path='/opt/tmc/vt', voice='haruka', iotype='RAMIO',
+                 slots=8, factory=VoiceText, restart=True):
+        self._args = (factory, path, voice, iotype)
+        self._voice = voice
+        self._slots = slots
+        self._restart = restart
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._ids = itertools.count()
+        self._closing = False
+        self._shm = None
+        self.restarts = 0
+        self._start()
+        self._reader = threading.Thread(target=self._read)
+        self._reader.daemon = True
+        self._reader.start()
+
+    @property
+    def voice(self):
+        return self._voice
+
+    @property
+    def language(self):
+        return self._language
+
+    @property
+    def frame_size(self):
+        u"""Maximum size in bytes of a frame returned by to_buffer"""
+        return self._frame_size
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+    def encode_message(self, msg):
+        if self._language == 'jpn':
+            return msg.encode('cp932')
+        else:
+            return msg.encode('cp1252')
+
+    def to_buffer(self, msg, pitch=-1, speed=-1, volume=-1, pause=-1,
+                  pool=None, thread_id=0, trace=None,
+                  encoding=codec.ENCODING_S16LE):
+        u"""Synthesize msg in the worker and yield (frame, duration) for each frame
+
+        Same as VoiceText.to_buffer, except that a frame without pool is a
+        bytes object.
+        """
+        # Raise UnicodeEncodeError here rather than in the worker
+        self.encode_message(msg)
+        if trace is not None:
+            trace.mark(Trace.ENCODED)
+        encoder = None
+        if encoding != codec.ENCODING_S16LE:
+            encoder = codec.Encoder(encoding)
+        request = _Request(pool)
+        with self._lock:
+            if self._closing:
+                raise VoiceTextRuntimeError("The synthesis worker is closed")
+            request_id = next(self._ids) & 0x7FFFFFFF
+            try:
+                self._conn.send(('synthesize', request_id, msg, pitch, speed, volume, pause))
+            except OSError:
+                raise VoiceTextRuntimeError("The synthesis worker is not running")
+            self._requests[request_id] = request
+        finished = False
+        try:
+            while True:
+                item = request.frames.get()
+                if item is None:
+                    finished = True
+                    if encoder is not None:
+                        data = encoder.flush()
+                        if data:
+                            yield data, 0.0
+                    break
+                if isinstance(item, Exception):
+                    finished = True
+                    raise item
+                buf, length = item
+                if trace is not None:
+                    trace.mark(Trace.SYNTHESIZED)
+                frame = buf if pool is None else memoryview(buf)[:length]
+                if encoder is not None:
+                    data = encoder.encode(frame)
+                    if pool is not None:
+                        pool.release_buffer(buf)
+                    yield data, length / 32000.0
+                else:
+                    yield frame, length / 32000.0
+        finally:
+            with self._lock:
+                self._requests.pop(request_id, None)
+                if not finished and not self._closing:
+                    try:
+                        self._conn.send(('cancel', request_id))
+                    except OSError:
+                        # Restarted by the reader thread
+                        pass
+            # Give back the frames which were not taken
+            while not request.frames.empty():
+                item = request.frames.get(False)
+                if pool is not None and isinstance(item, tuple):
+                    pool.release_buffer(item[0])
+
+    def close(self):
+        with self._lock:
+            self._closing = True
+            try:
+                self._conn.send(('stop',))
+            except OSError:
+                pass
+        self._reader.join()
+        self._stop_process()
+        self._release_shm()
+
+    def _start(self):
+        parent, child = self._context.Pipe()
+        self._spaces = self._context.Semaphore(self._slots)
+        self._items = self._context.Semaphore(0)
+        self._process = self._context.Process(
+            target=_serve, args=self._args + (child, self._spaces, self._items, self._slots))
+        self._process.daemon = True
+        self._process.start()
+        child.close()
+        try:
+            message = parent.recv()
+        except EOFError:
+            self._process.join()
+            message = ('error', 'The synthesis worker exited with code {0}'.format(
+                self._process.exitcode))
+        if message[0] == 'error':
+            self._process.join()
+            raise VoiceTextRuntimeError(message[1])
+        _, self._frame_size, self._language = message
+        self._slot_size = _SLOT_HEADER_SIZE + self._frame_size
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=self._slots * self._slot_size)
+        parent.send(('attach', self._shm.name))
+        self._conn = parent
+        self._index = 0
+
+    def _read(self):
+        while True:
+            if not self._items.acquire(timeout=0.1):
+                if self._closing:
+                    return
+                if not self._process.is_alive():
+                    if not self._recover():
+                        return
+                continue
+            offset = self._index * self._slot_size
+            request_id, status, length = _HEADER.unpack_from(self._shm.buf, offset)
+            start = offset + _SLOT_HEADER_SIZE
+            with self._lock:
+                request = self._requests.get(request_id)
+            if request is not None:
+                if status == _FRAME:
+                    request.frames.put(self._copy(request.pool, start, length))
+                elif status == _ERROR:
+                    request.frames.put(VoiceTextRuntimeError(
+                        bytes(self._shm.buf[start:start + length]).decode('utf-8', 'replace')))
+                else:
+                    request.frames.put(None)
+            self._index = (self._index + 1) % self._slots
+            self._spaces.release()
+
+    def _copy(self, pool, start, length):
+        data = self._shm.buf[start:start + length]
+        if pool is None:
+            return bytes(data), length
+        buf = pool.acquire()
+        memoryview(buf).cast('B')[:length] = data
+        return buf, length
+
+    def _recover(self):
+        u"""Fail the requests in progress and restart the worker, return whether it runs"""
+        exitcode = self._process.exitcode
+        error = VoiceTextRuntimeError(
+            'The synthesis worker exited with code {0}'.format(exitcode))
+        with self._lock:
+            for request in self._requests.values():
+                request.frames.put(error)
+            self._requests.clear()
+            if self._closing or not self._restart:
+                self._closing = True
+                return False
+            try:
+                self._start()
+            except VoiceTextRuntimeError:
+                self._closing = True
+                return False
+            self.restarts += 1
+        return True
+
+    def _stop_process(self):
+        self._process.join(1.0)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+
+    def _release_shm(self):
+        if self._shm is None:
+            return
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
+        self._shm.unlink()
+        self._shm = None